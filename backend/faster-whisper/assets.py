@@ -0,0 +1,203 @@
+"""Upload-once store for media shared by all the endpoints.
+
+A video is uploaded once to `/assets` and then referenced by its asset ID. The store keeps
+the media, its decoded audio and its transcripts in one directory per asset. Assets expire
+after a TTL without access, and the least recently used ones are evicted when the disk
+quota is exceeded. Assets used by an in-flight request are never evicted.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+from fastapi import UploadFile
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class Asset:
+    asset_id: str
+    directory: str
+    filename: str
+    suffix: str
+    size: int
+    created: float
+    last_access: float
+
+    @property
+    def media_path(self) -> str:
+        return os.path.join(self.directory, "media" + self.suffix)
+
+    @property
+    def audio_path(self) -> str:
+        """Decoded 16 kHz float32 audio, written the first time the asset is transcribed."""
+        return os.path.join(self.directory, "audio.npy")
+
+    def transcript_path(self, key: str) -> str:
+        return os.path.join(self.directory, "transcript-%s.pkl" % key)
+
+    def disk_usage(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory))
+
+
+def _copy_and_hash(source, destination: str) -> str:
+    digest = hashlib.sha256()
+    with open(destination, "wb") as output:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            output.write(chunk)
+    return digest.hexdigest()
+
+
+class AssetStore:
+    def __init__(self, root: str, ttl: float = 3600, max_disk_bytes: int = 10 << 30):
+        """Creates the store and reloads the assets left by a previous run.
+
+        Args:
+          root: Directory holding one subdirectory per asset.
+          ttl: Seconds without access after which an asset expires.
+          max_disk_bytes: Disk quota for all the assets.
+        """
+        self.root = root
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self._assets: Dict[str, Asset] = {}
+        self._leases: Dict[str, int] = {}
+
+        os.makedirs(root, exist_ok=True)
+        for entry in os.scandir(root):
+            meta_path = os.path.join(entry.path, "meta.json")
+            if entry.is_dir() and os.path.isfile(meta_path):
+                with open(meta_path, encoding="utf-8") as meta_file:
+                    asset = Asset(directory=entry.path, **json.load(meta_file))
+                self._assets[asset.asset_id] = asset
+
+    async def add(self, upload: UploadFile) -> Asset:
+        """Stores an upload. Uploading the same content again returns the same asset."""
+        suffix = os.path.splitext(upload.filename or "")[1].lower() or ".mp4"
+
+        with tempfile.NamedTemporaryFile(dir=self.root, delete=False) as tmp:
+            tmp_path = tmp.name
+
+        try:
+            await upload.seek(0)
+            asset_id = await asyncio.to_thread(_copy_and_hash, upload.file, tmp_path)
+
+            asset = self._assets.get(asset_id)
+            if asset is None:
+                now = time.time()
+                asset = Asset(
+                    asset_id=asset_id,
+                    directory=os.path.join(self.root, asset_id),
+                    filename=upload.filename or "",
+                    suffix=suffix,
+                    size=os.path.getsize(tmp_path),
+                    created=now,
+                    last_access=now,
+                )
+                os.makedirs(asset.directory, exist_ok=True)
+                os.replace(tmp_path, asset.media_path)
+                self._assets[asset_id] = asset
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        self._touch(asset)
+        self.evict(keep=asset_id)
+        return asset
+
+    def get(self, asset_id: str) -> Optional[Asset]:
+        asset = self._assets.get(asset_id)
+        if asset is None:
+            return None
+        if self._is_expired(asset) and not self._leases.get(asset_id):
+            self._remove(asset)
+            return None
+        self._touch(asset)
+        return asset
+
+    @contextlib.contextmanager
+    def lease(self, asset_id: str):
+        """Protects an asset from eviction while a request is using it.
+
+        Raises:
+          KeyError: if the asset does not exist or expired.
+        """
+        asset = self.get(asset_id)
+        if asset is None:
+            raise KeyError(asset_id)
+
+        self._leases[asset_id] = self._leases.get(asset_id, 0) + 1
+        try:
+            yield asset
+        finally:
+            self._leases[asset_id] -= 1
+            if not self._leases[asset_id]:
+                del self._leases[asset_id]
+            self._touch(asset)
+
+    def delete(self, asset_id: str) -> bool:
+        asset = self._assets.get(asset_id)
+        if asset is None or self._leases.get(asset_id):
+            return False
+        self._remove(asset)
+        return True
+
+    def load_transcript(self, asset: Asset, key: str):
+        try:
+            with open(asset.transcript_path(key), "rb") as transcript_file:
+                return pickle.load(transcript_file)
+        except FileNotFoundError:
+            return None
+
+    def save_transcript(self, asset: Asset, key: str, result):
+        path = asset.transcript_path(key)
+        with tempfile.NamedTemporaryFile(dir=asset.directory, delete=False) as tmp:
+            pickle.dump(result, tmp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp.name, path)
+
+    def evict(self, keep: Optional[str] = None):
+        """Removes the expired assets, then the least recently used ones over quota."""
+        candidates = sorted(self._assets.values(), key=lambda asset: asset.last_access)
+        usage = {asset.asset_id: asset.disk_usage() for asset in candidates}
+        total_bytes = sum(usage.values())
+
+        for asset in candidates:
+            if asset.asset_id == keep or self._leases.get(asset.asset_id):
+                continue
+            if self._is_expired(asset) or total_bytes > self.max_disk_bytes:
+                self._remove(asset)
+                total_bytes -= usage[asset.asset_id]
+
+    def stats(self) -> dict:
+        return {
+            "assets": len(self._assets),
+            "leased": len(self._leases),
+            "media_bytes": sum(asset.size for asset in self._assets.values()),
+        }
+
+    def _is_expired(self, asset: Asset) -> bool:
+        return time.time() - asset.last_access > self.ttl
+
+    def _touch(self, asset: Asset):
+        asset.last_access = time.time()
+        meta = asdict(asset)
+        meta.pop("directory")
+        with open(
+            os.path.join(asset.directory, "meta.json"), "w", encoding="utf-8"
+        ) as meta_file:
+            json.dump(meta, meta_file)
+
+    def _remove(self, asset: Asset):
+        self._assets.pop(asset.asset_id, None)
+        shutil.rmtree(asset.directory, ignore_errors=True)
@@ -0,0 +1,204 @@
+"""Continuous batching of the 30-second windows of concurrent transcriptions.
+
+`BatchedInferencePipeline` encodes and decodes the windows of one file together, so a
+short clip only fills a small batch. The `BatchScheduler` pools the windows of all the
+requests running in the pool threads: a request submitting its windows waits until the
+batch is full or until its deadline expires, then one thread runs the shared batch with
+a single `encode` and `generate` call and hands every request its own outputs back.
+"""
+
+import threading
+import time
+
+from typing import List, Optional
+
+import ctranslate2
+import numpy as np
+
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import TranscriptionOptions, get_ctranslate2_storage
+
+
+def batch_key(model: WhisperModel, tokenizer: Tokenizer, options: TranscriptionOptions):
+    """Returns what windows must share to be generated in the same batch.
+
+    These are the model, the prompt and the decoding options used by
+    `BatchedInferencePipeline.generate_segment_batched`.
+    """
+    return (
+        id(model),
+        tokenizer.language_code,
+        tokenizer.task,
+        options.initial_prompt,
+        options.without_timestamps,
+        options.hotwords,
+        options.multilingual,
+        options.max_new_tokens,
+        options.beam_size,
+        options.patience,
+        options.length_penalty,
+        options.suppress_blank,
+        tuple(options.suppress_tokens or ()),
+        options.temperatures[0],
+        options.repetition_penalty,
+        options.no_repeat_ngram_size,
+    )
+
+
+def _slice_encoder_output(
+    encoder_output: ctranslate2.StorageView, start: int, end: int
+) -> ctranslate2.StorageView:
+    device = encoder_output.device
+    if device != "cpu":
+        encoder_output = encoder_output.to_device(ctranslate2.Device.cpu)
+
+    sliced = get_ctranslate2_storage(np.asarray(encoder_output)[start:end])
+    if device != "cpu":
+        sliced = sliced.to_device(getattr(ctranslate2.Device, device))
+    return sliced
+
+
+class _WindowRequest:
+    def __init__(self, pipeline, features, tokenizer, options):
+        self.pipeline = pipeline
+        self.features = features
+        self.tokenizer = tokenizer
+        self.options = options
+        self.taken = False
+        self.done = False
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+    @property
+    def size(self) -> int:
+        return self.features.shape[0]
+
+
+class BatchScheduler:
+    def __init__(self, max_batch_size: int = 16, max_wait: float = 0.05):
+        """Creates the scheduler.
+
+        Args:
+          max_batch_size: Maximum number of windows generated together. A request with
+            more windows than this runs alone.
+          max_wait: Seconds a request waits for other requests to fill the batch before
+            the batch runs anyway.
+        """
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._groups = {}
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.windows = 0
+        self.requests = 0
+
+    def generate(
+        self,
+        pipeline: BatchedInferencePipeline,
+        features: np.ndarray,
+        tokenizer: Tokenizer,
+        options: TranscriptionOptions,
+    ):
+        """Same as `pipeline.generate_segment_batched`, sharing the batch with others.
+
+        Blocks the calling thread until the batch containing `features` was generated.
+        """
+        request = _WindowRequest(pipeline, features, tokenizer, options)
+        key = batch_key(pipeline.model, tokenizer, options)
+        deadline = time.monotonic() + self.max_wait
+
+        with self._cond:
+            self._groups.setdefault(key, []).append(request)
+            self._cond.notify_all()
+
+        while True:
+            with self._cond:
+                if request.taken:
+                    while not request.done:
+                        self._cond.wait()
+                    break
+
+                pending = self._groups[key]
+                remaining = deadline - time.monotonic()
+                if sum(r.size for r in pending) < self.max_batch_size and remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                batch = self._take(key)
+
+            # The oldest requests may fill the batch without this one, which then goes
+            # into the next batch.
+            self._run(batch)
+
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _take(self, key) -> List[_WindowRequest]:
+        # Called with the lock held. Takes the oldest requests fitting in one batch.
+        pending = self._groups[key]
+        batch, size = [], 0
+        while pending and (not batch or size + pending[0].size <= self.max_batch_size):
+            request = pending.pop(0)
+            request.taken = True
+            batch.append(request)
+            size += request.size
+
+        if not pending:
+            del self._groups[key]
+        return batch
+
+    def _run(self, batch: List[_WindowRequest]):
+        leader = batch[0]
+        try:
+            features = np.concatenate([request.features for request in batch])
+            # Calls the base implementation, the pipelines of the requests submit here.
+            encoder_output, outputs = BatchedInferencePipeline.generate_segment_batched(
+                leader.pipeline, features, leader.tokenizer, leader.options
+            )
+
+            start = 0
+            results = []
+            for request in batch:
+                end = start + request.size
+                if len(batch) == 1 or not request.options.word_timestamps:
+                    request_output = encoder_output
+                else:
+                    request_output = _slice_encoder_output(encoder_output, start, end)
+                results.append((request_output, outputs[start:end]))
+                start = end
+        except BaseException as e:
+            results, error = None, e
+        else:
+            error = None
+
+        with self._cond:
+            for i, request in enumerate(batch):
+                request.result = results[i] if results is not None else None
+                request.error = error
+                request.done = True
+            self.batches += 1
+            self.windows += sum(request.size for request in batch)
+            self.requests += len(batch)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "windows": self.windows,
+                "mean_batch_size": self.windows / self.batches if self.batches else 0,
+                "waiting": sum(len(pending) for pending in self._groups.values()),
+            }
+
+
+class ScheduledPipeline(BatchedInferencePipeline):
+    """Pipeline of one request, generating its windows through a `BatchScheduler`."""
+
+    def __init__(self, model: WhisperModel, scheduler: BatchScheduler):
+        super().__init__(model)
+        self.scheduler = scheduler
+
+    def generate_segment_batched(self, features, tokenizer, options):
+        return self.scheduler.generate(self, features, tokenizer, options)
@@ -0,0 +1,56 @@
+import argparse
+import os
+import timeit
+
+import numpy as np
+
+from faster_whisper import decode_audio
+
+parser = argparse.ArgumentParser(description="Parallel audio decoding benchmark")
+parser.add_argument(
+    "audio",
+    help="Path to a long media file. Files of less than a minute per worker are "
+    "split into fewer ranges.",
+)
+parser.add_argument(
+    "--workers",
+    type=lambda value: [int(workers) for workers in value.split(",")],
+    default=[1, 2, 4, os.cpu_count() or 1],
+    help="Comma-separated numbers of decoding processes to compare.",
+)
+parser.add_argument(
+    "--repeat",
+    type=int,
+    default=3,
+    help="Times an experiment will be run.",
+)
+args = parser.parse_args()
+
+
+if __name__ == "__main__":
+    reference = decode_audio(args.audio)
+    print(
+        "Decoding %.1f minutes of audio on %d CPUs"
+        % (reference.shape[0] / 16000 / 60, os.cpu_count() or 1)
+    )
+
+    baseline = None
+    for num_workers in sorted(set(args.workers)):
+        audio = decode_audio(args.audio, num_workers=num_workers)
+        max_difference = np.abs(audio - reference).max()
+
+        # as written in https://docs.python.org/3/library/timeit.html#timeit.Timer.repeat,
+        # min should be taken rather than the average
+        runtime = min(
+            timeit.repeat(
+                lambda: decode_audio(args.audio, num_workers=num_workers),
+                repeat=args.repeat,
+                number=1,
+            )
+        )
+        if baseline is None:
+            baseline = runtime
+        print(
+            "%2d workers: min %.3fs, speedup x%.2f, max sample difference %.1e"
+            % (num_workers, runtime, baseline / runtime, max_difference)
+        )
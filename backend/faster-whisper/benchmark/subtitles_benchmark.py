@@ -0,0 +1,70 @@
+import argparse
+import os
+import timeit
+
+from faster_whisper.subtitles import SUBTITLE_FORMATS, write_subtitles
+from faster_whisper.transcribe import Segment, Word
+
+parser = argparse.ArgumentParser(description="Subtitle writers benchmark")
+parser.add_argument(
+    "--words",
+    type=int,
+    default=100_000,
+    help="Number of words of the synthetic transcript.",
+)
+parser.add_argument(
+    "--words_per_segment",
+    type=int,
+    default=12,
+    help="Number of words of each segment.",
+)
+parser.add_argument(
+    "--repeat",
+    type=int,
+    default=3,
+    help="Times an experiment will be run.",
+)
+args = parser.parse_args()
+
+
+def generate_segments():
+    """Yields a transcript of `args.words` words of 0.3 seconds with short pauses."""
+    time = 0.0
+    for first in range(0, args.words, args.words_per_segment):
+        words = []
+        for index in range(first, min(first + args.words_per_segment, args.words)):
+            words.append(Word(time, time + 0.3, " word%d" % index, 0.9))
+            time += 0.35
+        yield Segment(
+            id=first // args.words_per_segment + 1,
+            seek=0,
+            start=words[0].start,
+            end=words[-1].end,
+            text="".join(word.word for word in words),
+            tokens=[],
+            avg_logprob=-0.2,
+            compression_ratio=1.5,
+            no_speech_prob=0.01,
+            words=words,
+            temperature=0.0,
+        )
+        time += 0.5
+
+
+def measure(name, **kwargs):
+    def write():
+        with open(os.devnull, "w", encoding="utf-8") as output:
+            write_subtitles(generate_segments(), output, **kwargs)
+
+    # as written in https://docs.python.org/3/library/timeit.html#timeit.Timer.repeat,
+    # min should be taken rather than the average
+    runtimes = timeit.repeat(write, repeat=args.repeat, number=1)
+    print("%-10s min %.3fs" % (name, min(runtimes)))
+
+
+if __name__ == "__main__":
+    print("Writing %d words" % args.words)
+    for subtitle_format in SUBTITLE_FORMATS:
+        measure(subtitle_format, format=subtitle_format)
+    for effect in ("color", "k", "kf"):
+        measure("ass-" + effect, format="ass", karaoke=effect)
@@ -0,0 +1,122 @@
+"""Responses for the rendered files.
+
+Finished files are served with HTTP Range support, so video players can seek and
+interrupted downloads resume. A file still being written by ffmpeg, a fragmented MP4, is
+streamed as it grows until the render completes.
+"""
+
+import asyncio
+import os
+
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 256 * 1024
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Returns the first and last byte of a single `bytes=` range.
+
+    Returns None if the whole file should be sent: the header is malformed or asks for
+    several ranges, which servers may ignore.
+
+    Raises:
+      ValueError: if the range starts after the end of the file.
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if not first:
+            # A suffix range: the last bytes of the file.
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+async def _read_range(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(
+    request: Request, path: str, media_type: str, filename: Optional[str] = None
+) -> Response:
+    """Sends a file, or the byte range asked by the Range header of the request."""
+    headers = {"Accept-Ranges": "bytes"}
+    if filename is not None:
+        headers["Content-Disposition"] = f"attachment; filename={filename}"
+
+    range_header = request.headers.get("range")
+    if range_header is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    size = os.path.getsize(path)
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_range(path, start, end - start + 1),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+async def follow_file(
+    path: str, writer: asyncio.Future, poll_interval: float = 0.1
+) -> AsyncIterator[bytes]:
+    """Yields the content of a file while it is written, until `writer` completes.
+
+    `writer` resolves to the final path of the file, in case it was moved before it
+    could be opened. If it fails, the error is raised after the bytes already written.
+    """
+    while True:
+        try:
+            f = open(path, "rb")
+            break
+        except FileNotFoundError:
+            if not writer.done():
+                await asyncio.sleep(poll_interval)
+                continue
+            final_path = writer.result()
+            if final_path == path:
+                raise
+            path = final_path
+
+    with f:
+        while True:
+            # Checked before reading, so the bytes written before completion are sent.
+            done = writer.done()
+            chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+            if chunk:
+                yield chunk
+            elif done:
+                writer.result()
+                return
+            else:
+                await asyncio.sleep(poll_interval)
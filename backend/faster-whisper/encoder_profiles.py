@@ -0,0 +1,188 @@
+"""Chooses the x264 preset of a render from its deadline.
+
+The encode time of a render is predicted from the number of pixels to encode, the
+encoder threads, the measured throughput of each preset on this host and the current
+load. The slowest preset, hence the best compression, whose predicted time fits the
+deadline is used: short clips keep the default quality and long videos are encoded
+faster. The throughputs start from a short benchmark of every preset and follow the
+renders actually run.
+"""
+
+import os
+
+from typing import NamedTuple, Optional
+
+import av
+
+from render import RenderPool
+from render_segments import MIN_CHUNK_SECONDS
+
+X264_PRESETS = (
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+)
+
+# Pixels encoded per second by one thread, until the presets are measured on the host.
+DEFAULT_THROUGHPUT = {
+    "ultrafast": 60e6,
+    "superfast": 40e6,
+    "veryfast": 28e6,
+    "faster": 18e6,
+    "fast": 14e6,
+    "medium": 10e6,
+    "slow": 6e6,
+    "slower": 3e6,
+    "veryslow": 1.5e6,
+}
+
+# Weight of the last render in the measured throughput.
+_SMOOTHING = 0.3
+
+
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    frame_rate: float
+    duration: float
+
+    @property
+    def pixels(self) -> float:
+        """Number of pixels to encode."""
+        return self.width * self.height * self.frame_rate * self.duration
+
+
+def probe_video(path: str) -> Optional[VideoInfo]:
+    """Returns the size, frame rate and duration of the first video stream, if any."""
+    with av.open(path, metadata_errors="ignore") as container:
+        if not container.streams.video or container.duration is None:
+            return None
+        stream = container.streams.video[0]
+        frame_rate = float(stream.average_rate or stream.guessed_rate or 25)
+        return VideoInfo(
+            stream.codec_context.width,
+            stream.codec_context.height,
+            frame_rate,
+            container.duration / av.time_base,
+        )
+
+
+def render_threads(pool: RenderPool, duration: float, parallel: bool) -> int:
+    """Returns the encoder threads of a render, summed over its chunks encoded together.
+
+    Args:
+      pool: Pool running the render.
+      duration: Duration of the video.
+      parallel: Whether the video is cut in chunks encoded in parallel, see `plan_chunks`.
+    """
+    processes = 1
+    if parallel:
+        # plan_chunks cuts at most one chunk per slot, of at least MIN_CHUNK_SECONDS.
+        chunks = min(max(pool.max_renders, 2), int(duration // MIN_CHUNK_SECONDS))
+        processes = max(1, min(chunks, pool.max_renders))
+    return processes * pool.threads_for(processes)
+
+
+def _load_factor() -> float:
+    # How much slower the encoders run because the cores are shared.
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return 1.0
+    return max(1.0, load / (os.cpu_count() or 1))
+
+
+class PresetSelector:
+    def __init__(self, max_preset: str = "medium", safety: float = 1.25):
+        """Creates the selector.
+
+        Args:
+          max_preset: Slowest preset used when there is time, the quality of renders
+            without deadline.
+          safety: Margin applied to the predicted encode time.
+
+        Raises:
+          ValueError: if the preset is not an x264 preset.
+        """
+        if max_preset not in X264_PRESETS:
+            raise ValueError(
+                "Invalid preset '%s', expected one of: %s"
+                % (max_preset, ", ".join(X264_PRESETS))
+            )
+        self.presets = X264_PRESETS[: X264_PRESETS.index(max_preset) + 1]
+        self.safety = safety
+        self.throughput = {
+            preset: DEFAULT_THROUGHPUT[preset] for preset in self.presets
+        }
+        self.measured = {preset: 0 for preset in self.presets}
+
+    def predict(self, preset: str, pixels: float, threads: int) -> float:
+        """Returns the predicted seconds to encode `pixels` at the current load."""
+        return pixels / (self.throughput[preset] * threads) * _load_factor()
+
+    def select(self, pixels: float, threads: int, deadline: Optional[float]) -> str:
+        """Returns the slowest preset predicted to encode `pixels` within `deadline`.
+
+        Without deadline, the slowest preset is returned. When no preset is fast enough,
+        the fastest one is.
+        """
+        if deadline is None:
+            return self.presets[-1]
+        for preset in reversed(self.presets):
+            if self.predict(preset, pixels, threads) * self.safety <= deadline:
+                return preset
+        return self.presets[0]
+
+    def record(self, preset: str, pixels: float, threads: int, seconds: float):
+        """Updates the throughput of `preset` with a render that took `seconds`."""
+        if preset not in self.throughput or seconds <= 0:
+            return
+        throughput = pixels * _load_factor() / (seconds * threads)
+        if self.measured[preset]:
+            throughput = (
+                _SMOOTHING * throughput + (1 - _SMOOTHING) * self.throughput[preset]
+            )
+        self.throughput[preset] = throughput
+        self.measured[preset] += 1
+
+    async def calibrate(self, pool: RenderPool, seconds: float = 2.0):
+        """Measures every preset with a short encode of a 720p test pattern."""
+        size, frame_rate = (1280, 720), 30
+        pixels = size[0] * size[1] * frame_rate * seconds
+        with pool.workdir() as workdir:
+            for preset in self.presets:
+                elapsed = await pool.run(
+                    [
+                        "-f",
+                        "lavfi",
+                        "-i",
+                        "testsrc2=size=%dx%d:rate=%d:duration=%s"
+                        % (size[0], size[1], frame_rate, seconds),
+                        "-c:v",
+                        "libx264",
+                        "-preset",
+                        preset,
+                        "-threads",
+                        "0",
+                        "-f",
+                        "null",
+                        "-",
+                    ],
+                    workdir,
+                )
+                self.record(preset, pixels, elapsed.threads, elapsed.seconds)
+
+    def stats(self) -> dict:
+        return {
+            preset: {
+                "pixels_per_second": round(self.throughput[preset]),
+                "measured": self.measured[preset],
+            }
+            for preset in self.presets
+        }
@@ -1,4 +1,5 @@
-from faster_whisper.audio import decode_audio
+from faster_whisper.audio import decode_audio, decode_audio_blocks
+from faster_whisper.subtitles import write_subtitles
 from faster_whisper.transcribe import BatchedInferencePipeline, WhisperModel
 from faster_whisper.utils import available_models, download_model, format_timestamp
 from faster_whisper.version import __version__
@@ -6,9 +7,11 @@ from faster_whisper.version import __version__
 __all__ = [
     "available_models",
     "decode_audio",
+    "decode_audio_blocks",
     "WhisperModel",
     "BatchedInferencePipeline",
     "download_model",
     "format_timestamp",
+    "write_subtitles",
     "__version__",
 ]
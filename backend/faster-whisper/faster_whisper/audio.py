@@ -6,20 +6,46 @@ system dependencies. FFmpeg does not need to be installed on the system.
 However, the API is quite low-level so we need to manipulate audio frames directly.
 """
 
-import gc
-import io
+import concurrent.futures
+import hashlib
 import itertools
+import math
+import os
+import tempfile
 
-from typing import BinaryIO, Union
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
 
 import av
 import numpy as np
 
+# Files are decoded in parallel in time ranges of at least this number of seconds.
+_MIN_SHARD_DURATION = 60
+
+# Seconds decoded and dropped before the start of a range, for the decoder to recover
+# the state it has when the file is decoded from the beginning.
+_SHARD_PREROLL = 1.0
+
+# Scale of the sample formats converted to float32 without resampling.
+_FLOAT32_CONVERSIONS = {
+    "fltp": None,
+    "flt": None,
+    "s16p": 1 / 32768,
+    "s16": 1 / 32768,
+    "s32p": 1 / 2147483648,
+    "s32": 1 / 2147483648,
+}
+
 
 def decode_audio(
     input_file: Union[str, BinaryIO],
     sampling_rate: int = 16000,
     split_stereo: bool = False,
+    cache_dir: Optional[str] = None,
+    num_workers: int = 1,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+    cache_key: Optional[str] = None,
+    max_cache_bytes: Optional[int] = None,
 ):
     """Decodes the audio.
 
@@ -27,55 +53,488 @@ def decode_audio(
       input_file: Path to the input file or a file-like object.
       sampling_rate: Resample the audio to this sample rate.
       split_stereo: Return separate left and right channels.
+      cache_dir: Directory where the audio decoded from a file path is saved, keyed by
+        the hash of the file content and the sampling rate. The next calls on the same
+        content return a read-only `np.memmap` of the saved audio instead of decoding
+        it, so processes decoding the same file share its pages.
+      num_workers: When larger than 1, a file given by path is split into this number
+        of time ranges decoded in parallel processes. Files of less than a minute per
+        range are split into fewer ranges.
+      start_time: Start of the audio to decode, in seconds. The container is seeked
+        before this time, so the cost depends on the duration decoded and not on the
+        position in the file.
+      end_time: End of the audio to decode, in seconds, the end of the file by default.
+        `cache_dir` and `num_workers` are ignored when `start_time` or `end_time` is set.
+      cache_key: Name of the file content in `cache_dir`, e.g. its hash when the caller
+        already computed it, so the file is not read to hash it again.
+      max_cache_bytes: Size of `cache_dir` above which the least recently used arrays
+        are removed when a new one is saved. Unbounded if None.
 
     Returns:
       A float32 Numpy array.
 
       If `split_stereo` is enabled, the function returns a 2-tuple with the
       separated left and right channels.
+
+    Raises:
+      ValueError: if the time range is invalid.
     """
-    resampler = av.audio.resampler.AudioResampler(
-        format="s16",
-        layout="mono" if not split_stereo else "stereo",
-        rate=sampling_rate,
-    )
+    is_path = isinstance(input_file, (str, os.PathLike))
+    if start_time is not None or end_time is not None:
+        audio = _decode_time_range(
+            input_file, sampling_rate, split_stereo, start_time, end_time
+        )
+    elif cache_dir is not None and is_path:
+        audio = _load_cached_audio(
+            input_file,
+            sampling_rate,
+            split_stereo,
+            cache_dir,
+            num_workers,
+            cache_key,
+            max_cache_bytes,
+        )
+    elif num_workers > 1 and is_path:
+        audio = _decode_audio_sharded(
+            input_file, sampling_rate, split_stereo, num_workers
+        )
+    else:
+        audio = _decode_audio(input_file, sampling_rate, split_stereo)
+
+    if split_stereo:
+        return audio[0], audio[1]
+
+    return audio[0]
 
-    raw_buffer = io.BytesIO()
-    dtype = None
+
+def _decode_audio(input_file, sampling_rate, split_stereo):
+    # Returns an array of shape (channels, samples).
+    channels = 2 if split_stereo else 1
 
     with av.open(input_file, mode="r", metadata_errors="ignore") as container:
-        frames = container.decode(audio=0)
-        frames = _ignore_invalid_frames(frames)
-        frames = _group_frames(frames, 500000)
-        frames = _resample_frames(frames, resampler)
+        # The output is allocated once from the duration reported by the container, with
+        # one second of margin, and only grows if the duration was underestimated.
+        capacity = 0
+        if container.duration is not None:
+            capacity = int(container.duration * sampling_rate / av.time_base)
+            capacity += sampling_rate
+        audio = np.empty((channels, capacity), dtype=np.float32)
+        length = 0
+
+        for block in _decode_blocks(container, sampling_rate, split_stereo):
+            block = block.reshape(channels, -1)
+            if length + block.shape[1] > audio.shape[1]:
+                grown = np.empty(
+                    (channels, max(length + block.shape[1], audio.shape[1] * 5 // 4)),
+                    dtype=np.float32,
+                )
+                grown[:, :length] = audio[:, :length]
+                audio = grown
+            audio[:, length : length + block.shape[1]] = block
+            length += block.shape[1]
+
+    if audio.shape[1] - length > sampling_rate:
+        return audio[:, :length].copy()
+
+    return audio[:, :length]
+
+
+def _decode_time_range(input_file, sampling_rate, split_stereo, start_time, end_time):
+    start, end = time_range_to_samples(start_time, end_time, sampling_rate)
+    audio = _decode_range(input_file, sampling_rate, split_stereo, start, end)
+    if audio is None:
+        # The position of the samples after a seek is unknown: the range is decoded from
+        # the beginning of the file.
+        if hasattr(input_file, "seek"):
+            input_file.seek(0)
+        audio = _decode_range(input_file, sampling_rate, split_stereo, 0, end)
+        audio = audio[:, start:]
 
-        for frame in frames:
-            array = frame.to_ndarray()
-            dtype = array.dtype
-            raw_buffer.write(array)
+    return audio
+
+
+def _decode_audio_sharded(path, sampling_rate, split_stereo, num_workers):
+    # Decodes time ranges of the file in parallel processes, by seeking to the start of
+    # each range, and copies them to their position in the output. The ranges are
+    # placed from the timestamps of the container, so the file is decoded linearly when
+    # they are missing or inconsistent.
+    with av.open(path, mode="r", metadata_errors="ignore") as container:
+        duration = container.duration
+
+    num_shards = 0
+    if duration is not None:
+        num_shards = min(
+            num_workers, int(duration / av.time_base / _MIN_SHARD_DURATION)
+        )
+    if num_shards < 2:
+        return _decode_audio(path, sampling_rate, split_stereo)
+
+    length = int(duration * sampling_rate / av.time_base)
+    starts = [length * index // num_shards for index in range(num_shards)]
+    ends = starts[1:] + [None]
+
+    with concurrent.futures.ProcessPoolExecutor(num_shards) as executor:
+        futures = [
+            executor.submit(
+                _decode_range, path, sampling_rate, split_stereo, start, end
+            )
+            for start, end in zip(starts, ends)
+        ]
+
+        audio = np.empty((2 if split_stereo else 1, length + sampling_rate), np.float32)
+        for start, end, future in zip(starts, ends, futures):
+            shard = future.result()
+            if shard is None or (end is not None and start + shard.shape[1] != end):
+                for pending in futures:
+                    pending.cancel()
+                return _decode_audio(path, sampling_rate, split_stereo)
+
+            length = start + shard.shape[1]
+            if length > audio.shape[1]:
+                grown = np.empty((audio.shape[0], length), dtype=np.float32)
+                grown[:, :start] = audio[:, :start]
+                audio = grown
+            audio[:, start:length] = shard
+
+    if audio.shape[1] - length > sampling_rate:
+        return audio[:, :length].copy()
+
+    return audio[:, :length]
+
+
+def _decode_range(input_file, sampling_rate, split_stereo, start, end=None):
+    # Returns the samples [start, end) of the file, until its end if `end` is None, or
+    # None if the position of the decoded samples is unknown.
+    with av.open(input_file, mode="r", metadata_errors="ignore") as container:
+        stream = container.streams.audio[0]
+        frames = container.decode(stream)
+
+        position = 0
+        if start > 0:
+            origin = stream.start_time or 0
+            seconds = max(start / sampling_rate - _SHARD_PREROLL, 0)
+            container.seek(origin + int(seconds / stream.time_base), stream=stream)
+            frames = _ignore_invalid_frames(container.decode(stream))
+            first_frame = next(frames, None)
+            if first_frame is None or first_frame.pts is None:
+                return None
+
+            # The resampling starts on an input sample that falls on an output sample,
+            # so the samples are the same as when the file is decoded linearly.
+            input_rate = first_frame.sample_rate
+            input_position = round(
+                (first_frame.pts - origin) * stream.time_base * input_rate
+            )
+            period = input_rate // math.gcd(input_rate, sampling_rate)
+            skipped = -input_position % period
+            while first_frame is not None and skipped >= first_frame.samples:
+                skipped -= first_frame.samples
+                input_position += first_frame.samples
+                first_frame = next(frames, None)
+            if first_frame is None:
+                return None
+            input_position += skipped
+            first_frame = _trim_frame(first_frame, skipped)
+
+            position = input_position * sampling_rate // input_rate
+            if position > start:
+                return None
+            frames = itertools.chain([first_frame], frames)
+
+        # Like in _decode_audio, the duration of the container bounds the allocation, so
+        # an end time past the end of the file does not allocate for the whole range.
+        capacity = end - start if end is not None else 0
+        if container.duration is not None:
+            remaining = int(container.duration * sampling_rate / av.time_base)
+            remaining += sampling_rate - start
+            capacity = remaining if end is None else min(capacity, remaining)
+        audio = np.empty((2 if split_stereo else 1, max(capacity, 0)), np.float32)
+        length = 0
+
+        for samples in _convert_frames(container, frames, sampling_rate, split_stereo):
+            # Drops the samples decoded before the range.
+            skipped = min(max(start - position, 0), samples.shape[1])
+            position += samples.shape[1]
+            samples = samples[:, skipped:]
+            if end is not None:
+                samples = samples[:, : end - start - length]
+
+            if length + samples.shape[1] > audio.shape[1]:
+                grown = np.empty(
+                    (
+                        audio.shape[0],
+                        max(length + samples.shape[1], audio.shape[1] * 5 // 4),
+                    ),
+                    dtype=np.float32,
+                )
+                grown[:, :length] = audio[:, :length]
+                audio = grown
+            audio[:, length : length + samples.shape[1]] = samples
+            length += samples.shape[1]
+
+            if end is not None and start + length == end:
+                break
+
+    return audio[:, :length]
+
+
+def _trim_frame(frame, count):
+    # Returns the frame without its first `count` samples.
+    if count == 0:
+        return frame
+    samples = frame.to_ndarray()
+    if frame.format.is_planar:
+        samples = samples[:, count:]
+    else:
+        samples = samples[:, count * frame.layout.nb_channels :]
+    trimmed = av.AudioFrame.from_ndarray(
+        np.ascontiguousarray(samples),
+        format=frame.format.name,
+        layout=frame.layout.name,
+    )
+    trimmed.sample_rate = frame.sample_rate
+    return trimmed
+
+
+def _load_cached_audio(
+    path,
+    sampling_rate,
+    split_stereo,
+    cache_dir,
+    num_workers=1,
+    cache_key=None,
+    max_cache_bytes=None,
+):
+    if cache_key is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        cache_key = digest.hexdigest()
+    cache_path = _cache_path(cache_dir, cache_key, sampling_rate, split_stereo)
+
+    audio = _read_cached_audio(cache_path)
+    if audio is not None:
+        return audio
+
+    if num_workers > 1:
+        audio = _decode_audio_sharded(path, sampling_rate, split_stereo, num_workers)
+    else:
+        audio = _decode_audio(path, sampling_rate, split_stereo)
+
+    # The audio is written to a temporary file first, so that concurrent readers never
+    # map a partial array.
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, audio)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    if max_cache_bytes is not None:
+        _evict_cached_audio(cache_dir, max_cache_bytes, keep=cache_path)
 
-    # It appears that some objects related to the resampler are not freed
-    # unless the garbage collector is manually run.
-    # https://github.com/SYSTRAN/faster-whisper/issues/390
-    # note that this slows down loading the audio a little bit
-    # if that is a concern, please use ffmpeg directly as in here:
-    # https://github.com/openai/whisper/blob/25639fc/whisper/audio.py#L25-L62
-    del resampler
-    gc.collect()
+    return audio
 
-    audio = np.frombuffer(raw_buffer.getbuffer(), dtype=dtype)
 
-    # Convert s16 back to f32.
-    audio = audio.astype(np.float32) / 32768.0
+def cached_audio(
+    cache_dir: str,
+    cache_key: str,
+    sampling_rate: int = 16000,
+    split_stereo: bool = False,
+):
+    """Returns the audio saved by `decode_audio` in `cache_dir`, or None if it is not.
+
+    Args:
+      cache_dir: Directory passed to `decode_audio`.
+      cache_key: Key passed to `decode_audio`, or the SHA-256 of the file content.
+      sampling_rate: Sample rate of the audio.
+      split_stereo: Return separate left and right channels.
+
+    Returns:
+      A read-only `np.memmap`, or a 2-tuple of them if `split_stereo` is enabled.
+    """
+    audio = _read_cached_audio(
+        _cache_path(cache_dir, cache_key, sampling_rate, split_stereo)
+    )
+    if audio is None:
+        return None
 
     if split_stereo:
-        left_channel = audio[0::2]
-        right_channel = audio[1::2]
-        return left_channel, right_channel
+        return audio[0], audio[1]
+
+    return audio[0]
+
+
+def _cache_path(cache_dir, cache_key, sampling_rate, split_stereo):
+    return os.path.join(
+        cache_dir,
+        "%s-%d%s.npy" % (cache_key, sampling_rate, "-stereo" if split_stereo else ""),
+    )
+
 
+def _read_cached_audio(cache_path):
+    try:
+        audio = np.load(cache_path, mmap_mode="r")
+        # The modification time orders the eviction.
+        os.utime(cache_path)
+    except FileNotFoundError:
+        return None
     return audio
 
 
+def _evict_cached_audio(cache_dir, max_cache_bytes, keep):
+    # Removes the least recently used arrays until the directory fits in the quota. The
+    # arrays still mapped by other processes stay readable until they are unmapped.
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".npy") and entry.path != keep:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_bytes = os.path.getsize(keep) + sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_cache_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+
+
+def decode_audio_blocks(
+    input_file: Union[str, BinaryIO],
+    sampling_rate: int = 16000,
+    split_stereo: bool = False,
+    block_size: Optional[int] = None,
+) -> Iterator[np.ndarray]:
+    """Decodes the audio incrementally, in blocks of a fixed number of samples.
+
+    Only one block is held in memory at a time, so long files can be processed as they
+    are decoded.
+
+    Args:
+      input_file: Path to the input file or a file-like object.
+      sampling_rate: Resample the audio to this sample rate.
+      split_stereo: Yield separate left and right channels.
+      block_size: Number of samples of each block, 30 seconds by default.
+
+    Yields:
+      float32 Numpy arrays of `block_size` samples, the last one being shorter.
+
+      If `split_stereo` is enabled, the arrays have the shape (2, samples) with the
+      left and right channels.
+    """
+    with av.open(input_file, mode="r", metadata_errors="ignore") as container:
+        yield from _decode_blocks(container, sampling_rate, split_stereo, block_size)
+
+
+def _decode_blocks(container, sampling_rate, split_stereo, block_size=None):
+    channels = 2 if split_stereo else 1
+    if block_size is None:
+        block_size = 30 * sampling_rate
+
+    frames = container.decode(audio=0)
+
+    block = np.empty((channels, block_size), dtype=np.float32)
+    filled = 0
+    for samples in _convert_frames(container, frames, sampling_rate, split_stereo):
+        offset = 0
+        while offset < samples.shape[1]:
+            count = min(block_size - filled, samples.shape[1] - offset)
+            block[:, filled : filled + count] = samples[:, offset : offset + count]
+            filled += count
+            offset += count
+
+            if filled == block_size:
+                yield block if split_stereo else block[0]
+                block = np.empty((channels, block_size), dtype=np.float32)
+                filled = 0
+
+    if filled:
+        block = block[:, :filled]
+        yield block if split_stereo else block[0]
+
+
+def _convert_frames(container, frames, sampling_rate, split_stereo):
+    # Yields the samples of the decoded frames as float32 arrays of shape
+    # (channels, samples), at the requested rate.
+    channels = 2 if split_stereo else 1
+    layout = "mono" if not split_stereo else "stereo"
+    resampler = av.audio.resampler.AudioResampler(
+        format="fltp", layout=layout, rate=sampling_rate
+    )
+
+    codec_context = container.streams.audio[0].codec_context
+    gain = _downmix_gain(codec_context.layout, layout)
+
+    frames = _ignore_invalid_frames(frames)
+    frames = _group_frames(frames, 500000)
+    if _needs_resampling(codec_context, sampling_rate, channels):
+        frames = _resample_frames(frames, resampler)
+
+    for frame in frames:
+        samples = _to_float32(frame, channels)
+        if gain != 1:
+            samples *= gain
+        yield samples
+
+
+def _needs_resampling(codec_context, sampling_rate, channels):
+    # The samples are only converted to float32 when they already have the expected
+    # rate and number of channels.
+    return (
+        codec_context.sample_rate != sampling_rate
+        or codec_context.layout.nb_channels != channels
+        or codec_context.format is None
+        or codec_context.format.name not in _FLOAT32_CONVERSIONS
+    )
+
+
+def _downmix_gain(source_layout, target_layout):
+    # Unlike integer formats, float32 is resampled with a channel mixing matrix that is
+    # not normalized: downmixing stereo to mono sums the channels at -3 dB. The gain
+    # normalizes the matrix as for integer formats, so the levels do not depend on the
+    # output format. The sum of its rows is measured by mixing a frame of ones.
+    channels = len(source_layout.channels)
+    if channels <= len(av.AudioLayout(target_layout).channels):
+        return 1
+
+    frame = av.AudioFrame.from_ndarray(
+        np.ones((channels, 256), dtype=np.float32),
+        format="fltp",
+        layout=source_layout.name,
+    )
+    frame.sample_rate = 16000
+    resampler = av.audio.resampler.AudioResampler(
+        format="fltp", layout=target_layout, rate=frame.sample_rate
+    )
+    row_sum = max(
+        float(mixed.to_ndarray().max())
+        for mixed in _resample_frames([frame], resampler)
+    )
+    return 1 / max(row_sum, 1)
+
+
+def _to_float32(frame, channels):
+    samples = frame.to_ndarray()
+    if not frame.format.is_planar:
+        # Packed samples are interleaved.
+        samples = samples.reshape(-1, channels).T
+    scale = _FLOAT32_CONVERSIONS[frame.format.name]
+    if scale is not None:
+        samples = samples.astype(np.float32)
+        samples *= scale
+    return samples
+
+
 def _ignore_invalid_frames(frames):
     iterator = iter(frames)
 
@@ -108,6 +567,29 @@ def _resample_frames(frames, resampler):
         yield from resampler.resample(frame)
 
 
+def time_range_to_samples(
+    start_time: Optional[float], end_time: Optional[float], sampling_rate: int
+) -> Tuple[int, Optional[int]]:
+    """Converts a time range in seconds to the indices of its first and end samples.
+
+    The end is None when `end_time` is None, for the end of the audio.
+
+    Raises:
+      ValueError: if the start is negative or after the end.
+    """
+    if start_time is None:
+        start_time = 0
+    if start_time < 0 or (end_time is not None and end_time < start_time):
+        raise ValueError(
+            "Invalid time range %s-%s, expected 0 <= start_time <= end_time"
+            % (start_time, end_time)
+        )
+
+    start = round(start_time * sampling_rate)
+    end = round(end_time * sampling_rate) if end_time is not None else None
+    return start, end
+
+
 def pad_or_trim(array, length: int = 3000, *, axis: int = -1):
     """
     Pad or trim the Mel features array to 3000, as expected by the encoder.
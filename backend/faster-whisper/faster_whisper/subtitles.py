@@ -0,0 +1,258 @@
+"""Subtitle writers for the SRT, WebVTT, ASS and JSON Lines formats.
+
+The writers consume the segments lazily, e.g. the generator returned by
+`WhisperModel.transcribe`, and yield the subtitles piece by piece, so a transcript is
+never held twice in memory and can be written to a file or a socket as it is decoded.
+"""
+
+import json
+
+from typing import Iterable, Iterator, List, Optional, TextIO
+
+from faster_whisper.transcribe import Segment, Word
+from faster_whisper.utils import format_timestamp
+
+SUBTITLE_FORMATS = ("srt", "vtt", "ass", "jsonl")
+
+KARAOKE_EFFECTS = ("color", "k", "kf")
+
+DEFAULT_ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1920
+PlayResY: 1080
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, \
+BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, \
+BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,60,&H00FFFFFF,&H0000FFFF,&H00000000,&H80000000,0,0,0,0,100,100,\
+0,0,1,2,0,2,60,60,70,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def format_ass_timestamp(seconds: float) -> str:
+    """Formats seconds as an ASS timestamp, H:MM:SS.CC."""
+    return _format_centiseconds(round(seconds * 100))
+
+
+def _format_centiseconds(centiseconds: int) -> str:
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    seconds, centiseconds = divmod(centiseconds, 100)
+    return "%d:%02d:%02d.%02d" % (hours, minutes, seconds, centiseconds)
+
+
+def segment_to_dict(segment: Segment) -> dict:
+    """Returns the JSON representation of a segment written by `iter_jsonl`."""
+    return {
+        "id": segment.id,
+        "start": segment.start,
+        "end": segment.end,
+        "text": segment.text.strip(),
+        "words": [
+            {
+                "word": word.word,
+                "start": word.start,
+                "end": word.end,
+                "probability": word.probability,
+            }
+            for word in segment.words or ()
+        ],
+    }
+
+
+def iter_srt(segments: Iterable[Segment]) -> Iterator[str]:
+    """Yields one SRT cue per segment."""
+    for index, segment in enumerate(segments, start=1):
+        yield "%d\n%s --> %s\n%s\n\n" % (
+            index,
+            format_timestamp(segment.start, True, ","),
+            format_timestamp(segment.end, True, ","),
+            segment.text.strip(),
+        )
+
+
+def iter_vtt(segments: Iterable[Segment]) -> Iterator[str]:
+    """Yields the WebVTT header, then one cue per segment."""
+    yield "WEBVTT\n\n"
+    for segment in segments:
+        yield "%s --> %s\n%s\n\n" % (
+            format_timestamp(segment.start, True),
+            format_timestamp(segment.end, True),
+            segment.text.strip(),
+        )
+
+
+def iter_jsonl(segments: Iterable[Segment]) -> Iterator[str]:
+    """Yields one JSON object per line and segment, see `segment_to_dict`."""
+    for segment in segments:
+        yield json.dumps(segment_to_dict(segment)) + "\n"
+
+
+def iter_ass(
+    segments: Iterable[Segment],
+    header: str = DEFAULT_ASS_HEADER,
+    karaoke: Optional[str] = None,
+    window_size: int = 6,
+    text_color: str = "&H00FFFFFF",
+    highlight_color: str = "&H0000FFFF",
+    padding: str = "",
+) -> Iterator[str]:
+    """Yields the ASS header, then the Dialogue events.
+
+    Args:
+      segments: Segments to write. The karaoke effects only use their words.
+      header: Script info, styles and events format, ending with a newline. The events
+        use the Default style.
+      karaoke: None writes one event per segment. The effects show the words in windows
+        of `window_size` words:
+        - "color": one event per word, the window in `text_color` with the spoken word
+          in `highlight_color`;
+        - "k" and "kf": one event per window timed with \\k tags (\\kf sweeps the
+          highlight across the word). libass draws a word in the style SecondaryColour
+          until it is spoken and in PrimaryColour from then on.
+      window_size: Number of words shown together by the karaoke effects.
+      text_color: Color of the words in ASS format (&HAABBGGRR), for "color".
+      highlight_color: Color of the spoken word in ASS format, for "color".
+      padding: Text added before and after the text of every event.
+
+    Raises:
+      ValueError: if the karaoke effect is unknown.
+    """
+    if karaoke is not None and karaoke not in KARAOKE_EFFECTS:
+        raise ValueError(
+            "Invalid karaoke effect '%s', expected one of: %s"
+            % (karaoke, ", ".join(KARAOKE_EFFECTS))
+        )
+    return _iter_ass(
+        segments, header, karaoke, window_size, text_color, highlight_color, padding
+    )
+
+
+def _iter_ass(
+    segments, header, karaoke, window_size, text_color, highlight_color, padding
+):
+    if header:
+        yield header
+
+    if karaoke is None:
+        for segment in segments:
+            text = segment.text.strip().replace("\n", "\\N")
+            yield _ass_event(
+                format_ass_timestamp(segment.start),
+                format_ass_timestamp(segment.end),
+                padding + text + padding,
+            )
+        return
+
+    windows = _word_windows(segments, window_size)
+    if karaoke == "color":
+        yield from _iter_color_events(windows, text_color, highlight_color, padding)
+    else:
+        yield from _iter_k_events(windows, "\\" + karaoke, padding)
+
+
+def _ass_event(start: str, end: str, text: str) -> str:
+    return "Dialogue: 0,%s,%s,Default,,0,0,0,,%s\n" % (start, end, text)
+
+
+def _word_windows(segments: Iterable[Segment], size: int) -> Iterator[List[Word]]:
+    window = []
+    for segment in segments:
+        for word in getattr(segment, "words", None) or ():
+            window.append(word)
+            if len(window) == size:
+                yield window
+                window = []
+    if window:
+        yield window
+
+
+def _iter_color_events(windows, text_color, highlight_color, padding):
+    # The color tags are formatted once, and every word of a window once in each color.
+    plain_tag = "{\\c%s&}" % text_color
+    active_tag = "{\\c%s&}" % highlight_color
+
+    for window in windows:
+        texts = [word.word.strip() for word in window]
+        plain = [plain_tag + text + "{\\r}" for text in texts]
+        for index, word in enumerate(window):
+            active = active_tag + texts[index] + "{\\r}"
+            text = " ".join(plain[:index] + [active] + plain[index + 1 :])
+            yield _ass_event(
+                format_ass_timestamp(word.start),
+                format_ass_timestamp(word.end),
+                padding + text + padding,
+            )
+
+
+def _iter_k_events(windows, tag, padding):
+    for window in windows:
+        # Times are in centiseconds, rounded on the absolute times so the durations add
+        # up to the event duration.
+        first = cursor = round(window[0].start * 100)
+        parts = []
+        for word in window:
+            start = max(round(word.start * 100), cursor)
+            end = max(round(word.end * 100), start)
+            # A silence before the word is an empty syllable.
+            gap = "{\\k%d}" % (start - cursor) if start > cursor else ""
+            parts.append("%s{%s%d}%s" % (gap, tag, end - start, word.word.strip()))
+            cursor = end
+
+        yield _ass_event(
+            _format_centiseconds(first),
+            _format_centiseconds(cursor),
+            padding + " ".join(parts) + padding,
+        )
+
+
+_WRITERS = {
+    "srt": iter_srt,
+    "vtt": iter_vtt,
+    "ass": iter_ass,
+    "jsonl": iter_jsonl,
+}
+
+
+def iter_subtitles(segments: Iterable[Segment], format: str, **kwargs) -> Iterator[str]:
+    """Yields the subtitles of `segments` in `format`.
+
+    Args:
+      segments: Segments to write, consumed as the subtitles are iterated.
+      format: One of "srt", "vtt", "ass" and "jsonl".
+      kwargs: Options of the ASS writer, see `iter_ass`.
+
+    Raises:
+      ValueError: if the format is unknown.
+    """
+    writer = _WRITERS.get(format)
+    if writer is None:
+        raise ValueError(
+            "Invalid subtitle format '%s', expected one of: %s"
+            % (format, ", ".join(SUBTITLE_FORMATS))
+        )
+    return writer(segments, **kwargs)
+
+
+def write_subtitles(
+    segments: Iterable[Segment], file: TextIO, format: str = "srt", **kwargs
+) -> None:
+    """Writes the subtitles of `segments` to a text file as the segments are produced.
+
+    Args:
+      segments: Segments to write, e.g. the generator returned by
+        `WhisperModel.transcribe`.
+      file: Text file, or a socket wrapped by `socket.makefile("w")`.
+      format: One of "srt", "vtt", "ass" and "jsonl".
+      kwargs: Options of the ASS writer, see `iter_ass`.
+
+    Raises:
+      ValueError: if the format is unknown.
+    """
+    file.writelines(iter_subtitles(segments, format, **kwargs))
@@ -16,7 +16,7 @@ import tokenizers
 
 from tqdm import tqdm
 
-from faster_whisper.audio import decode_audio, pad_or_trim
+from faster_whisper.audio import decode_audio, pad_or_trim, time_range_to_samples
 from faster_whisper.feature_extractor import FeatureExtractor
 from faster_whisper.tokenizer import _LANGUAGE_CODES, Tokenizer
 from faster_whisper.utils import download_model, format_timestamp, get_end, get_logger
@@ -296,6 +296,8 @@ class BatchedInferencePipeline:
         hotwords: Optional[str] = None,
         language_detection_threshold: Optional[float] = 0.5,
         language_detection_segments: int = 1,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
     ) -> Tuple[Iterable[Segment], TranscriptionInfo]:
         """transcribe audio in chunks in batched fashion and return with language info.
 
@@ -347,6 +349,10 @@ class BatchedInferencePipeline:
             language_detection_threshold: If the maximum probability of the language tokens is
                 higher than this value, the language is detected.
             language_detection_segments: Number of segments to consider for the language detection.
+            start_time: Start of the audio to transcribe, in seconds. A file is only decoded
+                from this time. The timestamps of the segments remain relative to the
+                beginning of the audio, while `clip_timestamps` are relative to `start_time`.
+            end_time: End of the audio to transcribe, in seconds.
 
         Unused Arguments
             compression_ratio_threshold: If the gzip compression ratio is above this value,
@@ -383,8 +389,7 @@ class BatchedInferencePipeline:
             )
             multilingual = False
 
-        if not isinstance(audio, np.ndarray):
-            audio = decode_audio(audio, sampling_rate=sampling_rate)
+        audio = load_audio_range(audio, sampling_rate, start_time, end_time)
         duration = audio.shape[0] / sampling_rate
 
         self.model.logger.info(
@@ -560,6 +565,8 @@ class BatchedInferencePipeline:
             log_progress,
         )
         segments = restore_speech_timestamps(segments, clip_timestamps, sampling_rate)
+        if start_time:
+            segments = shift_timestamps(segments, start_time)
 
         return segments, info
 
@@ -774,6 +781,8 @@ class WhisperModel:
         hotwords: Optional[str] = None,
         language_detection_threshold: Optional[float] = 0.5,
         language_detection_segments: int = 1,
+        start_time: Optional[float] = None,
+        end_time: Optional[float] = None,
     ) -> Tuple[Iterable[Segment], TranscriptionInfo]:
         """Transcribes an input file.
 
@@ -843,6 +852,10 @@ class WhisperModel:
           language_detection_threshold: If the maximum probability of the language tokens is higher
            than this value, the language is detected.
           language_detection_segments: Number of segments to consider for the language detection.
+          start_time: Start of the audio to transcribe, in seconds. A file is only decoded
+            from this time. The timestamps of the segments remain relative to the beginning
+            of the audio, while `clip_timestamps` are relative to `start_time`.
+          end_time: End of the audio to transcribe, in seconds.
         Returns:
           A tuple with:
 
@@ -858,8 +871,7 @@ class WhisperModel:
             )
             multilingual = False
 
-        if not isinstance(audio, np.ndarray):
-            audio = decode_audio(audio, sampling_rate=sampling_rate)
+        audio = load_audio_range(audio, sampling_rate, start_time, end_time)
 
         duration = audio.shape[0] / sampling_rate
         duration_after_vad = duration
@@ -994,6 +1006,8 @@ class WhisperModel:
 
         if speech_chunks:
             segments = restore_speech_timestamps(segments, speech_chunks, sampling_rate)
+        if start_time:
+            segments = shift_timestamps(segments, start_time)
 
         info = TranscriptionInfo(
             language=language,
@@ -1856,6 +1870,39 @@ def restore_speech_timestamps(
         yield segment
 
 
+def load_audio_range(
+    audio: Union[str, BinaryIO, np.ndarray],
+    sampling_rate: int,
+    start_time: Optional[float] = None,
+    end_time: Optional[float] = None,
+) -> np.ndarray:
+    if not isinstance(audio, np.ndarray):
+        return decode_audio(
+            audio,
+            sampling_rate=sampling_rate,
+            start_time=start_time,
+            end_time=end_time,
+        )
+
+    if start_time is None and end_time is None:
+        return audio
+
+    start, end = time_range_to_samples(start_time, end_time, sampling_rate)
+    return audio[start:end]
+
+
+def shift_timestamps(segments: Iterable[Segment], offset: float) -> Iterable[Segment]:
+    for segment in segments:
+        segment.start = round(segment.start + offset, 3)
+        segment.end = round(segment.end + offset, 3)
+        if segment.words:
+            for word in segment.words:
+                word.start = round(word.start + offset, 3)
+                word.end = round(word.end + offset, 3)
+
+        yield segment
+
+
 def get_ctranslate2_storage(segment: np.ndarray) -> ctranslate2.StorageView:
     segment = np.ascontiguousarray(segment)
     segment = ctranslate2.StorageView.from_array(segment)
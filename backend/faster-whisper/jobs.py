@@ -0,0 +1,172 @@
+"""Background jobs for long transcriptions and renders.
+
+Submitting work returns a job ID immediately instead of holding the HTTP request open
+until the transcription or the ffmpeg render completes. The status can be polled,
+progress is streamed as Server-Sent Events, and the result is fetched by ID.
+"""
+
+import asyncio
+import contextvars
+import json
+import time
+import uuid
+
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# Job run by the current task. It stays queued until a worker pool starts its work.
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+def mark_running():
+    """Marks the job of the calling task as running, called once it has a worker."""
+    job = _current_job.get()
+    if job is not None and job.status == QUEUED:
+        job.update(status=RUNNING)
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    status: str = QUEUED
+    progress: float = 0.0
+    message: str = ""
+    result: Any = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    updated: float = field(default_factory=time.time)
+    version: int = 0
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    _task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def update(self, **changes):
+        """Updates the job and wakes up the event streams. Call it from the event loop."""
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.updated = time.time()
+        self.version += 1
+
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def report(self, progress: float, message: Optional[str] = None):
+        """Progress callback given to the job function, `progress` is between 0 and 1."""
+        progress = min(max(progress, 0.0), 1.0)
+        if message is None:
+            message = self.message
+        if progress != self.progress or message != self.message:
+            self.update(progress=progress, message=message)
+
+    async def wait_for_change(self, version: int):
+        while self.version == version:
+            await self._changed.wait()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "message": self.message,
+            "error": self.error,
+            "created": self.created,
+            "updated": self.updated,
+        }
+
+
+class JobManager:
+    def __init__(self, ttl: float = 3600, max_jobs: int = 1000):
+        """Creates the manager.
+
+        Args:
+          ttl: Seconds a finished job and its result are kept.
+          max_jobs: Maximum number of jobs kept, the oldest finished jobs are dropped first.
+        """
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, Job] = {}
+
+    def submit(self, kind: str, fn: Callable[[Job], Awaitable[Any]]) -> Job:
+        """Starts `fn(job)` in the background and returns the job.
+
+        The function reports progress with `job.report()` and its return value becomes the
+        job result.
+        """
+        self._sweep()
+
+        job = Job(job_id=uuid.uuid4().hex, kind=kind)
+        job._task = asyncio.create_task(self._run(job, fn))
+        self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._task.cancel()
+        return True
+
+    async def events(self, job: Job):
+        """Yields the job state as Server-Sent Events until the job is finished."""
+        version = -1
+        while True:
+            if job.version != version:
+                version = job.version
+                yield "event: %s\ndata: %s\n\n" % (
+                    job.status,
+                    json.dumps(job.to_dict()),
+                )
+                if job.finished:
+                    return
+            try:
+                await asyncio.wait_for(job.wait_for_change(version), timeout=15)
+            except asyncio.TimeoutError:
+                # Comment line keeping proxies from closing an idle connection.
+                yield ": keep-alive\n\n"
+
+    def stats(self) -> dict:
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    async def _run(self, job: Job, fn: Callable[[Job], Awaitable[Any]]):
+        # The task runs in a copy of the context, the variable is only set for this job.
+        _current_job.set(job)
+        try:
+            result = await fn(job)
+        except asyncio.CancelledError:
+            job.update(status=CANCELLED)
+        except Exception as e:
+            job.update(status=FAILED, error=str(e))
+        else:
+            job.update(status=COMPLETED, progress=1.0, result=result)
+
+    def _sweep(self):
+        now = time.time()
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished),
+            key=lambda job: job.updated,
+        )
+        excess = len(self._jobs) - self.max_jobs + 1
+
+        for job in finished:
+            if now - job.updated > self.ttl or excess > 0:
+                del self._jobs[job.job_id]
+                excess -= 1
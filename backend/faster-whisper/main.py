@@ -1,10 +1,40 @@
-from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, File, UploadFile, Form, Request, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from faster_whisper import WhisperModel
-import tempfile
+from assets import AssetStore
+from transcript_cache import TranscriptCache, audio_digest, file_digest, transcript_key
+from uploads import SharedUploads, decode_stream, save_upload
+from downloads import file_response, follow_file
+from faster_whisper import available_models
+from faster_whisper.subtitles import SUBTITLE_FORMATS, iter_ass, iter_subtitles, segment_to_dict
+from jobs import COMPLETED, JobManager
+from model_registry import route_model
+from render import RenderError, RenderPool, probe_duration
+from render_cache import RenderCache, render_key
+from encoder_profiles import PresetSelector, probe_video, render_threads
+from render_segments import (
+    COPYABLE_VIDEO,
+    ass_events,
+    can_copy_chunks,
+    changed_events,
+    keyframe_times,
+    plan_chunks,
+    plan_smart_chunks,
+    render_segmented,
+    shift_ass,
+    video_format,
+)
+from workers import (
+    TranscriptionPool,
+    iter_media_transcription,
+    iter_transcription,
+    transcribe_media,
+)
+import asyncio
+import contextlib
+import functools
 import os
-import subprocess
+import tempfile
 from typing import Optional
 import json
 
@@ -22,98 +52,430 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-model = WhisperModel("tiny", device="cpu", compute_type="int8")
+# Transcriptions run in a dedicated pool so the event loop stays responsive.
+# WHISPER_POOL is "thread" (shared models) or "process" (models loaded per worker).
+WHISPER_MODEL = os.environ.get("WHISPER_MODEL", "tiny")
 
+# Requests select a model by name or by tier, e.g. WHISPER_TIERS="fast=tiny,accurate=small".
+# Other models are loaded on first use and evicted past WHISPER_MODEL_MEMORY_MB.
+MODEL_TIERS = dict(
+    tier.split("=", 1) for tier in os.environ.get("WHISPER_TIERS", "").split(",") if tier
+)
+ROUTE_ENGLISH = os.environ.get("WHISPER_ROUTE_ENGLISH", "true").lower() == "true"
+
+# WHISPER_BATCH_SIZE > 0 switches to batched inference: the 30 s windows of the requests
+# running in the thread pool share encoder and decoder batches.
+WHISPER_BATCH_SIZE = int(os.environ.get("WHISPER_BATCH_SIZE", "0"))
+
+# The audio decoded from uploads is kept in AUDIO_CACHE_DIR, if set, within AUDIO_CACHE_MB.
+pool = TranscriptionPool(
+    WHISPER_MODEL,
+    kind=os.environ.get("WHISPER_POOL", "thread"),
+    max_workers=int(os.environ.get("WHISPER_WORKERS", "1")),
+    max_model_bytes=int(os.environ.get("WHISPER_MODEL_MEMORY_MB", "2048")) * 1024 * 1024,
+    max_batch_size=WHISPER_BATCH_SIZE,
+    max_batch_wait=float(os.environ.get("WHISPER_BATCH_WAIT_MS", "50")) / 1000,
+    audio_cache_dir=os.environ.get("AUDIO_CACHE_DIR"),
+    audio_cache_bytes=int(os.environ.get("AUDIO_CACHE_MB", "4096")) * 1024 * 1024,
+    device="cpu",
+    compute_type="int8",
+)
 
-def format_time_srt(seconds: float) -> str:
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millisecs = int((seconds % 1) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millisecs:03d}"
 
+# Computations shared by identical requests read the uploads from links they own.
+shared_uploads = SharedUploads()
 
-@app.post("/transcribe")
-async def transcribe(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp:
-        tmp.write(await file.read())
-        input_path = tmp.name
+# Transcripts are cached by media hash and options, in memory and optionally on disk.
+transcript_cache = TranscriptCache(
+    max_memory_bytes=int(os.environ.get("TRANSCRIPT_CACHE_MB", "64")) * 1024 * 1024,
+    cache_dir=os.environ.get("TRANSCRIPT_CACHE_DIR"),
+    max_disk_bytes=int(os.environ.get("TRANSCRIPT_CACHE_DISK_MB", "1024")) * 1024 * 1024,
+)
 
-    try:
-        segments, info = model.transcribe(input_path)
-        segments_list = list(segments)
-        transcript = "\n".join([seg.text for seg in segments_list])
 
-        return {
-            "language": info.language,
-            "transcript": transcript,
-            "segments": [
-                {"start": seg.start, "end": seg.end, "text": seg.text.strip()}
-                for seg in segments_list
-            ]
-        }
-    finally:
-        if os.path.exists(input_path):
-            os.unlink(input_path)
+# Media uploaded once to /assets and referenced by ID from the other endpoints.
+asset_store = AssetStore(
+    os.environ.get("ASSET_DIR", os.path.join(tempfile.gettempdir(), "whisper-assets")),
+    ttl=float(os.environ.get("ASSET_TTL", "3600")),
+    max_disk_bytes=int(os.environ.get("ASSET_QUOTA_MB", "10240")) * 1024 * 1024,
+)
 
 
-@app.post("/transcribe-with-words")
-async def transcribe_with_words(file: UploadFile = File(...)):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tmp:
-        tmp.write(await file.read())
-        input_path = tmp.name
+# ffmpeg renders run in their own working directories, RENDER_SLOTS encoding at a time
+# (half the cores, up to 4, by default) and sharing the cores.
+render_pool = RenderPool(
+    max_renders=int(os.environ["RENDER_SLOTS"]) if "RENDER_SLOTS" in os.environ else None,
+    root=os.environ.get("RENDER_DIR"),
+)
 
-    try:
-        segments, info = model.transcribe(input_path, word_timestamps=True)
-        segments_list = list(segments)
-
-        word_segments = []
-        full_transcript = ""
-
-        for segment in segments_list:
-            if hasattr(segment, "words") and segment.words:
-                segment_words = []
-                for word in segment.words:
-                    word_data = {
-                        "word": word.word,
-                        "start": word.start,
-                        "end": word.end,
-                        "probability": word.probability
-                    }
-                    segment_words.append(word_data)
-                    full_transcript += word.word + " "
-
-                word_segments.append({
-                    "segment_start": segment.start,
-                    "segment_end": segment.end,
-                    "segment_text": segment.text.strip(),
-                    "words": segment_words
-                })
+# Full renders use the slowest x264 preset, up to RENDER_MAX_PRESET, expected to finish
+# within their deadline. The presets are measured at startup unless RENDER_CALIBRATE=false.
+preset_selector = PresetSelector(os.environ.get("RENDER_MAX_PRESET", "medium"))
+
+# Rendered videos are kept and reused for identical exports, within RENDER_CACHE_MB, and
+# served from there until they are not downloaded for RENDER_CACHE_TTL seconds.
+render_cache = RenderCache(
+    os.environ.get(
+        "RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "whisper-renders")
+    ),
+    max_disk_bytes=int(os.environ.get("RENDER_CACHE_MB", "5120")) * 1024 * 1024,
+    ttl=float(os.environ.get("RENDER_CACHE_TTL", "86400")),
+)
+
+
+# Long transcriptions and renders can run as background jobs polled by ID.
+jobs = JobManager(ttl=float(os.environ.get("JOB_TTL", "3600")))
+
+
+@app.on_event("startup")
+async def calibrate_presets():
+    async def calibrate():
+        try:
+            await preset_selector.calibrate(render_pool)
+        except RenderError as e:
+            print(f"Preset calibration failed, using the default throughputs: {e}")
+
+    if os.environ.get("RENDER_CALIBRATE", "true").lower() == "true":
+        # Renders started meanwhile use the default throughputs.
+        asyncio.ensure_future(calibrate())
+
+
+@app.on_event("shutdown")
+def shutdown_pool():
+    pool.shutdown(wait=False)
+
+
+def resolve_model(model: Optional[str], language: Optional[str]) -> str:
+    """Returns the model serving a request, routing known English audio to .en models."""
+    name = MODEL_TIERS.get(model, model) if model else WHISPER_MODEL
+    if name != WHISPER_MODEL and name not in available_models():
+        raise HTTPException(status_code=400, detail=f"Unknown model: {model}")
+    if ROUTE_ENGLISH:
+        name = route_model(name, language)
+    return name
+
+
+def model_selection(
+    model: Optional[str] = Form(None),
+    language: Optional[str] = Form(None),
+) -> dict:
+    """Transcription options selecting the model, shared by the form endpoints."""
+    return {"model_name": resolve_model(model, language), "language": language}
+
+
+def time_range(
+    startTime: Optional[float] = Form(None),
+    endTime: Optional[float] = Form(None),
+) -> dict:
+    """Transcription options restricting the part of the media that is decoded."""
+    if (startTime is not None and startTime < 0) or (
+        endTime is not None and endTime < (startTime or 0)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid startTime/endTime range")
+
+    options = {}
+    if startTime is not None:
+        options["start_time"] = startTime
+    if endTime is not None:
+        options["end_time"] = endTime
+    return options
+
+
+def model_selection_query(
+    model: Optional[str] = Query(None),
+    language: Optional[str] = Query(None),
+) -> dict:
+    return {"model_name": resolve_model(model, language), "language": language}
+
+
+async def media_digest_of(audio, asset) -> str:
+    """Hash of a media path, waveform or asset, which its cached transcripts are keyed by."""
+    if asset is not None:
+        return asset.asset_id
+    elif isinstance(audio, str):
+        return await file_digest(audio)
+    return audio_digest(audio)
+
+
+def transcript_cache_key(media_digest: str, options: dict) -> str:
+    if WHISPER_BATCH_SIZE:
+        # The batched pipeline segments the audio differently.
+        options = dict(options, batched=True)
+    return transcript_key(media_digest, options)
+
+
+async def cached_transcribe(audio, asset=None, progress=None, **options):
+    """Transcribes a media path or waveform, reusing the result of identical requests.
+
+    When the media is a stored asset, its decoded audio and transcript are kept with it.
+    `progress(fraction)` is called as segments are decoded.
+    """
+    media_digest = await media_digest_of(audio, asset)
+    key = transcript_cache_key(media_digest, options)
+    shared = contextlib.ExitStack()
+    if asset is None and isinstance(audio, str):
+        # The transcription is shared with the identical requests, it must not read the
+        # upload of this one, which is removed if this request ends first.
+        audio = shared.enter_context(shared_uploads.share(audio, media_digest))
+        # The workers name the cached audio of the file by its hash, already computed.
+        options = dict(options, media_digest=media_digest)
+
+    async def transcribe_with_progress(fn, *args):
+        segments_list, info = [], None
+        async for item in pool.stream(fn, *args, **options):
+            if info is None:
+                info = item
+                continue
+            segments_list.append(item)
+            if info.duration:
+                progress(item.end / info.duration)
+        return segments_list, info
+
+    async def compute():
+        if asset is None:
+            if progress is not None:
+                return await transcribe_with_progress(iter_transcription, audio)
+            return await pool.transcribe(audio, **options)
+
+        result = await asyncio.to_thread(asset_store.load_transcript, asset, key)
+        if result is None:
+            media = (asset.media_path, asset.audio_path)
+            if progress is not None:
+                result = await transcribe_with_progress(iter_media_transcription, *media)
             else:
-                word_segments.append({
-                    "segment_start": segment.start,
-                    "segment_end": segment.end,
-                    "segment_text": segment.text.strip(),
-                    "words": []
-                })
+                result = await pool.run(transcribe_media, *media, **options)
+            await asyncio.to_thread(asset_store.save_transcript, asset, key, result)
+        return result
 
-        return {
-            "language": info.language,
-            "transcript": full_transcript.strip(),
-            "segments": [
-                {"start": seg.start, "end": seg.end, "text": seg.text.strip()}
-                for seg in segments_list
-            ],
-            "word_segments": word_segments
-        }
+    with shared:
+        return await transcript_cache.get_or_compute(key, compute)
+
+
+@contextlib.asynccontextmanager
+async def media_input(file: Optional[UploadFile], asset_id: Optional[str]):
+    """Yields the media path and asset of a request given an upload or an asset ID."""
+    if asset_id:
+        if asset_store.get(asset_id) is None:
+            raise HTTPException(status_code=404, detail=f"Unknown asset: {asset_id}")
+        with asset_store.lease(asset_id) as asset:
+            yield asset.media_path, asset
+        return
+
+    if file is None:
+        raise HTTPException(status_code=400, detail="Either file or asset_id is required")
+
+    input_path = await save_upload(file, suffix=".mp4")
+    try:
+        yield input_path, None
     finally:
         if os.path.exists(input_path):
             os.unlink(input_path)
 
 
-@app.post("/create-advanced-word-karaoke")
-async def create_advanced_word_karaoke(
-    file: UploadFile = File(...),
+@app.post("/assets")
+async def upload_asset(file: UploadFile = File(...)):
+    asset = await asset_store.add(file)
+    return {
+        "asset_id": asset.asset_id,
+        "filename": asset.filename,
+        "size": asset.size,
+        "expires_in": asset_store.ttl,
+    }
+
+
+@app.get("/assets/{asset_id}")
+async def get_asset(asset_id: str):
+    asset = asset_store.get(asset_id)
+    if asset is None:
+        raise HTTPException(status_code=404, detail=f"Unknown asset: {asset_id}")
+    return {
+        "asset_id": asset.asset_id,
+        "filename": asset.filename,
+        "size": asset.size,
+        "created": asset.created,
+        "has_audio": os.path.exists(asset.audio_path),
+    }
+
+
+@app.delete("/assets/{asset_id}")
+async def delete_asset(asset_id: str):
+    if not asset_store.delete(asset_id):
+        raise HTTPException(status_code=404, detail=f"Unknown or busy asset: {asset_id}")
+    return {"deleted": asset_id}
+
+
+def transcript_response(segments_list, info) -> dict:
+    transcript = "\n".join([seg.text for seg in segments_list])
+
+    return {
+        "language": info.language,
+        "transcript": transcript,
+        "segments": [
+            {"start": seg.start, "end": seg.end, "text": seg.text.strip()}
+            for seg in segments_list
+        ]
+    }
+
+
+def word_transcript_response(segments_list, info) -> dict:
+    word_segments = []
+    full_transcript = ""
+
+    for segment in segments_list:
+        if hasattr(segment, "words") and segment.words:
+            segment_words = []
+            for word in segment.words:
+                word_data = {
+                    "word": word.word,
+                    "start": word.start,
+                    "end": word.end,
+                    "probability": word.probability
+                }
+                segment_words.append(word_data)
+                full_transcript += word.word + " "
+
+            word_segments.append({
+                "segment_start": segment.start,
+                "segment_end": segment.end,
+                "segment_text": segment.text.strip(),
+                "words": segment_words
+            })
+        else:
+            word_segments.append({
+                "segment_start": segment.start,
+                "segment_end": segment.end,
+                "segment_text": segment.text.strip(),
+                "words": []
+            })
+
+    return {
+        "language": info.language,
+        "transcript": full_transcript.strip(),
+        "segments": [
+            {"start": seg.start, "end": seg.end, "text": seg.text.strip()}
+            for seg in segments_list
+        ],
+        "word_segments": word_segments
+    }
+
+
+@app.post("/transcribe")
+async def transcribe(
+    file: Optional[UploadFile] = File(None),
+    asset_id: Optional[str] = Form(None),
+    selection: dict = Depends(model_selection),
+    window: dict = Depends(time_range),
+):
+    async with media_input(file, asset_id) as (input_path, asset):
+        segments_list, info = await cached_transcribe(
+            input_path, asset=asset, word_timestamps=False, **selection, **window
+        )
+        return transcript_response(segments_list, info)
+
+
+@app.post("/transcribe-with-words")
+async def transcribe_with_words(
+    file: Optional[UploadFile] = File(None),
+    asset_id: Optional[str] = Form(None),
+    selection: dict = Depends(model_selection),
+    window: dict = Depends(time_range),
+):
+    async with media_input(file, asset_id) as (input_path, asset):
+        segments_list, info = await cached_transcribe(
+            input_path, asset=asset, word_timestamps=True, **selection, **window
+        )
+        return word_transcript_response(segments_list, info)
+
+
+@app.post("/transcribe-stream")
+async def transcribe_stream(
+    request: Request,
+    word_timestamps: bool = False,
+    selection: dict = Depends(model_selection_query),
+):
+    """Transcribes a raw media request body (not multipart).
+
+    The audio is decoded while the body is still being received, so the upload is never
+    held in memory. Streamable containers (MP3, WAV, WebM, faststart MP4) are decoded on
+    the fly, other files are decoded from a spooled copy once the upload completes.
+    """
+    audio = await decode_stream(request.stream())
+    segments_list, info = await cached_transcribe(
+        audio, word_timestamps=word_timestamps, **selection
+    )
+
+    if word_timestamps:
+        return word_transcript_response(segments_list, info)
+    return transcript_response(segments_list, info)
+
+
+SUBTITLE_MEDIA_TYPES = {
+    "srt": "application/x-subrip",
+    "vtt": "text/vtt",
+    "ass": "text/x-ssa",
+    "jsonl": "application/x-ndjson",
+}
+
+
+@app.post("/subtitles")
+async def download_subtitles(
+    file: Optional[UploadFile] = File(None),
+    asset_id: Optional[str] = Form(None),
+    format: str = Form("srt"),
+    word_timestamps: bool = Form(False),
+    selection: dict = Depends(model_selection),
+):
+    """Downloads the transcript as SRT, WebVTT, ASS or JSON Lines subtitles.
+
+    The transcript comes from the transcript cache, or from the asset, when the media
+    was already transcribed with the same options, so only the subtitles are written.
+    """
+    if format not in SUBTITLE_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"format must be one of {', '.join(SUBTITLE_FORMATS)}"
+        )
+
+    async with media_input(file, asset_id) as (input_path, asset):
+        filename = asset.filename if asset is not None else file.filename
+        segments_list, info = await cached_transcribe(
+            input_path, asset=asset, word_timestamps=word_timestamps, **selection
+        )
+
+    download_name = f"{os.path.splitext(filename)[0]}.{format}"
+    return StreamingResponse(
+        iter_subtitles(segments_list, format),
+        media_type=SUBTITLE_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename={download_name}"},
+    )
+
+
+# "auto" renders long videos in parallel chunks when several render slots are available.
+# "smart" stream copies the spans of H.264 videos without subtitles, when the encoder
+# produces the same H.264 parameters, and encodes the whole video otherwise.
+# "preview" quickly renders a short low resolution excerpt to check a style.
+# "soft" and "soft-mp4" copy the video and add the subtitles as a stream instead of
+# burning them in: ASS in Matroska keeps the styling, mov_text in MP4 keeps the text and
+# the highlight colors.
+RENDER_MODES = ("auto", "single", "smart", "segmented", "preview", "soft", "soft-mp4")
+PREVIEW_MAX_SECONDS = 30.0
+# libx264 needs an even height with 4:2:0 chroma subsampling.
+PREVIEW_MIN_HEIGHT = 144
+PREVIEW_MAX_HEIGHT = 1080
+# Full renders, which later edits of the same video are spliced into.
+INCREMENTAL_MODES = ("auto", "single", "smart", "segmented")
+SOFT_SUBTITLE_CODECS = {"soft": ("ass", ".mkv"), "soft-mp4": ("mov_text", ".mp4")}
+OUTPUT_MEDIA_TYPES = {".mp4": "video/mp4", ".mkv": "video/x-matroska"}
+
+
+def output_filename(filename: str, output_path: str) -> str:
+    """Name of a karaoke download, with the extension of the rendered container."""
+    suffix = os.path.splitext(output_path)[1]
+    if suffix != ".mp4":
+        filename = os.path.splitext(filename)[0] + suffix
+    return f"advanced_word_karaoke_{filename}"
+
+
+def karaoke_options(
     fontFamily: Optional[str] = Form("Roboto"),
     fontSize: Optional[str] = Form("20"),
     textColor: Optional[str] = Form("#FFFFFF"),
@@ -126,115 +488,879 @@ async def create_advanced_word_karaoke(
     boxPaddingLeftRight: Optional[str] = Form("3"),
     selectedStyle: Optional[str] = Form("CORP"),
     windowSize: Optional[str] = Form("6"),
-    editedWordSegments: Optional[str] = Form(None)
-):
-    input_path = None
-    subtitle_file = None
-    output_path = None
+    editedWordSegments: Optional[str] = Form(None),
+    renderMode: Optional[str] = Form("auto"),
+    karaokeEffect: Optional[str] = Form("color"),
+    previewStart: Optional[str] = Form("0"),
+    previewDuration: Optional[str] = Form("10"),
+    previewHeight: Optional[str] = Form("360"),
+    renderTier: Optional[str] = Form("standard"),
+    renderDeadline: Optional[str] = Form(None),
+    selection: dict = Depends(model_selection),
+) -> dict:
+    return dict(
+        transcription=selection,
+        fontFamily=fontFamily,
+        fontSize=fontSize,
+        textColor=textColor,
+        useStroke=useStroke,
+        strokeWidth=strokeWidth,
+        strokeColor=strokeColor,
+        backgroundColor=backgroundColor,
+        borderColor=borderColor,
+        highlightColor=highlightColor,
+        boxPaddingLeftRight=boxPaddingLeftRight,
+        selectedStyle=selectedStyle,
+        windowSize=windowSize,
+        editedWordSegments=editedWordSegments,
+        renderMode=renderMode,
+        karaokeEffect=karaokeEffect,
+        previewStart=previewStart,
+        previewDuration=previewDuration,
+        previewHeight=previewHeight,
+        renderTier=renderTier,
+        renderDeadline=renderDeadline,
+    )
+
+
+# Deadline of the encode as a multiple of the video duration, None for no deadline. The
+# preset is chosen to meet it, see PresetSelector.
+RENDER_TIERS = {"interactive": 0.5, "standard": 2.0, "quality": None}
+MIN_RENDER_DEADLINE = 30.0
+
+
+def render_deadline(options: dict, duration: float, timeout: Optional[float]):
+    """Seconds the encode may take, from renderDeadline or from the tier.
+
+    Requests waiting for their render also have to finish before `timeout`.
+    """
+    tier = options["renderTier"]
+    if tier not in RENDER_TIERS:
+        raise RenderError(f"Unknown render tier: {tier}")
+
+    if options["renderDeadline"]:
+        deadline = float(options["renderDeadline"])
+    elif RENDER_TIERS[tier] is not None:
+        deadline = max(RENDER_TIERS[tier] * duration, MIN_RENDER_DEADLINE)
+    else:
+        deadline = None
 
-    try:
-        print(f"Creating advanced word karaoke for: {file.filename}")
-        print(f"Selected Style: {selectedStyle}")
-        print(f"Font: {fontFamily}, Size: {fontSize}px")
-        print(f"Text Color: {textColor}, Highlight Color: {highlightColor}")
-        print(f"Window Size: {windowSize} words")
-
-        input_path = f"advanced_input_{os.getpid()}.mp4"
-        with open(input_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-
-        if editedWordSegments and editedWordSegments != "null":
-            print("Using edited word segments from frontend")
-            word_segments_data = json.loads(editedWordSegments)
-
-            class EditedWord:
-                def __init__(self, word, start, end):
-                    self.word = word
-                    self.start = start
-                    self.end = end
-
-            class EditedSegment:
-                def __init__(self, words):
-                    self.words = [EditedWord(w["word"], w["start"], w["end"]) for w in words]
-
-            segments_list = [EditedSegment(seg["words"]) for seg in word_segments_data if seg.get("words")]
-        else:
-            print("No edits provided, transcribing from scratch")
-            segments, info = model.transcribe(input_path, word_timestamps=True)
-            segments_list = list(segments)
-
-        if not segments_list:
-            return {"error": "No speech detected"}
-
-        subtitle_file = f"advanced_subs_{os.getpid()}.ass"
-
-        ass_content = create_word_level_ass_with_color_changes(
-            segments_list,
-            fontFamily,
-            int(fontSize),
-            textColor,
-            useStroke.lower() == "true",
-            strokeColor,
-            float(strokeWidth),
-            backgroundColor,
-            borderColor,
-            highlightColor,
-            int(boxPaddingLeftRight),
-            int(windowSize)
+    if timeout is not None:
+        deadline = timeout if deadline is None else min(deadline, timeout)
+    return deadline
+
+
+async def choose_preset(
+    input_path, options: dict, timeout, outputs: int = 1, parallel: bool = False
+):
+    """Returns the x264 preset meeting the deadline of the render and the video probed.
+
+    `parallel` is True when the video is encoded in chunks by parallel processes.
+    """
+    video = await asyncio.to_thread(probe_video, input_path)
+    if video is None:
+        return preset_selector.presets[-1], None
+
+    deadline = render_deadline(options, video.duration, timeout)
+    threads = render_threads(render_pool, video.duration, parallel)
+    preset = preset_selector.select(video.pixels * outputs, threads, deadline)
+    print(f"Encoder preset: {preset}, deadline: {deadline}")
+    return preset, video
+
+
+async def karaoke_segments(input_path, asset, options: dict, report):
+    """Returns the segments to caption, edited or transcribed, and the progress so far."""
+    editedWordSegments = options["editedWordSegments"]
+    if editedWordSegments and editedWordSegments != "null":
+        print("Using edited word segments from frontend")
+        word_segments_data = json.loads(editedWordSegments)
+
+        class EditedWord:
+            def __init__(self, word, start, end):
+                self.word = word
+                self.start = start
+                self.end = end
+
+        class EditedSegment:
+            def __init__(self, words):
+                self.words = [EditedWord(w["word"], w["start"], w["end"]) for w in words]
+
+        segments_list = [EditedSegment(seg["words"]) for seg in word_segments_data if seg.get("words")]
+        render_start = 0.0
+    else:
+        print("No edits provided, transcribing from scratch")
+        report(0.0, "transcribing")
+        segments_list, info = await cached_transcribe(
+            input_path,
+            asset=asset,
+            progress=lambda fraction: report(fraction * 0.5, "transcribing"),
+            word_timestamps=True,
+            **options["transcription"],
         )
+        render_start = 0.5
 
-        with open(subtitle_file, "w", encoding="utf-8") as f:
-            f.write(ass_content)
+    if not segments_list:
+        raise RenderError("No speech detected")
+    return segments_list, render_start
 
-        print("ASS Subtitle file created successfully")
 
-        output_path = f"advanced_output_{os.getpid()}.mp4"
-        ffmpeg_path = "ffmpeg"
+def karaoke_ass(segments_list, options: dict) -> str:
+    """Generates the karaoke subtitles of the style options."""
+    # "color" repeats the window for every word with the active one highlighted, "k" and
+    # "kf" write one event per window with karaoke timing tags.
+    karaoke_effect = options["karaokeEffect"]
+    if karaoke_effect not in ("color", "k", "kf"):
+        raise RenderError(f"Unknown karaoke effect: {karaoke_effect}")
 
-        subtitle_path_escaped = subtitle_file.replace("\\", "/").replace(":", "\\:")
+    if karaoke_effect == "color":
+        generate_ass = create_word_level_ass_with_color_changes
+    else:
+        generate_ass = functools.partial(
+            create_word_level_ass_with_k_tags, fill=karaoke_effect == "kf"
+        )
 
-        command = [
-            ffmpeg_path,
-            "-i", input_path,
-            "-vf", f"ass={subtitle_path_escaped}",
-            "-c:v", "libx264",
-            "-preset", "medium",
-            "-crf", "20",
-            "-c:a", "copy",
-            "-y", output_path
+    ass_content = generate_ass(
+        segments_list,
+        options["fontFamily"],
+        int(options["fontSize"]),
+        options["textColor"],
+        options["useStroke"].lower() == "true",
+        options["strokeColor"],
+        float(options["strokeWidth"]),
+        options["backgroundColor"],
+        options["borderColor"],
+        options["highlightColor"],
+        int(options["boxPaddingLeftRight"]),
+        int(options["windowSize"])
+    )
+    print("ASS Subtitle file created successfully")
+    return ass_content
+
+
+async def render_karaoke(
+    input_path, asset, options: dict, progress=None, timeout=900, on_output=None
+) -> str:
+    """Transcribes if needed, burns the karaoke subtitles in and returns the output path.
+
+    `progress(fraction, message)` is called on the event loop while the render advances.
+    With `on_output`, MP4 outputs are written as fragmented MP4 in a single pass and
+    `on_output(path)` is called when ffmpeg starts writing them, so they can be streamed
+    while they grow. It is not called if the render comes from the cache.
+    """
+    def report(fraction, message):
+        if progress is not None:
+            progress(fraction, message)
+
+    render_mode = options["renderMode"]
+    if render_mode not in RENDER_MODES:
+        raise RenderError(f"Unknown render mode: {render_mode}")
+    if render_mode == "soft-mp4" and options["karaokeEffect"] in ("k", "kf"):
+        # mov_text has no karaoke timing tags, the words would not be highlighted at all.
+        # The "color" events keep the highlight as a color change of the active word.
+        print("Karaoke tags are not supported by mov_text, using the color effect")
+        options = dict(options, karaokeEffect="color")
+
+    segments_list, render_start = await karaoke_segments(input_path, asset, options, report)
+    ass_content = karaoke_ass(segments_list, options)
+
+    # A fragmented MP4 can be played while it is written, the other MP4 outputs have
+    # their index moved to the front once complete so players can start downloading.
+    streamed = on_output is not None and render_mode != "soft"
+    # Long videos are cut on keyframes and the chunks rendered by parallel processes.
+    parallel = not streamed and (
+        render_mode == "segmented" or (render_mode == "auto" and render_pool.max_renders > 1)
+    )
+
+    video = None
+    preset = None
+    if render_mode == "preview":
+        preset = "ultrafast"
+        settings = {
+            "vcodec": "libx264",
+            "preset": preset,
+            "crf": 28,
+            "start": max(float(options["previewStart"]), 0.0),
+            "duration": min(max(float(options["previewDuration"]), 1.0), PREVIEW_MAX_SECONDS),
+            "height": min(
+                max(int(options["previewHeight"]), PREVIEW_MIN_HEIGHT), PREVIEW_MAX_HEIGHT
+            ) // 2 * 2,
+        }
+    elif render_mode in SOFT_SUBTITLE_CODECS:
+        settings = {"vcodec": "copy", "scodec": SOFT_SUBTITLE_CODECS[render_mode][0]}
+    else:
+        # The preset depends on the load and on the measured throughputs, so renders are
+        # keyed by their tier: repeated exports find the previous render in the cache.
+        preset, video = await choose_preset(input_path, options, timeout, parallel=parallel)
+        settings = {"vcodec": "libx264", "crf": 20, "tier": options["renderTier"]}
+
+    if render_mode != "soft":
+        settings["movflags"] = (
+            "frag_keyframe+empty_moov+default_base_moof" if streamed else "+faststart"
+        )
+    incremental = render_mode in INCREMENTAL_MODES and not streamed
+
+    encoder_args = ["-c:v", settings["vcodec"]]
+    if settings["vcodec"] != "copy":
+        encoder_args += [
+            "-preset", preset,
+            "-crf", str(settings["crf"]),
+            "-threads", "0",
         ]
+    media_digest = asset.asset_id if asset is not None else await file_digest(input_path)
+
+    def on_progress(fraction):
+        report(render_start + fraction * (1.0 - render_start), "rendering")
+
+    # The latest full render of the same media and settings, reused after edits.
+    base_key = render_key(media_digest, "", settings)
+    previous = None
+    if incremental:
+        previous = await asyncio.to_thread(render_cache.previous_render, base_key)
+
+    async def render(output_path):
+        duration = await asyncio.to_thread(probe_duration, input_path)
+        report(render_start, "rendering")
+
+        if previous is not None and duration:
+            previous_path, previous_ass = previous
+            changed = changed_events(previous_ass, ass_content)
+            if changed is not None:
+                # Only the groups of pictures whose subtitles changed are encoded again,
+                # the others are copied from the previous render.
+                keyframes = await asyncio.to_thread(keyframe_times, previous_path)
+                chunks = [
+                    chunk if chunk.encode else chunk._replace(source=previous_path)
+                    for chunk in plan_smart_chunks(keyframes, duration, changed)
+                ]
+                if any(not chunk.encode for chunk in chunks) and await can_copy_chunks(
+                    render_pool, previous_path, encoder_args, timeout
+                ):
+                    print(f"Re-rendering {sum(c.encode for c in chunks)} edited chunks...")
+                    try:
+                        await render_segmented(
+                            render_pool,
+                            input_path,
+                            ass_content,
+                            encoder_args,
+                            output_path,
+                            duration,
+                            chunks,
+                            on_progress,
+                            timeout,
+                            output_args=["-movflags", settings["movflags"]],
+                        )
+                        return
+                    except RenderError as e:
+                        print(f"Incremental render failed, rendering the whole video: {e}")
+
+        if render_mode in SOFT_SUBTITLE_CODECS:
+            # A remux: the streams are copied and the subtitles added as a new stream.
+            with render_pool.workdir() as workdir:
+                with open(os.path.join(workdir, "subtitles.ass"), "w", encoding="utf-8") as f:
+                    f.write(ass_content)
+
+                command = [
+                    "-i", os.path.abspath(input_path),
+                    "-i", "subtitles.ass",
+                    "-map", "0:v", "-map", "0:a?", "-map", "1:s",
+                    *encoder_args,
+                    "-c:a", "copy",
+                    "-c:s", settings["scodec"],
+                    "-disposition:s:0", "default",
+                    *(["-movflags", settings["movflags"]] if "movflags" in settings else []),
+                    output_path
+                ]
+                if streamed:
+                    on_output(output_path)
+
+                print("Running FFmpeg remux...")
+                await render_pool.run(
+                    command, workdir, duration, on_progress, timeout, cpu_bound=False
+                )
+            return
+
+        keyframes = None
+        if duration and render_mode in ("auto", "smart", "segmented") and not streamed:
+            keyframes = await asyncio.to_thread(keyframe_times, input_path)
+
+        # Only the groups of pictures showing subtitles are encoded, the others copied.
+        chunks = None
+        if keyframes and render_mode == "smart":
+            if await asyncio.to_thread(video_format, input_path) == COPYABLE_VIDEO:
+                events = ass_events(ass_content)
+                smart_chunks = plan_smart_chunks(keyframes, duration, events)
+                # The copied chunks must have the H.264 parameters of the encoder output,
+                # otherwise the whole video is encoded right away.
+                if any(not chunk.encode for chunk in smart_chunks) and await can_copy_chunks(
+                    render_pool, input_path, encoder_args, timeout
+                ):
+                    chunks = smart_chunks
+
+        if chunks is None and keyframes and parallel:
+            chunks = plan_chunks(keyframes, duration, max(render_pool.max_renders, 2))
+
+        if chunks is not None and len(chunks) > 1:
+            copied = sum(1 for chunk in chunks if not chunk.encode)
+            print(f"Running FFmpeg on {len(chunks)} chunks, {copied} copied...")
+            try:
+                await render_segmented(
+                    render_pool,
+                    input_path,
+                    ass_content,
+                    encoder_args,
+                    output_path,
+                    duration,
+                    chunks,
+                    on_progress,
+                    timeout,
+                    output_args=["-movflags", settings["movflags"]],
+                )
+                return
+            except RenderError as e:
+                if not copied:
+                    raise
+                # Copying depends on the source stream, encode the whole video instead.
+                print(f"Smart render failed, encoding the whole video: {e}")
+
+        with render_pool.workdir() as workdir:
+            subtitles = ass_content
+            video_filter = "ass=subtitles.ass"
+            input_args = []
+            if render_mode == "preview":
+                # Only the excerpt is decoded, scaled down before the subtitles are drawn.
+                start, length = settings["start"], settings["duration"]
+                subtitles = shift_ass(ass_content, start, start + length)
+                video_filter = f"scale=-2:{settings['height']},{video_filter}"
+                input_args = ["-ss", f"{start:.3f}", "-t", f"{length:.3f}"]
+                duration = min(length, duration - start) if duration else length
+
+            with open(os.path.join(workdir, "subtitles.ass"), "w", encoding="utf-8") as f:
+                f.write(subtitles)
+
+            # ffmpeg runs in the working directory, the subtitles need no path escaping.
+            command = [
+                *input_args,
+                "-i", os.path.abspath(input_path),
+                "-vf", video_filter,
+                *encoder_args,
+                "-c:a", "copy",
+                "-movflags", settings["movflags"],
+                output_path
+            ]
+            if streamed:
+                on_output(output_path)
 
-        print("Running FFmpeg...")
-        result = subprocess.run(" ".join(command), shell=True, capture_output=True, text=True, timeout=900)
-
-        if result.returncode != 0:
-            print(f"FFmpeg error: {result.stderr[-1000:]}")
-            return {"error": f"FFmpeg processing failed: {result.stderr[-500:]}"}
+            print("Running FFmpeg...")
+            elapsed = await render_pool.run(command, workdir, duration, on_progress, timeout)
+            if video is not None:
+                preset_selector.record(preset, video.pixels, elapsed.threads, elapsed.seconds)
 
         if not os.path.exists(output_path) or os.path.getsize(output_path) < 1000:
-            return {"error": "Output file not created or too small"}
+            raise RenderError("Output file not created or too small")
+
+    # Identical exports of the same media are served from the render cache.
+    key = render_key(media_digest, ass_content, settings)
+    suffix = SOFT_SUBTITLE_CODECS.get(render_mode, (None, ".mp4"))[1]
+    with contextlib.ExitStack() as shared:
+        if asset is None:
+            # The render is shared with the identical requests, it must not read the
+            # upload of this one, which is removed if this request ends first.
+            # render() reads input_path when it runs.
+            input_path = shared.enter_context(shared_uploads.share(input_path, media_digest))
+        output_path = await render_cache.get_or_render(key, render, suffix)
+    if incremental:
+        await asyncio.to_thread(render_cache.record_render, base_key, key, ass_content)
+    return output_path
+
+
+# Style options each variant of /create-karaoke-variants can set, over the form fields.
+VARIANT_OPTIONS = (
+    "fontFamily",
+    "fontSize",
+    "textColor",
+    "useStroke",
+    "strokeWidth",
+    "strokeColor",
+    "backgroundColor",
+    "borderColor",
+    "highlightColor",
+    "boxPaddingLeftRight",
+    "windowSize",
+    "karaokeEffect",
+    "aspectRatio",
+)
+MAX_VARIANTS = 4
+
+
+def parse_aspect_ratio(value: str):
+    try:
+        width, height = (int(part) for part in value.split(":"))
+    except ValueError:
+        raise RenderError(f"Invalid aspect ratio: {value}")
+    if width <= 0 or height <= 0:
+        raise RenderError(f"Invalid aspect ratio: {value}")
+    return width, height
+
+
+async def render_karaoke_variants(
+    input_path, asset, options: dict, variants: list, progress=None, timeout=900
+) -> list:
+    """Renders the media in several styles with a single decode, returns the output paths.
+
+    Every variant is a dict of VARIANT_OPTIONS overriding `options`. ffmpeg decodes the
+    input once and splits the frames into one crop, burn-in and encode per variant.
+    Variants already in the render cache are not rendered again.
+    """
+    def report(fraction, message):
+        if progress is not None:
+            progress(fraction, message)
+
+    segments_list, render_start = await karaoke_segments(input_path, asset, options, report)
+
+    # The settings of a full render, so a variant without aspect ratio is the same
+    # cache entry as a single export of its style. All the variants are encoded together,
+    # with a preset that can be faster than the one of a single export, which is why the
+    # preset is not part of the cache key.
+    preset, video = await choose_preset(input_path, options, timeout, outputs=len(variants))
+    settings = {
+        "vcodec": "libx264",
+        "crf": 20,
+        "tier": options["renderTier"],
+        "movflags": "+faststart",
+    }
+    encoder_args = [
+        "-c:v", settings["vcodec"],
+        "-preset", preset,
+        "-crf", str(settings["crf"]),
+        "-threads", "0",
+    ]
+    media_digest = asset.asset_id if asset is not None else await file_digest(input_path)
+
+    keys = []
+    variant_renders = {}
+    for variant in variants:
+        unknown = sorted(set(variant) - set(VARIANT_OPTIONS))
+        if unknown:
+            raise RenderError(f"Unknown variant options: {', '.join(unknown)}")
+        variant_options = dict(options, **{name: str(value) for name, value in variant.items()})
+        ass_content = karaoke_ass(segments_list, variant_options)
+
+        variant_settings = settings
+        filters = []
+        if variant_options.get("aspectRatio"):
+            width, height = parse_aspect_ratio(variant_options["aspectRatio"])
+            variant_settings = dict(settings, aspectRatio=f"{width}:{height}")
+            # A centered crop with even dimensions. The subtitles keep their size
+            # relative to the height of the frame.
+            filters.append(
+                f"crop=w='trunc(min(iw,ih*{width}/{height})/2)*2'"
+                f":h='trunc(min(ih,iw*{height}/{width})/2)*2'"
+            )
+            ass_content = ass_content.replace(
+                "PlayResX: 1920", f"PlayResX: {round(1080 * width / height)}", 1
+            )
+
+        key = render_key(media_digest, ass_content, variant_settings)
+        keys.append(key)
+        variant_renders[render_cache.path(key, ".partial.mp4")] = (ass_content, filters)
+
+    async def render(output_paths):
+        duration = await asyncio.to_thread(probe_duration, input_path)
+        report(render_start, "rendering")
+
+        with render_pool.workdir() as workdir:
+            split = f"[0:v]split={len(output_paths)}"
+            branches, outputs = [], []
+            for i, output_path in enumerate(output_paths):
+                ass_content, filters = variant_renders[output_path]
+                subtitles = f"variant-{i}.ass"
+                with open(os.path.join(workdir, subtitles), "w", encoding="utf-8") as f:
+                    f.write(ass_content)
+
+                split += f"[v{i}]"
+                branches.append(f"[v{i}]{','.join(filters + ['ass=' + subtitles])}[out{i}]")
+                outputs += [
+                    "-map", f"[out{i}]",
+                    "-map", "0:a?",
+                    *encoder_args,
+                    "-c:a", "copy",
+                    "-movflags", settings["movflags"],
+                    output_path,
+                ]
+
+            command = [
+                "-i", os.path.abspath(input_path),
+                "-filter_complex", ";".join([split] + branches),
+                *outputs,
+            ]
+
+            print(f"Running FFmpeg on {len(output_paths)} variants...")
+            elapsed = await render_pool.run(
+                command,
+                workdir,
+                duration,
+                lambda fraction: report(
+                    render_start + fraction * (1.0 - render_start), "rendering"
+                ),
+                timeout,
+            )
+            if video is not None:
+                preset_selector.record(
+                    preset, video.pixels * len(output_paths), elapsed.threads, elapsed.seconds
+                )
+
+        for output_path in output_paths:
+            if not os.path.exists(output_path) or os.path.getsize(output_path) < 1000:
+                raise RenderError("Output file not created or too small")
+
+    with contextlib.ExitStack() as shared:
+        if asset is None:
+            # Like in render_karaoke, the renders shared with identical requests read
+            # their own link to the upload.
+            input_path = shared.enter_context(shared_uploads.share(input_path, media_digest))
+        return await render_cache.get_or_render_many(keys, render)
+
+
+async def iterate_transcript(segments_list, info):
+    """Yields a cached transcript in the same order as the pool stream."""
+    yield info
+    for segment in segments_list:
+        yield segment
+
+
+def format_stream_event(event: dict, fmt: str) -> str:
+    data = json.dumps(event)
+    if fmt == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
 
-        return FileResponse(
-            output_path,
+
+@app.post("/transcribe-live")
+async def transcribe_live(
+    file: Optional[UploadFile] = File(None),
+    asset_id: Optional[str] = Form(None),
+    word_timestamps: bool = Form(False),
+    format: str = Form("ndjson"),
+    selection: dict = Depends(model_selection),
+):
+    """Streams each segment as soon as it is decoded, as NDJSON lines or SSE events.
+
+    The first event carries the transcription info, then one event per segment, then a
+    "done" event. Segments are not accumulated on the server.
+    """
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or sse")
+
+    # The response body is produced after the handler returns, so the stream owns the
+    # media: the uploaded file is removed and the asset lease released when it ends.
+    media = contextlib.ExitStack()
+    if asset_id:
+        asset = asset_store.get(asset_id)
+        if asset is None:
+            raise HTTPException(status_code=404, detail=f"Unknown asset: {asset_id}")
+        media.enter_context(asset_store.lease(asset_id))
+        input_path = asset.media_path
+    elif file is not None:
+        asset = None
+        input_path = await save_upload(file, suffix=".mp4")
+        media.callback(os.unlink, input_path)
+    else:
+        raise HTTPException(status_code=400, detail="Either file or asset_id is required")
+
+    options = dict(selection, word_timestamps=word_timestamps)
+
+    async def events():
+        with media:
+            media_digest = await media_digest_of(input_path, asset)
+            key = transcript_cache_key(media_digest, options)
+            cached = await transcript_cache.lookup(key)
+            if cached is None and asset is not None:
+                cached = await asyncio.to_thread(asset_store.load_transcript, asset, key)
+
+            if cached is not None:
+                stream = iterate_transcript(*cached)
+            elif asset is not None:
+                stream = pool.stream(
+                    iter_media_transcription, asset.media_path, asset.audio_path, **options
+                )
+            else:
+                stream = pool.stream(
+                    iter_transcription, input_path, media_digest=media_digest, **options
+                )
+
+            info = None
+            async for item in stream:
+                if info is None:
+                    info = item
+                    event = {
+                        "type": "info",
+                        "language": info.language,
+                        "language_probability": info.language_probability,
+                        "duration": info.duration,
+                    }
+                else:
+                    event = dict(segment_to_dict(item), type="segment")
+                yield format_stream_event(event, format)
+
+            yield format_stream_event({"type": "done", "cached": cached is not None}, format)
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        events(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def render_response(request: Request, output_path: str, filename: str):
+    """Sends a cached render, which can be fetched again with Range requests by its ID."""
+    response = file_response(
+        request,
+        output_path,
+        OUTPUT_MEDIA_TYPES[os.path.splitext(output_path)[1]],
+        filename,
+    )
+    response.headers["X-Render-Id"] = os.path.basename(output_path)
+    return response
+
+
+@app.post("/create-advanced-word-karaoke")
+async def create_advanced_word_karaoke(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    asset_id: Optional[str] = Form(None),
+    streamOutput: Optional[str] = Form("false"),
+    options: dict = Depends(karaoke_options),
+):
+    """Renders the karaoke video.
+
+    With streamOutput=true, MP4 outputs are sent while ffmpeg encodes them, as a
+    fragmented MP4 of unknown length.
+    """
+    try:
+        async with contextlib.AsyncExitStack() as media:
+            input_path, asset = await media.enter_async_context(media_input(file, asset_id))
+            filename = asset.filename if asset is not None else file.filename
+
+            print(f"Creating advanced word karaoke for: {filename}")
+            print(f"Selected Style: {options['selectedStyle']}")
+            print(f"Font: {options['fontFamily']}, Size: {options['fontSize']}px")
+            print(f"Text Color: {options['textColor']}, "
+                  f"Highlight Color: {options['highlightColor']}")
+            print(f"Window Size: {options['windowSize']} words")
+
+            if streamOutput.lower() != "true":
+                output_path = await render_karaoke(input_path, asset, options)
+                return render_response(request, output_path, output_filename(filename, output_path))
+
+            # The render owns the media from now on: it outlives this handler when the
+            # output is streamed, and completes even if the client goes away.
+            render_media = media.pop_all()
+            output_started = asyncio.get_running_loop().create_future()
+
+            def on_output(path):
+                if not output_started.done():
+                    output_started.set_result(path)
+
+            async def render():
+                async with render_media:
+                    return await render_karaoke(input_path, asset, options, on_output=on_output)
+
+            task = asyncio.ensure_future(render())
+            await asyncio.wait([output_started, task], return_when=asyncio.FIRST_COMPLETED)
+
+        if not output_started.done():
+            # Served from the cache, or not an MP4.
+            output_path = task.result()
+            return render_response(request, output_path, output_filename(filename, output_path))
+
+        download_name = output_filename(filename, output_started.result())
+        return StreamingResponse(
+            follow_file(output_started.result(), task),
             media_type="video/mp4",
-            filename=f"advanced_word_karaoke_{file.filename}",
-            headers={"Content-Disposition": f"attachment; filename=advanced_word_karaoke_{file.filename}"}
+            headers={"Content-Disposition": f"attachment; filename={download_name}"},
         )
 
+    except RenderError as e:
+        return {"error": str(e)}
+
     except Exception as e:
         print(f"Error: {str(e)}")
         import traceback
         traceback.print_exc()
         return {"error": f"Advanced processing failed: {str(e)}"}
 
-    finally:
-        for temp_file in [input_path, subtitle_file]:
-            if temp_file and os.path.exists(temp_file):
-                try:
-                    os.unlink(temp_file)
-                except:
-                    pass
+
+@app.post("/create-karaoke-variants")
+async def create_karaoke_variants(
+    file: Optional[UploadFile] = File(None),
+    asset_id: Optional[str] = Form(None),
+    variants: str = Form(...),
+    options: dict = Depends(karaoke_options),
+):
+    """Renders up to MAX_VARIANTS styles of the same video in one pass.
+
+    `variants` is a JSON list of style options, e.g.
+    [{"highlightColor": "#FF0000"}, {"fontSize": "28", "aspectRatio": "9:16"}]. The
+    renders are downloaded from /renders/{render_id}.
+    """
+    try:
+        variant_list = json.loads(variants)
+    except ValueError:
+        variant_list = None
+    if (
+        not isinstance(variant_list, list)
+        or not 1 <= len(variant_list) <= MAX_VARIANTS
+        or not all(isinstance(variant, dict) for variant in variant_list)
+    ):
+        return {"error": f"variants must be a JSON list of 1 to {MAX_VARIANTS} style objects"}
+
+    try:
+        async with media_input(file, asset_id) as (input_path, asset):
+            filename = asset.filename if asset is not None else file.filename
+            print(f"Creating {len(variant_list)} karaoke variants for: {filename}")
+
+            output_paths = await render_karaoke_variants(
+                input_path, asset, options, variant_list
+            )
+
+        return {
+            "variants": [
+                {
+                    "render_id": os.path.basename(output_path),
+                    "url": f"/renders/{os.path.basename(output_path)}",
+                }
+                for output_path in output_paths
+            ]
+        }
+
+    except RenderError as e:
+        return {"error": str(e)}
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return {"error": f"Variant processing failed: {str(e)}"}
+
+
+@app.get("/renders/{render_id}")
+async def get_render(render_id: str, request: Request):
+    """Sends a finished render by the ID returned in the X-Render-Id header."""
+    output_path = await asyncio.to_thread(render_cache.get, render_id)
+    if output_path is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired render: {render_id}")
+    return render_response(request, output_path, output_filename(render_id, output_path))
+
+
+async def job_asset(file: Optional[UploadFile], asset_id: Optional[str]):
+    """Returns the asset a job works on, storing the upload as a new asset if needed.
+
+    Jobs outlive the request, so their media must not be a temporary upload.
+    """
+    if asset_id:
+        asset = asset_store.get(asset_id)
+        if asset is None:
+            raise HTTPException(status_code=404, detail=f"Unknown asset: {asset_id}")
+        return asset
+    if file is None:
+        raise HTTPException(status_code=400, detail="Either file or asset_id is required")
+    return await asset_store.add(file)
+
+
+def submit_asset_job(kind: str, asset, fn):
+    """Submits `fn(job, asset)` while holding a lease on the asset."""
+    lease = contextlib.ExitStack()
+    lease.enter_context(asset_store.lease(asset.asset_id))
+
+    async def run(job):
+        with lease:
+            return await fn(job, asset)
+
+    job = jobs.submit(kind, run)
+    return dict(job.to_dict(), asset_id=asset.asset_id)
+
+
+@app.post("/jobs/transcribe")
+async def submit_transcription_job(
+    file: Optional[UploadFile] = File(None),
+    asset_id: Optional[str] = Form(None),
+    word_timestamps: bool = Form(False),
+    selection: dict = Depends(model_selection),
+):
+    asset = await job_asset(file, asset_id)
+
+    async def run(job, asset):
+        segments_list, info = await cached_transcribe(
+            asset.media_path,
+            asset=asset,
+            progress=lambda fraction: job.report(fraction, "transcribing"),
+            word_timestamps=word_timestamps,
+            **selection,
+        )
+        if word_timestamps:
+            return word_transcript_response(segments_list, info)
+        return transcript_response(segments_list, info)
+
+    return submit_asset_job("transcribe", asset, run)
+
+
+@app.post("/jobs/karaoke")
+async def submit_karaoke_job(
+    file: Optional[UploadFile] = File(None),
+    asset_id: Optional[str] = Form(None),
+    options: dict = Depends(karaoke_options),
+):
+    asset = await job_asset(file, asset_id)
+
+    async def run(job, asset):
+        output_path = await render_karaoke(
+            asset.media_path, asset, options, progress=job.report, timeout=None
+        )
+        return {"path": output_path, "filename": output_filename(asset.filename, output_path)}
+
+    return submit_asset_job("karaoke", asset, run)
+
+
+def get_job_or_404(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return get_job_or_404(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    job = get_job_or_404(job_id)
+    return StreamingResponse(
+        jobs.events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, request: Request):
+    job = get_job_or_404(job_id)
+    if job.status != COMPLETED:
+        raise HTTPException(status_code=409, detail=job.to_dict())
+
+    if job.kind == "karaoke":
+        if not os.path.exists(job.result["path"]):
+            raise HTTPException(status_code=410, detail="The render was evicted")
+        return render_response(request, job.result["path"], job.result["filename"])
+    return job.result
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    get_job_or_404(job_id)
+    return {"cancelled": jobs.cancel(job_id)}
 
 
 def get_font_name_for_ass(font_family: str) -> str:
@@ -261,37 +1387,21 @@ def hex_to_ass_color(hex_color: str, alpha: str = "00") -> str:
     return f"&H{alpha}{b:02X}{g:02X}{r:02X}"
 
 
-def format_ass_time(seconds):
-    """Format seconds to ASS time format: H:MM:SS.CC"""
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    centisecs = int((seconds % 1) * 100)
-    return f"{hours}:{minutes:02d}:{secs:02d}.{centisecs:02d}"
-
-
-def create_word_level_ass_with_color_changes(
-    segments_list,
+def create_ass_header(
     font_family: str,
     font_size: int,
-    text_color: str = "#FFFFFF",
-    use_stroke: bool = False,
-    stroke_color: str = "#000000",
-    stroke_width: float = 2.0,
-    background_color: str = "#F97316",
-    border_color: str = "#1E40AF",
-    highlight_color: str = "#FFFF00",
-    box_padding_left_right: int = 15,
-    window_size: int = 6
-):
-    """Generate ASS subtitle file with per-word color highlighting"""
-    
+    primary_color_ass: str,
+    secondary_color_ass: str,
+    use_stroke: bool,
+    stroke_color: str,
+    stroke_width: float,
+    background_color: str,
+    border_color: str,
+) -> str:
+    """Script info, Default style and events format shared by the karaoke generators"""
     font_name = get_font_name_for_ass(font_family)
     font_weight = 1 if font_family == "Aptos Black" else 0
 
-    text_color_ass = hex_to_ass_color(text_color, "00")
-    highlight_color_ass = hex_to_ass_color(highlight_color, "00")
-
     if use_stroke:
         border_style = 1
         outline_color = hex_to_ass_color(stroke_color, "00")
@@ -307,8 +1417,7 @@ def create_word_level_ass_with_color_changes(
     margin_lr = 60
     letter_spacing = 2
 
-    # ASS file header
-    ass_header = f"""[Script Info]
+    return f"""[Script Info]
 Title: Word-Level Karaoke
 ScriptType: v4.00+
 PlayResX: 1920
@@ -318,78 +1427,113 @@ ScaledBorderAndShadow: yes
 
 [V4+ Styles]
 Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: Default,{font_name},{font_size},{text_color_ass},{highlight_color_ass},{outline_color},{back_color},{font_weight},0,0,0,100,100,{letter_spacing},0,{border_style},{outline_width},0,2,{margin_lr},{margin_lr},{margin_v},1
+Style: Default,{font_name},{font_size},{primary_color_ass},{secondary_color_ass},{outline_color},{back_color},{font_weight},0,0,0,100,100,{letter_spacing},0,{border_style},{outline_width},0,2,{margin_lr},{margin_lr},{margin_v},1
 
 [Events]
 Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 """
 
-    events = []
-    all_words = []
 
-    # Collect all words from all segments
-    for segment in segments_list:
-        if hasattr(segment, "words") and segment.words:
-            for word in segment.words:
-                all_words.append({
-                    "text": word.word.strip(),
-                    "start": word.start,
-                    "end": word.end
-                })
-
-    if not all_words:
-        print("WARNING: No words found")
-        return ass_header
-
-    print(f"Total words: {len(all_words)}, window size: {window_size}")
-
-    # Process words in windows
-    i = 0
-    while i < len(all_words):
-        # Get window of words
-        window_start_idx = i
-        window_end_idx = min(i + window_size, len(all_words))
-        window_words = all_words[window_start_idx:window_end_idx]
-
-        if not window_words:
-            break
-
-        # For each word in this window, create a subtitle line
-        for active_idx, active_word in enumerate(window_words):
-            subtitle_parts = []
-            
-            # Build text with: inactive + active (highlighted) + inactive
-            for display_idx, display_word in enumerate(window_words):
-                word_text = display_word["text"].strip()
-                
-                if display_idx == active_idx:
-                    # ACTIVE WORD - Use highlight color
-                    subtitle_parts.append(f"{{\\c{highlight_color_ass}&}}{word_text}{{\\r}}")
-                else:
-                    # INACTIVE WORD - Use text color
-                    subtitle_parts.append(f"{{\\c{text_color_ass}&}}{word_text}{{\\r}}")
-            
-            subtitle_text = " ".join(subtitle_parts)
-            padding = " " * box_padding_left_right if not use_stroke else ""
-            final_text = f"{padding}{subtitle_text}{padding}"
-
-            # This subtitle only shows while this specific word is being spoken
-            word_start = format_ass_time(active_word["start"])
-            word_end = format_ass_time(active_word["end"])
-
-            events.append(
-                f"Dialogue: 0,{word_start},{word_end},Default,,0,0,0,,{final_text}"
-            )
+def create_word_level_ass_with_color_changes(
+    segments_list,
+    font_family: str,
+    font_size: int,
+    text_color: str = "#FFFFFF",
+    use_stroke: bool = False,
+    stroke_color: str = "#000000",
+    stroke_width: float = 2.0,
+    background_color: str = "#F97316",
+    border_color: str = "#1E40AF",
+    highlight_color: str = "#FFFF00",
+    box_padding_left_right: int = 15,
+    window_size: int = 6
+):
+    """Generate ASS subtitle file with per-word color highlighting"""
+    text_color_ass = hex_to_ass_color(text_color, "00")
+    highlight_color_ass = hex_to_ass_color(highlight_color, "00")
+
+    ass_header = create_ass_header(
+        font_family,
+        font_size,
+        text_color_ass,
+        highlight_color_ass,
+        use_stroke,
+        stroke_color,
+        stroke_width,
+        background_color,
+        border_color,
+    )
+
+    padding = " " * box_padding_left_right if not use_stroke else ""
+    return "".join(iter_ass(
+        segments_list,
+        header=ass_header,
+        karaoke="color",
+        window_size=window_size,
+        text_color=text_color_ass,
+        highlight_color=highlight_color_ass,
+        padding=padding,
+    ))
+
+
+def create_word_level_ass_with_k_tags(
+    segments_list,
+    font_family: str,
+    font_size: int,
+    text_color: str = "#FFFFFF",
+    use_stroke: bool = False,
+    stroke_color: str = "#000000",
+    stroke_width: float = 2.0,
+    background_color: str = "#F97316",
+    border_color: str = "#1E40AF",
+    highlight_color: str = "#FFFF00",
+    box_padding_left_right: int = 15,
+    window_size: int = 6,
+    fill: bool = False
+):
+    """Generate ASS subtitle file with one karaoke event per window of words
 
-        i = window_end_idx
+    Words are timed with \\k tags (\\kf sweeps the highlight across the word when
+    `fill` is set): libass draws a word in SecondaryColour until it is spoken and in
+    PrimaryColour from then on, so the highlight color is the primary color here.
+    """
+    text_color_ass = hex_to_ass_color(text_color, "00")
+    highlight_color_ass = hex_to_ass_color(highlight_color, "00")
 
-    print(f"Generated {len(events)} subtitle events")
-    return ass_header + "\n".join(events)
+    ass_header = create_ass_header(
+        font_family,
+        font_size,
+        highlight_color_ass,
+        text_color_ass,
+        use_stroke,
+        stroke_color,
+        stroke_width,
+        background_color,
+        border_color,
+    )
+
+    padding = " " * box_padding_left_right if not use_stroke else ""
+    return "".join(iter_ass(
+        segments_list,
+        header=ass_header,
+        karaoke="kf" if fill else "k",
+        window_size=window_size,
+        padding=padding,
+    ))
 
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "pool": pool.stats(),
+        "transcript_cache": transcript_cache.stats(),
+        "assets": asset_store.stats(),
+        "renders": render_pool.stats(),
+        "render_cache": render_cache.stats(),
+        "presets": preset_selector.stats(),
+        "jobs": jobs.stats(),
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+"""Lazily loaded Whisper models with a memory-bounded LRU.
+
+Models listed in `faster_whisper.utils._MODELS` are downloaded and loaded the first time a
+request uses them. When the estimated memory of the resident models exceeds the budget,
+the least recently used models that are not serving a request are unloaded.
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from faster_whisper import WhisperModel, download_model
+from faster_whisper.utils import _MODELS
+
+# Variants used when the request language is known to be English.
+ENGLISH_VARIANTS = {
+    "tiny": "tiny.en",
+    "base": "base.en",
+    "small": "small.en",
+    "medium": "medium.en",
+    "large-v2": "distil-large-v3",
+    "large-v3": "distil-large-v3",
+    "large": "distil-large-v3",
+}
+
+
+def route_model(name: str, language: Optional[str]) -> str:
+    """Returns the model serving `language` for a request asking for `name`.
+
+    English-only and distilled models are faster and as accurate on English audio.
+    """
+    if language == "en":
+        return ENGLISH_VARIANTS.get(name, name)
+    return name
+
+
+def _model_size(model_path: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(model_path))
+
+
+class _ResidentModel:
+    def __init__(self, model: WhisperModel, size: int):
+        self.model = model
+        self.size = size
+        self.users = 0
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+    def __init__(self, max_memory_bytes: int = 2 << 30, **model_kwargs):
+        """Creates an empty registry.
+
+        Args:
+          max_memory_bytes: Budget for the resident models, estimated from the size of the
+            model files. A model is always loaded even if it exceeds the budget alone.
+          model_kwargs: Arguments passed to every `WhisperModel`.
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.model_kwargs = model_kwargs
+        self._models: Dict[str, _ResidentModel] = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    @contextlib.contextmanager
+    def use(self, name: str):
+        """Yields the model `name`, loading it if needed. It is not evicted while in use."""
+        resident = self._acquire(name)
+        try:
+            yield resident.model
+        finally:
+            with self._lock:
+                resident.users -= 1
+                resident.last_used = time.time()
+
+    def _acquire(self, name: str) -> _ResidentModel:
+        with self._lock:
+            resident = self._models.get(name)
+            if resident is not None:
+                resident.users += 1
+                self._models.move_to_end(name)
+                return resident
+            loading = self._loading.setdefault(name, threading.Lock())
+
+        # Only one thread loads a given model, the others wait for it.
+        with loading:
+            with self._lock:
+                resident = self._models.get(name)
+                if resident is not None:
+                    resident.users += 1
+                    self._models.move_to_end(name)
+                    return resident
+
+            if name in _MODELS:
+                model_path = download_model(
+                    name,
+                    cache_dir=self.model_kwargs.get("download_root"),
+                    local_files_only=self.model_kwargs.get("local_files_only", False),
+                )
+            else:
+                model_path = name
+
+            model = WhisperModel(model_path, **self.model_kwargs)
+            size = _model_size(model_path) if os.path.isdir(model_path) else 0
+
+            with self._lock:
+                resident = _ResidentModel(model, size)
+                resident.users += 1
+                self._models[name] = resident
+                self._loading.pop(name, None)
+                self.loads += 1
+                self._evict()
+
+        return resident
+
+    def _evict(self):
+        total_bytes = sum(resident.size for resident in self._models.values())
+        for name, resident in list(self._models.items()):
+            if total_bytes <= self.max_memory_bytes:
+                break
+            if resident.users == 0:
+                del self._models[name]
+                total_bytes -= resident.size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "resident": {
+                    name: {"bytes": resident.size, "users": resident.users}
+                    for name, resident in self._models.items()
+                },
+                "memory_bytes": sum(r.size for r in self._models.values()),
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,212 @@
+"""Runs the ffmpeg renders without blocking the event loop.
+
+Every render gets its own working directory, so concurrent renders never share a file
+name, and the number of renders running at the same time is bounded. A render running
+alone uses all the cores, concurrent renders share them. ffmpeg reports its progress on
+a pipe and is killed if the render is cancelled or times out.
+"""
+
+import asyncio
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+from typing import Callable, List, NamedTuple, Optional
+
+import av
+
+from jobs import mark_running
+
+FFMPEG = os.environ.get("FFMPEG", "ffmpeg")
+
+# Default number of renders running at the same time. Most renders run alone, more
+# slots mostly split the same cores between more processes.
+MAX_DEFAULT_RENDERS = 4
+
+
+class RenderError(Exception):
+    """Render failure reported to the client as {"error": ...}."""
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Returns the duration of a media file in seconds, if the container reports it."""
+    with av.open(path, metadata_errors="ignore") as container:
+        if container.duration is None:
+            return None
+        return container.duration / av.time_base
+
+
+class RenderTime(NamedTuple):
+    seconds: float  # Time ffmpeg ran, not counting the wait for a slot.
+    threads: int  # Encoder threads ffmpeg used.
+
+
+class RenderPool:
+    def __init__(
+        self,
+        max_renders: Optional[int] = None,
+        threads: Optional[int] = None,
+        root: Optional[str] = None,
+    ):
+        """Creates the pool.
+
+        Args:
+          max_renders: Number of encoding ffmpeg processes running at the same time,
+            half the cores up to `MAX_DEFAULT_RENDERS` by default. Other renders wait
+            for a slot.
+          threads: Encoder threads of each render. By default a render running alone
+            lets ffmpeg use all the cores, and the cores are divided between the renders
+            encoding at the same time.
+          root: Directory where the working directories are created.
+        """
+        self.cores = os.cpu_count() or 1
+        if max_renders is None:
+            max_renders = max(1, min(self.cores // 2, MAX_DEFAULT_RENDERS))
+
+        self.max_renders = max_renders
+        self.threads = threads
+        self.root = root
+        self._slots = asyncio.Semaphore(max_renders)
+        self._queued = 0
+        self._running = 0
+        self._encoding = 0
+        self._completed = 0
+        self._failed = 0
+
+    def threads_for(self, renders: int) -> int:
+        """Returns the encoder threads of each of `renders` renders encoding together."""
+        if self.threads is not None:
+            return self.threads
+        return max(1, self.cores // max(renders, 1))
+
+    @contextlib.contextmanager
+    def workdir(self):
+        """Yields a new directory for the files of one render, removed afterwards."""
+        path = tempfile.mkdtemp(prefix="render-", dir=self.root)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    async def run(
+        self,
+        args: List[str],
+        cwd: str,
+        duration: Optional[float] = None,
+        on_progress: Optional[Callable[[float], None]] = None,
+        timeout: Optional[float] = None,
+        cpu_bound: bool = True,
+    ) -> RenderTime:
+        """Runs `ffmpeg args` in `cwd` once a slot is free.
+
+        Args:
+          args: ffmpeg arguments, without the executable. The pool sets the value of
+            their `-threads` options, e.g. ["-c:v", "libx264", "-threads", "0", ...].
+          cwd: Working directory of the render, see `workdir()`.
+          duration: Duration of the output, used to compute the progress.
+          on_progress: Called on the event loop with the encoded fraction.
+          timeout: Seconds after which ffmpeg is killed, not counting the wait for a slot.
+          cpu_bound: False for remuxes and stream copies, which start without waiting
+            for a slot.
+
+        Returns:
+          The seconds ffmpeg ran, not counting the wait for a slot, and its threads.
+
+        Raises:
+          RenderError: if ffmpeg fails or times out.
+        """
+        if cpu_bound:
+            self._queued += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._queued -= 1
+        mark_running()
+
+        threads = 1
+        if cpu_bound:
+            # The renders already encoding keep their threads until they end. A render
+            # encoding alone lets ffmpeg choose ("0"), which uses all the cores.
+            self._encoding += 1
+            threads = self.threads_for(self._encoding)
+            value = (
+                "0" if self.threads is None and self._encoding == 1 else str(threads)
+            )
+            args = [
+                value if i > 0 and args[i - 1] == "-threads" else arg
+                for i, arg in enumerate(args)
+            ]
+
+        self._running += 1
+        started = time.monotonic()
+        try:
+            await self._run(args, cwd, duration, on_progress, timeout)
+        except BaseException:
+            self._failed += 1
+            raise
+        else:
+            self._completed += 1
+        finally:
+            self._running -= 1
+            if cpu_bound:
+                self._encoding -= 1
+                self._slots.release()
+        return RenderTime(time.monotonic() - started, threads)
+
+    async def _run(self, args, cwd, duration, on_progress, timeout):
+        command = [
+            FFMPEG,
+            "-hide_banner",
+            "-nostats",
+            "-progress",
+            "pipe:1",
+            "-y",
+        ] + args
+
+        with open(os.path.join(cwd, "ffmpeg.log"), "w+b") as stderr:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                cwd=cwd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=stderr,
+            )
+
+            async def read_progress():
+                async for line in process.stdout:
+                    key, _, value = line.decode().strip().partition("=")
+                    if key == "out_time_us" and duration and on_progress is not None:
+                        try:
+                            on_progress(min(int(value) / 1000000 / duration, 1.0))
+                        except ValueError:
+                            pass
+                return await process.wait()
+
+            try:
+                returncode = await asyncio.wait_for(read_progress(), timeout)
+            except asyncio.TimeoutError:
+                raise RenderError("FFmpeg timed out after %d seconds" % timeout)
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+
+            if returncode != 0:
+                stderr.seek(0)
+                log = stderr.read().decode("utf-8", errors="replace")
+                print(f"FFmpeg error ({returncode}): {log[-1000:]}")
+                raise RenderError(
+                    f"FFmpeg processing failed: {log[-500:] or returncode}"
+                )
+
+    def stats(self) -> dict:
+        return {
+            "slots": self.max_renders,
+            "threads": self.threads_for(max(self._encoding, 1)),
+            "running": self._running,
+            "queue_depth": self._queued,
+            "completed": self._completed,
+            "failed": self._failed,
+        }
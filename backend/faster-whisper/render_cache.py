@@ -0,0 +1,217 @@
+"""Disk cache for rendered videos.
+
+Exporting the same video with the same style produces the same ASS file and the same
+ffmpeg command, so the encode is skipped and the previous output is returned. Renders
+are keyed by the media hash, the hash of the subtitles and the encoder settings. They
+expire after a TTL without access and are kept within a disk quota, evicted least
+recently used first.
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import re
+import time
+
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from singleflight import SingleFlight
+
+_RENDER_NAME = re.compile(r"[0-9a-f]{64}\.(mp4|mkv)")
+
+
+def render_key(media_digest: str, subtitles: str, settings: dict) -> str:
+    """Combines the media hash, the subtitles and the encoder settings into a cache key."""
+    digest = hashlib.sha256()
+    digest.update(media_digest.encode("utf-8") + b"\n")
+    digest.update(hashlib.sha256(subtitles.encode("utf-8")).digest())
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    def __init__(
+        self, cache_dir: str, max_disk_bytes: int = 5 << 30, ttl: float = 86400
+    ):
+        """Creates the cache and removes what a previous run left expired or unfinished.
+
+        Args:
+          cache_dir: Directory holding the rendered files.
+          max_disk_bytes: Disk quota. The render just stored is kept even if it exceeds
+            the quota alone.
+          ttl: Seconds without access after which a render expires.
+        """
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._inflight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        for entry in os.scandir(cache_dir):
+            if ".partial" in entry.name:
+                os.unlink(entry.path)
+        self.evict()
+
+    def path(self, key: str, suffix: str = ".mp4") -> str:
+        return os.path.join(self.cache_dir, key + suffix)
+
+    async def get_or_render(
+        self,
+        key: str,
+        render: Callable[[str], Awaitable[None]],
+        suffix: str = ".mp4",
+    ) -> str:
+        """Returns the cached render for `key` or awaits `render(output_path)` to produce it.
+
+        Concurrent calls with the same key wait for the same render.
+        """
+        paths = await self.get_or_render_many(
+            [key], lambda output_paths: render(output_paths[0]), suffix
+        )
+        return paths[0]
+
+    async def get_or_render_many(
+        self,
+        keys: List[str],
+        render: Callable[[List[str]], Awaitable[None]],
+        suffix: str = ".mp4",
+    ) -> List[str]:
+        """Returns the cached renders for `keys`, producing the missing ones together.
+
+        `render(output_paths)` is awaited once with the outputs of the keys that are
+        neither cached nor being rendered by a concurrent call, whose renders are waited
+        for instead. Cancelling a caller only cancels the renders no other caller waits
+        for.
+        """
+        paths = [self.path(key, suffix) for key in keys]
+        missing, flights = {}, []
+        for key, path in zip(keys, paths):
+            if path in missing:
+                continue
+            if await asyncio.to_thread(self._lookup, path):
+                self.hits += 1
+            elif path in self._inflight:
+                self.coalesced += 1
+                flight = self._inflight.get(path)
+                if flight not in flights:
+                    flights.append(flight)
+            else:
+                missing[path] = self.path(key, ".partial" + suffix)
+
+        if missing:
+            self.misses += len(missing)
+            flights.append(
+                self._inflight.start(
+                    list(missing), functools.partial(self._render, missing, render)
+                )
+            )
+
+        await self._inflight.wait(flights)
+        return paths
+
+    async def _render(self, missing: dict, render: Callable[[List[str]], Awaitable]):
+        try:
+            await render(list(missing.values()))
+            for path, partial_path in missing.items():
+                await asyncio.to_thread(self._store, partial_path, path)
+        finally:
+            for partial_path in missing.values():
+                if os.path.exists(partial_path):
+                    os.unlink(partial_path)
+
+    def get(self, name: str) -> Optional[str]:
+        """Returns the path of a cached render given its file name, the key and suffix."""
+        if not _RENDER_NAME.fullmatch(name):
+            return None
+        path = os.path.join(self.cache_dir, name)
+        return path if self._lookup(path) else None
+
+    def record_render(
+        self, base_key: str, key: str, subtitles: str, suffix: str = ".mp4"
+    ):
+        """Remembers the render `key` as the latest one of `base_key` with its subtitles.
+
+        `base_key` identifies the media and the encoder settings, without the subtitles.
+        """
+        with open(self.path(key, ".ass"), "w", encoding="utf-8") as f:
+            f.write(subtitles)
+        latest_path = self.path("latest-" + base_key, ".json")
+        with open(latest_path + ".partial", "w", encoding="utf-8") as f:
+            json.dump({"key": key, "suffix": suffix}, f)
+        os.replace(latest_path + ".partial", latest_path)
+
+    def previous_render(self, base_key: str) -> Optional[Tuple[str, str]]:
+        """Returns the path and the subtitles of the latest render of `base_key`, if cached."""
+        try:
+            with open(self.path("latest-" + base_key, ".json"), encoding="utf-8") as f:
+                latest = json.load(f)
+            with open(self.path(latest["key"], ".ass"), encoding="utf-8") as f:
+                subtitles = f.read()
+        except FileNotFoundError:
+            return None
+
+        path = self.path(latest["key"], latest["suffix"])
+        if not self._lookup(path):
+            return None
+        return path, subtitles
+
+    def evict(self, keep: Optional[str] = None):
+        """Removes the expired renders, then the least recently used ones over quota."""
+        entries = []
+        for entry in self._entries():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for mtime, size, entry_path in sorted(entries):
+            if total_bytes <= self.max_disk_bytes and not self._is_expired(mtime):
+                break
+            if entry_path == keep:
+                continue
+            try:
+                os.unlink(entry_path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def _lookup(self, path: str) -> bool:
+        try:
+            if self._is_expired(os.stat(path).st_mtime):
+                os.unlink(path)
+                return False
+            # The modification time orders the LRU.
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _is_expired(self, mtime: float) -> bool:
+        return time.time() - mtime > self.ttl
+
+    def _entries(self):
+        return [
+            entry
+            for entry in os.scandir(self.cache_dir)
+            if ".partial" not in entry.name
+        ]
+
+    def _store(self, partial_path: str, path: str):
+        os.replace(partial_path, path)
+        self.evict(keep=path)
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        renders = [e for e in entries if not e.name.endswith((".ass", ".json"))]
+        return {
+            "entries": len(renders),
+            "disk_bytes": sum(entry.stat().st_size for entry in entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
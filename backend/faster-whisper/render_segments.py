@@ -0,0 +1,399 @@
+"""Segmented burn-in: renders chunks of a video in parallel.
+
+One libx264 process does not use all the cores of a large host on a long video. The
+video is cut at keyframes, so every chunk can be decoded on its own, and each chunk is
+burned in with the subtitles shifted to its start by a separate ffmpeg process. Chunks
+without any subtitle, or whose subtitles did not change since a previous render of the
+same video, are stream copied instead of encoded when the encoder produces the same
+H.264 parameters. The chunks are joined with the concat demuxer without re-encoding and
+the original audio is copied over the result.
+"""
+
+import asyncio
+import os
+import re
+
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import av
+
+from faster_whisper.subtitles import format_ass_timestamp
+from render import RenderError, RenderPool, probe_duration
+
+# Chunks shorter than this are not worth an additional ffmpeg process.
+MIN_CHUNK_SECONDS = 30.0
+
+# Shorter spans without subtitles are encoded with their neighbors.
+MIN_COPY_SECONDS = 5.0
+
+# Video codec and pixel format produced by the encoded chunks. Chunks of a source in
+# another format cannot be stream copied next to them.
+COPYABLE_VIDEO = ("h264", "yuv420p")
+
+_DIALOGUE = re.compile(
+    r"^(Dialogue: [^,]*,)(\d+:\d\d:\d\d\.\d\d),(\d+:\d\d:\d\d\.\d\d),"
+)
+
+
+class Chunk(NamedTuple):
+    start: float
+    end: Optional[float]  # None for the end of the video.
+    encode: bool = True  # False if the chunk is stream copied.
+    source: Optional[str] = None  # Video copied instead of the input.
+
+
+def video_format(path: str) -> Tuple[str, str]:
+    """Returns the codec and the pixel format of the first video stream."""
+    with av.open(path, metadata_errors="ignore") as container:
+        codec_context = container.streams.video[0].codec_context
+        return codec_context.name, codec_context.format.name
+
+
+def keyframe_times(path: str) -> List[float]:
+    """Returns the keyframe times of the first video stream, relative to the file start.
+
+    Only the packets are read, nothing is decoded.
+    """
+    with av.open(path, metadata_errors="ignore") as container:
+        stream = container.streams.video[0]
+        start = container.start_time / av.time_base if container.start_time else 0.0
+        times = []
+        for packet in container.demux(stream):
+            if packet.is_keyframe and packet.pts is not None:
+                times.append(float(packet.pts * stream.time_base) - start)
+    return sorted(times)
+
+
+def sequence_parameter_sets(path: str) -> bytes:
+    """Returns the H.264 sequence parameter sets of the first keyframe of an MPEG-TS file.
+
+    Copied and encoded chunks can only be joined if they have the same: the joined MP4
+    keeps a single copy, read by the decoders for the whole video.
+    """
+    with av.open(path, metadata_errors="ignore") as container:
+        for packet in container.demux(container.streams.video[0]):
+            if packet.is_keyframe:
+                data = bytes(packet)
+                break
+        else:
+            return b""
+
+    # The packets are in Annex B format, the NAL units follow start codes.
+    return b"".join(
+        unit.rstrip(b"\x00")
+        for unit in data.split(b"\x00\x00\x01")
+        if unit and unit[0] & 0x1F == 7
+    )
+
+
+async def can_copy_chunks(
+    pool: RenderPool,
+    input_path: str,
+    encoder_args: List[str],
+    timeout: Optional[float] = None,
+) -> bool:
+    """Returns whether chunks copied from `input_path` can be joined with encoded ones.
+
+    Only the first frame of the input is encoded with `encoder_args`, the sequence
+    parameter sets of the output do not depend on the number of frames.
+    """
+    input_args = ["-i", os.path.abspath(input_path), "-map", "0:v:0", "-an", "-sn"]
+    input_args += ["-frames:v", "1"]
+    with pool.workdir() as workdir:
+        try:
+            await pool.run(
+                input_args + ["-c:v", "copy", "copied.ts"],
+                workdir,
+                timeout=timeout,
+                cpu_bound=False,
+            )
+            await pool.run(
+                input_args + encoder_args + ["encoded.ts"], workdir, timeout=timeout
+            )
+        except RenderError as e:
+            print(f"Cannot compare the H.264 parameters, chunks are not copied: {e}")
+            return False
+
+        copied, encoded = [
+            await asyncio.to_thread(
+                sequence_parameter_sets, os.path.join(workdir, name)
+            )
+            for name in ("copied.ts", "encoded.ts")
+        ]
+    return bool(copied) and copied == encoded
+
+
+def plan_chunks(
+    keyframes: List[float],
+    duration: float,
+    count: int,
+    min_chunk: float = MIN_CHUNK_SECONDS,
+) -> List[Chunk]:
+    """Splits `duration` into at most `count` chunks starting on keyframes."""
+    count = max(1, min(count, int(duration // min_chunk)))
+    cuts = [0.0]
+    for i in range(1, count):
+        target = duration * i / count
+        # The keyframe closest to the ideal cut, keeping chunks long enough.
+        candidates = [
+            time
+            for time in keyframes
+            if time - cuts[-1] >= min_chunk and duration - time >= min_chunk
+        ]
+        if not candidates:
+            break
+        cut = min(candidates, key=lambda time: abs(time - target))
+        if cut > cuts[-1]:
+            cuts.append(cut)
+
+    return [Chunk(start, end) for start, end in zip(cuts, cuts[1:] + [None])]
+
+
+def plan_smart_chunks(
+    keyframes: List[float],
+    duration: float,
+    events: List[Tuple[float, float]],
+    min_copy: float = MIN_COPY_SECONDS,
+) -> List[Chunk]:
+    """Splits the video on keyframes into chunks with subtitles and chunks without.
+
+    A group of pictures showing any of the `events` is encoded, the runs of groups of
+    pictures without subtitles lasting at least `min_copy` seconds are stream copied.
+    """
+    cuts = [time for time in keyframes if 0.0 < time < duration]
+    chunks = [
+        Chunk(
+            start,
+            end,
+            any(
+                event_start < end and event_end > start
+                for event_start, event_end in events
+            ),
+        )
+        for start, end in zip([0.0] + cuts, cuts + [duration])
+    ]
+
+    merged = []
+    for chunk in _merge_chunks(chunks):
+        if not chunk.encode and chunk.end - chunk.start < min_copy:
+            chunk = chunk._replace(encode=True)
+        merged.append(chunk)
+    merged = _merge_chunks(merged)
+
+    if merged:
+        merged[-1] = merged[-1]._replace(end=None)
+    return merged
+
+
+def _merge_chunks(chunks: List[Chunk]) -> List[Chunk]:
+    merged = []
+    for chunk in chunks:
+        if merged and merged[-1].encode == chunk.encode:
+            merged[-1] = merged[-1]._replace(end=chunk.end)
+        else:
+            merged.append(chunk)
+    return merged
+
+
+def _parse_ass_time(value: str) -> float:
+    hours, minutes, seconds = value.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def ass_events(ass_content: str) -> List[Tuple[float, float]]:
+    """Returns the (start, end) times of the Dialogue events."""
+    events = []
+    for line in ass_content.split("\n"):
+        match = _DIALOGUE.match(line)
+        if match is not None:
+            events.append(
+                (_parse_ass_time(match.group(2)), _parse_ass_time(match.group(3)))
+            )
+    return events
+
+
+def changed_events(
+    old_content: str, new_content: str
+) -> Optional[List[Tuple[float, float]]]:
+    """Returns the (start, end) times of the events added or removed by an edit.
+
+    Returns None if the edit changed more than the events, e.g. the styles.
+    """
+    old_lines = old_content.split("\n")
+    new_lines = new_content.split("\n")
+    old_events = {line for line in old_lines if _DIALOGUE.match(line)}
+    new_events = {line for line in new_lines if _DIALOGUE.match(line)}
+
+    old_header = [line for line in old_lines if line not in old_events]
+    new_header = [line for line in new_lines if line not in new_events]
+    if old_header != new_header:
+        return None
+
+    return ass_events("\n".join(old_events ^ new_events))
+
+
+def shift_ass(ass_content: str, start: float, end: Optional[float]) -> str:
+    """Keeps the events overlapping [start, end) and moves them `start` seconds earlier."""
+    lines = []
+    for line in ass_content.split("\n"):
+        match = _DIALOGUE.match(line)
+        if match is None:
+            lines.append(line)
+            continue
+
+        event_start = _parse_ass_time(match.group(2))
+        event_end = _parse_ass_time(match.group(3))
+        if event_end <= start or (end is not None and event_start >= end):
+            continue
+
+        lines.append(
+            "%s%s,%s,%s"
+            % (
+                match.group(1),
+                format_ass_timestamp(max(event_start - start, 0.0)),
+                format_ass_timestamp(event_end - start),
+                line[match.end() :],
+            )
+        )
+    return "\n".join(lines)
+
+
+async def render_segmented(
+    pool: RenderPool,
+    input_path: str,
+    ass_content: str,
+    encoder_args: List[str],
+    output_path: str,
+    duration: float,
+    chunks: List[Chunk],
+    on_progress: Optional[Callable[[float], None]] = None,
+    timeout: Optional[float] = None,
+    output_args: Optional[List[str]] = None,
+):
+    """Renders each chunk in parallel and joins the chunks in `output_path`.
+
+    Args:
+      pool: Pool running the ffmpeg processes, its slots bound the parallelism.
+      input_path: Media to render.
+      ass_content: Subtitles of the complete media.
+      encoder_args: Video encoder arguments, e.g. ["-c:v", "libx264", "-crf", "20"].
+      output_path: Rendered video, with the audio of the input.
+      duration: Duration of the input.
+      chunks: Chunks returned by `plan_chunks` or `plan_smart_chunks`. Copied chunks
+        are read from their `source` if set.
+      on_progress: Called with the encoded fraction of the whole video.
+      timeout: Seconds after which the render of a chunk is killed.
+      output_args: Muxer arguments of the joined output, e.g. ["-movflags", "+faststart"].
+
+    Raises:
+      RenderError: if a chunk fails, the copied chunks do not have the sequence
+        parameters of the encoded ones, or the output duration does not match the input.
+    """
+    input_path = os.path.abspath(input_path)
+    lengths = [
+        (chunk.end if chunk.end is not None else duration) - chunk.start
+        for chunk in chunks
+    ]
+    fractions = [0.0] * len(chunks)
+
+    # MPEG-TS chunks carry the H.264 parameter sets in band, so copied and encoded
+    # chunks can follow each other.
+    extension = ".mp4" if all(chunk.encode for chunk in chunks) else ".ts"
+
+    # The sequence parameter sets of the first encoded and copied chunks.
+    parameters = {}
+
+    def chunk_progress(index):
+        def report(fraction):
+            fractions[index] = fraction
+            if on_progress is not None:
+                on_progress(sum(f * n for f, n in zip(fractions, lengths)) / duration)
+
+        return report
+
+    with pool.workdir() as workdir:
+
+        async def render_chunk(index, chunk):
+            # Input seeking does not decode the beginning of the video. It is frame
+            # accurate when encoding, and exact when copying from a keyframe.
+            command = ["-ss", "%.6f" % chunk.start]
+            if chunk.end is not None:
+                command += ["-t", "%.6f" % (chunk.end - chunk.start)]
+            source = os.path.abspath(chunk.source) if chunk.source else input_path
+            command += ["-i", source, "-map", "0:v:0", "-an", "-sn"]
+
+            if chunk.encode:
+                subtitles = "chunk-%03d.ass" % index
+                with open(os.path.join(workdir, subtitles), "w", encoding="utf-8") as f:
+                    f.write(shift_ass(ass_content, chunk.start, chunk.end))
+                command += ["-vf", "ass=" + subtitles] + encoder_args
+            else:
+                command += ["-c:v", "copy"]
+            name = "chunk-%03d%s" % (index, extension)
+            command += [name]
+
+            await pool.run(
+                command,
+                workdir,
+                lengths[index],
+                chunk_progress(index),
+                timeout,
+                cpu_bound=chunk.encode,
+            )
+
+            # A last check, `can_copy_chunks` is expected to be called before planning.
+            if extension == ".ts" and chunk.encode not in parameters:
+                parameters[chunk.encode] = await asyncio.to_thread(
+                    sequence_parameter_sets, os.path.join(workdir, name)
+                )
+                if len(set(parameters.values())) > 1:
+                    raise RenderError(
+                        "The copied chunks do not have the H.264 parameters of the "
+                        "encoder output"
+                    )
+
+        tasks = [
+            asyncio.ensure_future(render_chunk(index, chunk))
+            for index, chunk in enumerate(chunks)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        with open(os.path.join(workdir, "chunks.txt"), "w", encoding="utf-8") as f:
+            for index in range(len(chunks)):
+                f.write("file 'chunk-%03d%s'\n" % (index, extension))
+
+        await pool.run(
+            [
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                "chunks.txt",
+                "-i",
+                input_path,
+                "-map",
+                "0:v:0",
+                "-map",
+                "1:a?",
+                "-c",
+                "copy",
+                *(output_args or []),
+                output_path,
+            ],
+            workdir,
+            timeout=timeout,
+            cpu_bound=False,
+        )
+
+    output_duration = await asyncio.to_thread(probe_duration, output_path)
+    if output_duration is None or abs(output_duration - duration) > 1.0:
+        raise RenderError(
+            "Segmented render duration %.2fs does not match the input duration %.2fs"
+            % (output_duration or 0.0, duration)
+        )
@@ -0,0 +1,79 @@
+"""Single-flight execution of identical concurrent requests.
+
+Callers asking for a key that is already being computed wait for the same computation
+instead of starting a new one. The computation runs in its own task, so cancelling one
+of its callers does not cancel it for the others: it is only cancelled when no caller
+waits for it anymore.
+"""
+
+import asyncio
+
+from typing import Any, Awaitable, Callable, Hashable, List, Optional
+
+
+class Flight:
+    """A computation producing one or several keys, and the number of its callers."""
+
+    def __init__(self, task: asyncio.Future, keys: List[Hashable]):
+        self.task = task
+        self.keys = keys
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def get(self, key: Hashable) -> Optional[Flight]:
+        """Returns the computation in progress for `key`, if any."""
+        return self._flights.get(key)
+
+    def start(self, keys: List[Hashable], fn: Callable[[], Awaitable]) -> Flight:
+        """Starts computing `keys` with `fn()` in a new task."""
+        flight = Flight(asyncio.ensure_future(fn()), keys)
+        for key in keys:
+            self._flights[key] = flight
+        flight.task.add_done_callback(lambda task: self._finish(flight))
+        return flight
+
+    async def wait(self, flights: List[Flight]) -> List[Any]:
+        """Returns the results of `flights`, or raises the first exception.
+
+        If the caller is cancelled, the flights no other caller waits for are cancelled.
+        """
+        for flight in flights:
+            flight.waiters += 1
+        try:
+            return [await asyncio.shield(flight.task) for flight in flights]
+        except asyncio.CancelledError:
+            for flight in flights:
+                if flight.waiters == 1 and not flight.task.done():
+                    flight.task.cancel()
+                    # New callers must not join the cancelled computation.
+                    self._finish(flight)
+            raise
+        finally:
+            for flight in flights:
+                flight.waiters -= 1
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Returns the result of `fn()`, or of the computation in progress for `key`."""
+        flight = self.get(key)
+        if flight is None:
+            flight = self.start([key], fn)
+        (result,) = await self.wait([flight])
+        return result
+
+    def _finish(self, flight: Flight):
+        for key in flight.keys:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        if flight.task.done() and not flight.task.cancelled():
+            # Waiters re-raise the exception, nobody else has to retrieve it.
+            flight.task.exception()
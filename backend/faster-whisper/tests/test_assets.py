@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+from fastapi import UploadFile
+
+from assets import AssetStore
+
+
+def add(store, content, filename="clip.MP4"):
+    upload = UploadFile(io.BytesIO(content), filename=filename)
+    return asyncio.run(store.add(upload))
+
+
+def test_asset_store_add(tmp_path):
+    store = AssetStore(str(tmp_path))
+
+    asset = add(store, b"video")
+
+    assert asset.asset_id == hashlib.sha256(b"video").hexdigest()
+    assert asset.suffix == ".mp4"
+    assert asset.size == 5
+    with open(asset.media_path, "rb") as media:
+        assert media.read() == b"video"
+
+    # The same content is stored once.
+    assert add(store, b"video", filename="copy.mkv").asset_id == asset.asset_id
+    assert store.stats() == {"assets": 1, "leased": 0, "media_bytes": 5}
+    assert sorted(os.listdir(tmp_path)) == [asset.asset_id]
+
+
+def test_asset_store_reload(tmp_path):
+    asset = add(AssetStore(str(tmp_path)), b"video")
+
+    store = AssetStore(str(tmp_path))
+
+    reloaded = store.get(asset.asset_id)
+    assert reloaded.media_path == asset.media_path
+    assert reloaded.filename == "clip.MP4"
+
+
+def test_asset_store_transcripts(tmp_path):
+    store = AssetStore(str(tmp_path))
+    asset = add(store, b"video")
+
+    assert store.load_transcript(asset, "key") is None
+    store.save_transcript(asset, "key", {"text": "Ask not"})
+    assert store.load_transcript(asset, "key") == {"text": "Ask not"}
+
+
+def test_asset_store_quota(tmp_path):
+    store = AssetStore(str(tmp_path), max_disk_bytes=3000)
+    first = add(store, bytes(1000))
+    second = add(store, bytes(1000) + b"second")
+    first.last_access = second.last_access = time.time() - 10
+
+    # The least recently used asset is evicted, not the one just added.
+    store.get(first.asset_id)
+    third = add(store, bytes(1000) + b"third")
+
+    assert store.get(second.asset_id) is None
+    assert store.get(first.asset_id) is not None
+    assert store.get(third.asset_id) is not None
+    assert not os.path.exists(second.directory)
+
+
+def test_asset_store_lease(tmp_path):
+    store = AssetStore(str(tmp_path), ttl=60, max_disk_bytes=0)
+    asset = add(store, b"video")
+
+    with store.lease(asset.asset_id) as leased:
+        assert leased is asset
+        # Neither expiry, the quota nor a delete remove an asset in use.
+        asset.last_access -= 120
+        store.evict()
+        assert store.get(asset.asset_id) is asset
+        assert not store.delete(asset.asset_id)
+        assert store.stats()["leased"] == 1
+
+    assert store.stats()["leased"] == 0
+    assert store.delete(asset.asset_id)
+    assert store.get(asset.asset_id) is None
+
+    with pytest.raises(KeyError):
+        with store.lease(asset.asset_id):
+            pass
+
+
+def test_asset_store_ttl(tmp_path):
+    store = AssetStore(str(tmp_path), ttl=60)
+    asset = add(store, b"video")
+
+    asset.last_access -= 120
+
+    assert store.get(asset.asset_id) is None
+    assert os.listdir(tmp_path) == []
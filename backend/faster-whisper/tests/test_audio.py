@@ -0,0 +1,123 @@
+import os
+import wave
+
+import numpy as np
+import pytest
+
+import faster_whisper.audio
+
+from faster_whisper import decode_audio, decode_audio_blocks
+from faster_whisper.audio import cached_audio
+
+
+def test_decode_audio_blocks(jfk_path):
+    audio = decode_audio(jfk_path)
+    blocks = list(decode_audio_blocks(jfk_path, block_size=48000))
+
+    assert [block.shape for block in blocks] == [(48000,)] * 3 + [(32000,)]
+    assert all(block.dtype == np.float32 for block in blocks)
+    np.testing.assert_array_equal(np.concatenate(blocks), audio)
+
+
+def test_decode_audio_blocks_stereo(data_dir):
+    audio_path = os.path.join(data_dir, "stereo_diarization.wav")
+    left, right = decode_audio(audio_path, split_stereo=True)
+    blocks = list(decode_audio_blocks(audio_path, split_stereo=True, block_size=30000))
+
+    assert [block.shape for block in blocks] == [(2, 30000)] * 2 + [(2, 20000)]
+    np.testing.assert_array_equal(
+        np.concatenate(blocks, axis=1), np.stack([left, right])
+    )
+
+
+def test_decode_audio_without_resampling(tmp_path):
+    samples = np.arange(-32768, 32768, 7, dtype=np.int16)
+    audio_path = str(tmp_path / "mono.wav")
+    with wave.open(audio_path, "wb") as audio_file:
+        audio_file.setnchannels(1)
+        audio_file.setsampwidth(2)
+        audio_file.setframerate(16000)
+        audio_file.writeframes(samples.tobytes())
+
+    audio = decode_audio(audio_path)
+
+    assert audio.dtype == np.float32
+    np.testing.assert_array_equal(audio, samples / np.float32(32768))
+
+
+def test_decode_audio_downmix_level(data_dir):
+    audio_path = os.path.join(data_dir, "stereo_diarization.wav")
+    left, right = decode_audio(audio_path, split_stereo=True)
+    audio = decode_audio(audio_path)
+
+    np.testing.assert_allclose(audio, (left + right) / 2, atol=1e-6)
+
+
+def test_decode_audio_cache(jfk_path, tmp_path):
+    audio = decode_audio(jfk_path)
+    cached_audio = decode_audio(jfk_path, cache_dir=str(tmp_path))
+
+    assert not isinstance(cached_audio, np.memmap)
+    np.testing.assert_array_equal(cached_audio, audio)
+    assert len(os.listdir(tmp_path)) == 1
+
+    cached_audio = decode_audio(jfk_path, cache_dir=str(tmp_path))
+
+    assert isinstance(cached_audio, np.memmap)
+    np.testing.assert_array_equal(cached_audio, audio)
+
+    resampled_audio = decode_audio(
+        jfk_path, sampling_rate=8000, cache_dir=str(tmp_path)
+    )
+
+    assert resampled_audio.shape == (audio.shape[0] // 2,)
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_decode_audio_cache_key_and_quota(jfk_path, tmp_path):
+    assert cached_audio(str(tmp_path), "jfk") is None
+
+    audio = decode_audio(jfk_path, cache_dir=str(tmp_path), cache_key="jfk")
+
+    assert os.listdir(tmp_path) == ["jfk-16000.npy"]
+    np.testing.assert_array_equal(cached_audio(str(tmp_path), "jfk"), audio)
+
+    # Saving the 8 kHz audio exceeds the quota, the 16 kHz audio is evicted.
+    max_cache_bytes = audio.nbytes + 1000
+    decode_audio(
+        jfk_path,
+        sampling_rate=8000,
+        cache_dir=str(tmp_path),
+        cache_key="jfk",
+        max_cache_bytes=max_cache_bytes,
+    )
+
+    assert os.listdir(tmp_path) == ["jfk-8000.npy"]
+
+
+def test_decode_audio_num_workers(data_dir, monkeypatch):
+    monkeypatch.setattr(faster_whisper.audio, "_MIN_SHARD_DURATION", 10)
+    audio_path = os.path.join(data_dir, "multilingual.mp3")
+    audio = decode_audio(audio_path)
+    sharded_audio = decode_audio(audio_path, num_workers=3)
+
+    np.testing.assert_array_equal(sharded_audio, audio)
+
+
+def test_decode_audio_time_range(jfk_path):
+    audio = decode_audio(jfk_path)
+    audio_range = decode_audio(jfk_path, start_time=3.3, end_time=7.7)
+
+    np.testing.assert_array_equal(audio_range, audio[52800:123200])
+
+    audio_end = decode_audio(jfk_path, start_time=9)
+
+    np.testing.assert_array_equal(audio_end, audio[144000:])
+
+    # The output is not allocated for the whole range when it ends after the file.
+    audio_past_end = decode_audio(jfk_path, start_time=2, end_time=1e7)
+
+    np.testing.assert_array_equal(audio_past_end, audio[32000:])
+
+    with pytest.raises(ValueError, match="Invalid time range"):
+        decode_audio(jfk_path, start_time=5, end_time=2)
@@ -0,0 +1,178 @@
+import dataclasses
+import threading
+import time
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from batching import BatchScheduler, ScheduledPipeline
+from faster_whisper import BatchedInferencePipeline
+from faster_whisper.transcribe import TranscriptionOptions
+
+OPTIONS = TranscriptionOptions(
+    beam_size=5,
+    best_of=5,
+    patience=1,
+    length_penalty=1,
+    repetition_penalty=1,
+    no_repeat_ngram_size=0,
+    log_prob_threshold=-1.0,
+    no_speech_threshold=0.6,
+    compression_ratio_threshold=2.4,
+    condition_on_previous_text=True,
+    prompt_reset_on_temperature=0.5,
+    temperatures=[0.0],
+    initial_prompt=None,
+    prefix=None,
+    suppress_blank=True,
+    suppress_tokens=[-1],
+    without_timestamps=True,
+    max_initial_timestamp=0.0,
+    word_timestamps=False,
+    prepend_punctuations="",
+    append_punctuations="",
+    multilingual=False,
+    max_new_tokens=None,
+    clip_timestamps="0",
+    hallucination_silence_threshold=None,
+    hotwords=None,
+)
+
+ENGLISH = SimpleNamespace(language_code="en", task="transcribe")
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Replaces the model call, records the windows of every batch."""
+    batches = []
+
+    def generate_segment_batched(pipeline, features, tokenizer, options):
+        batches.append((tokenizer.language_code, features[:, 0].tolist()))
+        if (features < 0).any():
+            raise RuntimeError("generation failed")
+        return "encoder_output", [{"window": window} for window in features[:, 0]]
+
+    monkeypatch.setattr(
+        BatchedInferencePipeline, "generate_segment_batched", generate_segment_batched
+    )
+    return batches
+
+
+def submit(requests):
+    """Generates every (pipeline, windows, tokenizer, options) in its own thread."""
+    results = [None] * len(requests)
+
+    def run(i, pipeline, windows, tokenizer, options):
+        features = np.array(windows, dtype=np.float32).reshape(-1, 1)
+        try:
+            results[i] = pipeline.generate_segment_batched(features, tokenizer, options)
+        except Exception as e:
+            results[i] = e
+
+    threads = []
+    for i, request in enumerate(requests):
+        thread = threading.Thread(target=run, args=(i,) + request)
+        thread.start()
+        threads.append(thread)
+        # Submitted in order.
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def windows_of(result):
+    _, outputs = result
+    return [output["window"] for output in outputs]
+
+
+def test_batch_across_requests(batches):
+    model = SimpleNamespace()
+    scheduler = BatchScheduler(max_batch_size=6, max_wait=5)
+    requests = [
+        (ScheduledPipeline(model, scheduler), windows, ENGLISH, OPTIONS)
+        for windows in ([1, 2], [3], [4, 5, 6])
+    ]
+
+    results = submit(requests)
+
+    # The batch runs as soon as it is full, and every request gets its own windows.
+    assert batches == [("en", [1, 2, 3, 4, 5, 6])]
+    assert [windows_of(result) for result in results] == [[1, 2], [3], [4, 5, 6]]
+    assert scheduler.stats() == {
+        "batches": 1,
+        "requests": 3,
+        "windows": 6,
+        "mean_batch_size": 6,
+        "waiting": 0,
+    }
+
+
+def test_batch_keys(batches):
+    model, other_model = SimpleNamespace(), SimpleNamespace()
+    scheduler = BatchScheduler(max_batch_size=16, max_wait=0.5)
+    french = SimpleNamespace(language_code="fr", task="transcribe")
+    sampling = dataclasses.replace(OPTIONS, temperatures=[1.0])
+
+    results = submit(
+        [
+            (ScheduledPipeline(model, scheduler), [1], ENGLISH, OPTIONS),
+            (ScheduledPipeline(model, scheduler), [2], french, OPTIONS),
+            (ScheduledPipeline(other_model, scheduler), [3], ENGLISH, OPTIONS),
+            (ScheduledPipeline(model, scheduler), [4], ENGLISH, sampling),
+            (ScheduledPipeline(model, scheduler), [5], ENGLISH, OPTIONS),
+        ]
+    )
+
+    # Only the windows with the same model, language and options share a batch.
+    assert sorted(batches) == [
+        ("en", [1, 5]),
+        ("en", [3]),
+        ("en", [4]),
+        ("fr", [2]),
+    ]
+    assert [windows_of(result) for result in results] == [[1], [2], [3], [4], [5]]
+
+
+def test_batch_full(batches):
+    model = SimpleNamespace()
+    scheduler = BatchScheduler(max_batch_size=4, max_wait=0.1)
+
+    results = submit(
+        [
+            (ScheduledPipeline(model, scheduler), windows, ENGLISH, OPTIONS)
+            for windows in ([1, 2, 3], [4, 5], [6, 7, 8, 9, 10])
+        ]
+    )
+
+    # A request not fitting in the batch goes into the next one, a request larger
+    # than a batch runs alone.
+    assert sorted(batches) == [
+        ("en", [1, 2, 3]),
+        ("en", [4, 5]),
+        ("en", [6, 7, 8, 9, 10]),
+    ]
+    assert [windows_of(result) for result in results] == [
+        [1, 2, 3],
+        [4, 5],
+        [6, 7, 8, 9, 10],
+    ]
+
+
+def test_batch_error(batches):
+    model = SimpleNamespace()
+    scheduler = BatchScheduler(max_batch_size=3, max_wait=5)
+
+    results = submit(
+        [
+            (ScheduledPipeline(model, scheduler), windows, ENGLISH, OPTIONS)
+            for windows in ([1], [-2], [3])
+        ]
+    )
+
+    # Every request of the failed batch gets the error.
+    assert len(batches) == 1
+    assert [str(result) for result in results] == ["generation failed"] * 3
+    assert scheduler.stats()["waiting"] == 0
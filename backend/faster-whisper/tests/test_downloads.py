@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from starlette.requests import Request
+
+from downloads import file_response, parse_range
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=10-19", (10, 19)),
+        # Open-ended range.
+        ("bytes=10-", (10, 99)),
+        # The end is clamped to the size of the file.
+        ("bytes=90-200", (90, 99)),
+        # Suffix range, longer than the file.
+        ("bytes=-10", (90, 99)),
+        ("bytes=-500", (0, 99)),
+        (" bytes = 5-6", (5, 6)),
+        # The whole file is sent for several ranges or a malformed header.
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+        ("bytes=a-b", None),
+        ("bytes=-", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=20-10"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
+
+
+def make_request(range_header):
+    headers = [(b"range", range_header.encode("latin-1"))]
+    return Request({"type": "http", "method": "GET", "headers": headers})
+
+
+def test_file_response_range(tmp_path):
+    path = tmp_path / "render.mp4"
+    path.write_bytes(bytes(range(100)))
+
+    response = file_response(make_request("bytes=-10"), str(path), "video/mp4")
+
+    async def read_body():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 90-99/100"
+    assert response.headers["content-length"] == "10"
+    assert asyncio.run(read_body()) == bytes(range(90, 100))
+
+
+def test_file_response_unsatisfiable_range(tmp_path):
+    path = tmp_path / "render.mp4"
+    path.write_bytes(bytes(100))
+
+    response = file_response(make_request("bytes=100-"), str(path), "video/mp4")
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import encoder_profiles
+
+from encoder_profiles import PresetSelector, render_threads
+from render import RenderPool
+
+# One minute of 1080p at 30 frames per second.
+PIXELS = 1920 * 1080 * 30 * 60
+
+
+@pytest.fixture
+def selector(monkeypatch):
+    monkeypatch.setattr(encoder_profiles, "_load_factor", lambda: 1.0)
+    selector = PresetSelector("medium", safety=1.25)
+    # Calibration of a host encoding 10 Mpixels/s per thread with medium.
+    for preset in selector.presets:
+        selector.record(
+            preset, 1e6, 1, 1e6 / encoder_profiles.DEFAULT_THROUGHPUT[preset]
+        )
+    return selector
+
+
+def test_select(selector):
+    # The standard tier gives 2 minutes to a 1 minute export.
+    assert selector.select(PIXELS, 8, 120.0) == "medium"
+    assert selector.select(PIXELS, 2, 120.0) == "veryfast"
+    assert selector.select(PIXELS, 1, 120.0) == "superfast"
+    assert selector.select(PIXELS, 1, 1.0) == "ultrafast"
+    assert selector.select(PIXELS, 1, None) == "medium"
+
+
+def test_render_threads(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 16)
+    pool = RenderPool()
+
+    assert render_threads(pool, 60.0, parallel=False) == 16
+    # Short videos are not cut, long ones in up to 4 chunks sharing the cores.
+    assert render_threads(pool, 45.0, parallel=True) == 16
+    assert render_threads(pool, 600.0, parallel=True) == 16
+
+    pool = RenderPool(max_renders=4, threads=2)
+
+    assert render_threads(pool, 60.0, parallel=False) == 2
+    assert render_threads(pool, 90.0, parallel=True) == 6
+    assert render_threads(pool, 600.0, parallel=True) == 8
@@ -0,0 +1,110 @@
+import asyncio
+
+from jobs import CANCELLED, COMPLETED, FAILED, RUNNING, JobManager, mark_running
+
+
+def test_job_completed():
+    manager = JobManager()
+    statuses = []
+
+    async def work(job):
+        mark_running()
+        statuses.append(job.status)
+        job.report(0.5, "transcribing")
+        job.report(2.0)
+        await asyncio.sleep(0)
+        return "result"
+
+    async def main():
+        job = manager.submit("transcribe", work)
+        events = [event async for event in manager.events(job)]
+        return job, events
+
+    job, events = asyncio.run(main())
+
+    assert statuses == [RUNNING]
+    assert job.status == COMPLETED
+    assert job.result == "result"
+    assert job.progress == 1.0
+    assert job.message == "transcribing"
+    assert events[0].startswith("event: queued\n")
+    assert events[-1].startswith("event: completed\n")
+    assert manager.get(job.job_id) is job
+
+
+def test_job_failed():
+    manager = JobManager()
+
+    async def work(job):
+        raise RuntimeError("ffmpeg failed")
+
+    async def main():
+        job = manager.submit("render", work)
+        await asyncio.sleep(0)
+        return job
+
+    job = asyncio.run(main())
+
+    assert job.status == FAILED
+    assert job.error == "ffmpeg failed"
+    assert job.to_dict()["error"] == "ffmpeg failed"
+
+
+def test_job_cancelled():
+    manager = JobManager()
+
+    async def work(job):
+        await asyncio.sleep(10)
+
+    async def main():
+        job = manager.submit("render", work)
+        await asyncio.sleep(0)
+        assert manager.cancel(job.job_id)
+        await asyncio.sleep(0)
+        return job
+
+    job = asyncio.run(main())
+
+    assert job.status == CANCELLED
+    assert not manager.cancel(job.job_id)
+    assert not manager.cancel("unknown")
+
+
+def test_job_manager_max_jobs():
+    manager = JobManager(max_jobs=2)
+
+    async def work(job):
+        return job.kind
+
+    async def main():
+        jobs = []
+        for kind in ("first", "second", "third"):
+            jobs.append(manager.submit(kind, work))
+            await asyncio.sleep(0)
+        return jobs
+
+    first, second, third = asyncio.run(main())
+
+    # The oldest finished job is dropped to make room for a new one.
+    assert manager.get(first.job_id) is None
+    assert manager.get(second.job_id) is second
+    assert manager.get(third.job_id) is third
+    assert manager.stats() == {COMPLETED: 2}
+
+
+def test_job_manager_ttl():
+    manager = JobManager(ttl=60)
+
+    async def work(job):
+        return None
+
+    async def main():
+        job = manager.submit("transcribe", work)
+        await asyncio.sleep(0)
+        job.updated -= 120
+        manager.submit("transcribe", work)
+        return job
+
+    job = asyncio.run(main())
+
+    assert manager.get(job.job_id) is None
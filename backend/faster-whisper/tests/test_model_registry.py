@@ -0,0 +1,79 @@
+import pytest
+
+import model_registry
+
+from model_registry import ModelRegistry, route_model
+
+
+@pytest.mark.parametrize(
+    "name,language,expected",
+    [
+        ("small", "en", "small.en"),
+        ("large-v3", "en", "distil-large-v3"),
+        # No English variant.
+        ("small.en", "en", "small.en"),
+        ("distil-large-v3", "en", "distil-large-v3"),
+        ("/models/custom", "en", "/models/custom"),
+        # The language is unknown or not English.
+        ("small", None, "small"),
+        ("large-v3", "fr", "large-v3"),
+    ],
+)
+def test_route_model(name, language, expected):
+    assert route_model(name, language) == expected
+
+
+class FakeModel:
+    def __init__(self, model_path, **kwargs):
+        self.model_path = model_path
+        self.kwargs = kwargs
+
+
+@pytest.fixture
+def model_dirs(tmp_path, monkeypatch):
+    """Local model directories whose files weigh 1000 bytes."""
+    monkeypatch.setattr(model_registry, "WhisperModel", FakeModel)
+
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / name
+        path.mkdir()
+        (path / "model.bin").write_bytes(bytes(1000))
+        paths.append(str(path))
+    return paths
+
+
+def test_model_registry_loads_once(model_dirs):
+    registry = ModelRegistry(device="cpu")
+    a = model_dirs[0]
+
+    with registry.use(a) as model:
+        with registry.use(a) as same_model:
+            assert same_model is model
+            assert registry.stats()["resident"][a] == {"bytes": 1000, "users": 2}
+
+    assert model.kwargs == {"device": "cpu"}
+    assert registry.stats()["resident"][a]["users"] == 0
+    assert registry.loads == 1
+
+
+def test_model_registry_eviction(model_dirs):
+    registry = ModelRegistry(max_memory_bytes=2000)
+    a, b, c = model_dirs
+
+    with registry.use(a):
+        with registry.use(b):
+            pass
+        # "b" is evicted, "a" is in use.
+        with registry.use(c):
+            pass
+
+    stats = registry.stats()
+    assert list(stats["resident"]) == [a, c]
+    assert stats["memory_bytes"] == 2000
+    assert stats["evictions"] == 1
+
+    # Models in use are kept even over the budget.
+    with registry.use(a), registry.use(c), registry.use(b):
+        assert registry.stats()["memory_bytes"] == 3000
+    assert registry.loads == 4
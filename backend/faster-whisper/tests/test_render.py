@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from render import RenderPool
+
+
+@pytest.mark.parametrize(
+    "cores,max_renders,alone,together",
+    [(1, 1, 1, 1), (4, 2, 4, 2), (16, 4, 16, 4), (64, 4, 64, 16)],
+)
+def test_render_pool_threads(monkeypatch, cores, max_renders, alone, together):
+    monkeypatch.setattr(os, "cpu_count", lambda: cores)
+    pool = RenderPool()
+
+    assert pool.max_renders == max_renders
+    # A render encoding alone uses all the cores, full slots share them.
+    assert pool.threads_for(1) == alone
+    assert pool.threads_for(pool.max_renders) == together
+
+
+def test_render_pool_fixed_threads(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 16)
+    pool = RenderPool(max_renders=2, threads=3)
+
+    assert pool.threads_for(1) == 3
+    assert pool.threads_for(2) == 3
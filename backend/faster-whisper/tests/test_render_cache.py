@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from render_cache import RenderCache, render_key
+
+
+def make_key(name):
+    return render_key(name, "subtitles", {"crf": 23})
+
+
+def render_all(cache, keys, size=1000):
+    rendered = []
+
+    async def main():
+        for key in keys:
+
+            async def render(output_path):
+                rendered.append(key)
+                with open(output_path, "wb") as output:
+                    output.write(bytes(size))
+
+            await cache.get_or_render(key, render)
+
+    asyncio.run(main())
+    return rendered
+
+
+def test_render_key():
+    key = render_key("digest", "subtitles", {"crf": 23, "preset": "medium"})
+
+    assert key == render_key("digest", "subtitles", {"preset": "medium", "crf": 23})
+    assert key != render_key("digest", "other", {"crf": 23, "preset": "medium"})
+    assert key != render_key("digest", "subtitles", {"crf": 18, "preset": "medium"})
+
+
+def test_render_cache_quota(tmp_path):
+    cache = RenderCache(str(tmp_path), max_disk_bytes=2000)
+    a, b, c = make_key("a"), make_key("b"), make_key("c")
+
+    assert render_all(cache, [a, b, a]) == [a, b]
+    # "b" is the least recently used render, its modification time orders the LRU.
+    os.utime(cache.path(b), (0, time.time() - 10))
+    assert render_all(cache, [c]) == [c]
+
+    assert not os.path.exists(cache.path(b))
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["disk_bytes"] == 2000
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+
+
+def test_render_cache_keeps_render_over_quota(tmp_path):
+    cache = RenderCache(str(tmp_path), max_disk_bytes=1000)
+    a, b = make_key("a"), make_key("b")
+
+    render_all(cache, [a])
+    render_all(cache, [b], size=5000)
+
+    assert not os.path.exists(cache.path(a))
+    assert os.path.getsize(cache.path(b)) == 5000
+
+
+def test_render_cache_ttl(tmp_path):
+    cache = RenderCache(str(tmp_path), ttl=60)
+    a = make_key("a")
+
+    render_all(cache, [a])
+    os.utime(cache.path(a), (0, time.time() - 120))
+
+    assert cache.get(a + ".mp4") is None
+    assert render_all(cache, [a]) == [a]
+
+
+def test_render_cache_removes_partial_files(tmp_path):
+    a = make_key("a")
+    (tmp_path / (a + ".partial.mp4")).write_bytes(bytes(10))
+
+    cache = RenderCache(str(tmp_path))
+
+    assert os.listdir(tmp_path) == []
+    assert cache.stats()["disk_bytes"] == 0
+
+
+def test_render_cache_failed_render(tmp_path):
+    cache = RenderCache(str(tmp_path))
+
+    async def render(output_path):
+        with open(output_path, "wb") as output:
+            output.write(bytes(10))
+        raise RuntimeError("ffmpeg failed")
+
+    async def main():
+        return await cache.get_or_render(make_key("a"), render)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+    assert os.listdir(tmp_path) == []
+    assert cache.stats()["inflight"] == 0
+
+
+def test_render_cache_many_coalesced(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    a, b, c = make_key("a"), make_key("b"), make_key("c")
+    renders = []
+
+    def renderer(delay):
+        async def render(output_paths):
+            renders.append(len(output_paths))
+            await asyncio.sleep(delay)
+            for output_path in output_paths:
+                with open(output_path, "wb") as output:
+                    output.write(bytes(10))
+
+        return render
+
+    async def main():
+        first = asyncio.ensure_future(cache.get_or_render_many([a, b], renderer(0.05)))
+        await asyncio.sleep(0.01)
+        # Only "c" is rendered, "b" is waited for.
+        second = cache.get_or_render_many([b, c], renderer(0))
+        return await asyncio.gather(first, second)
+
+    first, second = asyncio.run(main())
+
+    assert first == [cache.path(a), cache.path(b)]
+    assert second == [cache.path(b), cache.path(c)]
+    assert renders == [2, 1]
+    assert cache.stats()["coalesced"] == 1
@@ -0,0 +1,141 @@
+import pytest
+
+from render_segments import (
+    Chunk,
+    ass_events,
+    changed_events,
+    plan_chunks,
+    plan_smart_chunks,
+    shift_ass,
+)
+
+HEADER = """[Script Info]
+ScriptType: v4.00+
+
+[V4+ Styles]
+Style: Default,Arial,48,&H00FFFFFF
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text"""
+
+
+def make_ass(*events, header=HEADER):
+    lines = [
+        "Dialogue: 0,%s,%s,Default,,0,0,0,,%s" % (start, end, text)
+        for start, end, text in events
+    ]
+    return "\n".join([header] + lines) + "\n"
+
+
+# A keyframe every 2 seconds in a 20 seconds video.
+KEYFRAMES = [float(time) for time in range(0, 20, 2)]
+
+
+def test_plan_smart_chunks_without_events():
+    assert plan_smart_chunks(KEYFRAMES, 20.0, []) == [Chunk(0.0, None, False)]
+
+
+@pytest.mark.parametrize(
+    "event,expected",
+    [
+        # Only the group of pictures showing the event is encoded.
+        ((10.5, 11.0), [(0.0, 10.0, False), (10.0, 12.0, True), (12.0, None, False)]),
+        # An event ending on a keyframe does not overlap the next group of pictures.
+        ((10.0, 12.0), [(0.0, 10.0, False), (10.0, 12.0, True), (12.0, None, False)]),
+        # An event crossing a keyframe overlaps both groups of pictures.
+        ((11.5, 12.5), [(0.0, 10.0, False), (10.0, 14.0, True), (14.0, None, False)]),
+    ],
+)
+def test_plan_smart_chunks_overlap(event, expected):
+    chunks = plan_smart_chunks(KEYFRAMES, 20.0, [event])
+
+    assert chunks == [Chunk(*chunk) for chunk in expected]
+
+
+def test_plan_smart_chunks_min_copy():
+    # The 4 seconds without subtitles between the events are encoded with them.
+    chunks = plan_smart_chunks(KEYFRAMES, 20.0, [(1.0, 1.5), (7.0, 7.5)], min_copy=5.0)
+
+    assert chunks == [Chunk(0.0, 8.0, True), Chunk(8.0, None, False)]
+
+    chunks = plan_smart_chunks(KEYFRAMES, 20.0, [(1.0, 1.5), (7.0, 7.5)], min_copy=4.0)
+
+    assert chunks == [
+        Chunk(0.0, 2.0, True),
+        Chunk(2.0, 6.0, False),
+        Chunk(6.0, 8.0, True),
+        Chunk(8.0, None, False),
+    ]
+
+
+def test_plan_chunks():
+    keyframes = [float(time) for time in range(0, 120, 10)]
+
+    assert plan_chunks(keyframes, 120.0, 4) == [
+        Chunk(0.0, 30.0),
+        Chunk(30.0, 60.0),
+        Chunk(60.0, 90.0),
+        Chunk(90.0, None),
+    ]
+
+
+def test_plan_chunks_min_chunk():
+    # Too short to be split.
+    assert plan_chunks([0.0, 10.0, 20.0], 50.0, 4) == [Chunk(0.0, None)]
+
+    # Not enough keyframes for the requested number of chunks.
+    assert plan_chunks([0.0, 50.0], 100.0, 4) == [Chunk(0.0, 50.0), Chunk(50.0, None)]
+
+
+def test_ass_events():
+    content = make_ass(
+        ("0:00:01.50", "0:00:03.00", "Ask not"),
+        ("1:01:01.50", "1:01:02.25", "country."),
+    )
+
+    assert ass_events(content) == [(1.5, 3.0), (3661.5, 3662.25)]
+
+
+def test_changed_events():
+    old = make_ass(
+        ("0:00:01.00", "0:00:02.00", "Ask not"),
+        ("0:00:05.00", "0:00:06.00", "what your country"),
+    )
+    new = make_ass(
+        ("0:00:01.00", "0:00:02.00", "Ask not"),
+        ("0:00:05.00", "0:00:06.50", "what your country can do"),
+    )
+
+    assert sorted(changed_events(old, new)) == [(5.0, 6.0), (5.0, 6.5)]
+    assert changed_events(old, old) == []
+
+
+def test_changed_events_style_change():
+    events = [("0:00:01.00", "0:00:02.00", "Ask not")]
+    old = make_ass(*events)
+    new = make_ass(*events, header=HEADER.replace("Arial,48", "Arial,64"))
+
+    assert changed_events(old, new) is None
+
+
+def test_shift_ass():
+    content = make_ass(
+        ("0:00:01.00", "0:00:03.00", "before"),
+        ("0:00:03.00", "0:00:06.00", "crossing the start"),
+        ("0:00:05.00", "0:00:09.00", "inside"),
+        ("0:00:09.50", "0:00:11.00", "crossing the end"),
+        ("0:00:12.00", "0:00:13.00", "after"),
+    )
+
+    shifted = shift_ass(content, 4.0, 10.0)
+
+    assert shifted.startswith(HEADER)
+    assert ass_events(shifted) == [(0.0, 2.0), (1.0, 5.0), (5.5, 7.0)]
+    assert "before" not in shifted and "after" not in shifted
+
+    assert ass_events(shift_ass(content, 4.0, None)) == [
+        (0.0, 2.0),
+        (1.0, 5.0),
+        (5.5, 7.0),
+        (8.0, 9.0),
+    ]
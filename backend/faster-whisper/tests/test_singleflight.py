@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_single_flight_coalesces_callers():
+    flights = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        results = await asyncio.gather(
+            flights.run("key", compute), flights.run("key", compute)
+        )
+        assert "key" not in flights
+        return results
+
+    assert asyncio.run(main()) == ["result", "result"]
+    assert len(calls) == 1
+
+
+def test_single_flight_cancel_one_waiter():
+    flights = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(flights.run("key", compute))
+        second = asyncio.ensure_future(flights.run("key", compute))
+        await asyncio.sleep(0.01)
+
+        # The other caller still waits for the computation.
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        assert not flights.get("key").task.done()
+
+        return await second
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_single_flight_cancel_last_waiter():
+    flights = SingleFlight()
+    started = []
+
+    async def compute():
+        started.append(None)
+        await asyncio.sleep(10)
+
+    async def main():
+        caller = asyncio.ensure_future(flights.run("key", compute))
+        await asyncio.sleep(0.01)
+        task = flights.get("key").task
+
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert task.cancelled()
+        assert "key" not in flights
+
+        # A new caller does not join the cancelled computation.
+        async def recompute():
+            started.append(None)
+            return "result"
+
+        return await flights.run("key", recompute)
+
+    assert asyncio.run(main()) == "result"
+    assert len(started) == 2
+
+
+def test_single_flight_error():
+    flights = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("failed")
+
+    async def main():
+        results = await asyncio.gather(
+            flights.run("key", compute),
+            flights.run("key", compute),
+            return_exceptions=True,
+        )
+        assert len(flights) == 0
+        return results
+
+    results = asyncio.run(main())
+
+    assert [str(error) for error in results] == ["failed", "failed"]
+
+
+def test_single_flight_many_keys():
+    flights = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        return ["a", "b"]
+
+    async def main():
+        flight = flights.start(["a", "b"], compute)
+        assert flights.get("a") is flight and flights.get("b") is flight
+
+        other = flights.start(["c"], lambda: asyncio.sleep(0))
+        return await flights.wait([flight, other])
+
+    assert asyncio.run(main()) == [["a", "b"], None]
+
+
+@pytest.mark.parametrize("cancelled", [0, 1])
+def test_single_flight_wait_cancel_shared_flight(cancelled):
+    # A caller waiting for several flights only cancels those nobody else waits for.
+    flights = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        shared = flights.start(["shared"], compute)
+        own = flights.start(["own"], compute)
+        callers = [
+            asyncio.ensure_future(flights.wait([shared, own])),
+            asyncio.ensure_future(flights.wait([shared])),
+        ]
+        await asyncio.sleep(0.01)
+
+        callers[cancelled].cancel()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        return shared.task, own.task, results
+
+    shared, own, results = asyncio.run(main())
+
+    assert shared.result() == "result"
+    assert own.cancelled() == (cancelled == 0)
+    assert isinstance(results[cancelled], asyncio.CancelledError)
@@ -0,0 +1,141 @@
+import io
+import json
+
+import pytest
+
+from faster_whisper import write_subtitles
+from faster_whisper.subtitles import format_ass_timestamp, iter_ass, iter_subtitles
+from faster_whisper.transcribe import Segment, Word
+
+
+def make_segment(id, words):
+    return Segment(
+        id=id,
+        seek=0,
+        start=words[0].start,
+        end=words[-1].end,
+        text="".join(word.word for word in words),
+        tokens=[],
+        avg_logprob=0.0,
+        compression_ratio=1.0,
+        no_speech_prob=0.0,
+        words=words,
+        temperature=0.0,
+    )
+
+
+@pytest.fixture
+def segments():
+    return [
+        make_segment(
+            1,
+            [
+                Word(0.0, 0.5, " Ask", 0.9),
+                Word(0.5, 1.0, " not", 0.9),
+                Word(1.2, 1.7, " what", 0.8),
+            ],
+        ),
+        make_segment(2, [Word(3661.5, 3662.25, " country.", 0.7)]),
+    ]
+
+
+def test_write_srt(segments):
+    output = io.StringIO()
+    write_subtitles(segments, output, "srt")
+    assert output.getvalue() == (
+        "1\n00:00:00,000 --> 00:00:01,700\nAsk not what\n\n"
+        "2\n01:01:01,500 --> 01:01:02,250\ncountry.\n\n"
+    )
+
+
+def test_write_vtt(segments):
+    output = io.StringIO()
+    write_subtitles(segments, output, "vtt")
+    assert output.getvalue() == (
+        "WEBVTT\n\n"
+        "00:00:00.000 --> 00:00:01.700\nAsk not what\n\n"
+        "01:01:01.500 --> 01:01:02.250\ncountry.\n\n"
+    )
+
+
+def test_write_jsonl(segments):
+    output = io.StringIO()
+    write_subtitles(segments, output, "jsonl")
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 2
+
+    segment = json.loads(lines[0])
+    assert segment["id"] == 1
+    assert segment["text"] == "Ask not what"
+    assert segment["words"][2] == {
+        "word": " what",
+        "start": 1.2,
+        "end": 1.7,
+        "probability": 0.8,
+    }
+
+
+def test_format_ass_timestamp():
+    assert format_ass_timestamp(0.0) == "0:00:00.00"
+    assert format_ass_timestamp(1.29999) == "0:00:01.30"
+    assert format_ass_timestamp(3661.5) == "1:01:01.50"
+
+
+def test_ass_segments(segments):
+    events = list(iter_ass(segments, header=""))
+    assert events == [
+        "Dialogue: 0,0:00:00.00,0:00:01.70,Default,,0,0,0,,Ask not what\n",
+        "Dialogue: 0,1:01:01.50,1:01:02.25,Default,,0,0,0,,country.\n",
+    ]
+
+
+def test_ass_color_karaoke(segments):
+    events = list(
+        iter_ass(
+            segments,
+            header="",
+            karaoke="color",
+            window_size=2,
+            text_color="&H00FFFFFF",
+            highlight_color="&H0000FFFF",
+        )
+    )
+    assert len(events) == 4
+    assert events[1] == (
+        "Dialogue: 0,0:00:00.50,0:00:01.00,Default,,0,0,0,,"
+        "{\\c&H00FFFFFF&}Ask{\\r} {\\c&H0000FFFF&}not{\\r}\n"
+    )
+    # Windows span segments.
+    assert events[3].endswith(
+        "{\\c&H00FFFFFF&}what{\\r} {\\c&H0000FFFF&}country.{\\r}\n"
+    )
+
+
+def test_ass_k_karaoke(segments):
+    events = list(iter_ass(segments, header="", karaoke="kf", window_size=3))
+    assert events == [
+        "Dialogue: 0,0:00:00.00,0:00:01.70,Default,,0,0,0,,"
+        "{\\kf50}Ask {\\kf50}not {\\k20}{\\kf50}what\n",
+        "Dialogue: 0,1:01:01.50,1:01:02.25,Default,,0,0,0,,{\\kf75}country.\n",
+    ]
+
+
+def test_writers_consume_segments_lazily(segments):
+    consumed = []
+
+    def generate():
+        for segment in segments:
+            consumed.append(segment.id)
+            yield segment
+
+    chunks = iter_subtitles(generate(), "srt")
+    assert consumed == []
+    next(chunks)
+    assert consumed == [1]
+
+
+def test_invalid_format(segments):
+    with pytest.raises(ValueError, match="Invalid subtitle format"):
+        iter_subtitles(segments, "txt")
+    with pytest.raises(ValueError, match="Invalid karaoke effect"):
+        iter_ass(segments, karaoke="wave")
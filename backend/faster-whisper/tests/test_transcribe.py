@@ -139,6 +139,26 @@ def test_vad(jfk_path):
     assert info.vad_options.speech_pad_ms == 200
 
 
+def test_transcribe_time_range(jfk_path):
+    model = WhisperModel("tiny")
+    segments, info = model.transcribe(jfk_path, start_time=4, word_timestamps=True)
+    segments = list(segments)
+
+    assert info.duration == 7
+    assert "your country" in "".join(segment.text for segment in segments)
+    assert 4 <= segments[0].start
+    assert 4 <= segments[0].words[0].start
+    assert segments[-1].end <= 11
+
+    pipeline = BatchedInferencePipeline(model=model)
+    segments, info = pipeline.transcribe(decode_audio(jfk_path), start_time=4)
+    segments = list(segments)
+
+    assert info.duration == 7
+    assert 4 <= segments[0].start
+    assert segments[-1].end <= 11
+
+
 def test_stereo_diarization(data_dir):
     model = WhisperModel("tiny")
 
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import pickle
+
+from transcript_cache import TranscriptCache, transcript_key
+
+
+def result_of(size):
+    return b"x" * size
+
+
+def pickled_size(result):
+    return len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def fill(cache, keys, size=1000):
+    calls = []
+
+    async def main():
+        for key in keys:
+
+            async def compute():
+                calls.append(key)
+                return result_of(size)
+
+            await cache.get_or_compute(key, compute)
+
+    asyncio.run(main())
+    return calls
+
+
+def test_transcript_key():
+    key = transcript_key("digest", {"language": "en", "beam_size": 5})
+
+    assert key == transcript_key("digest", {"beam_size": 5, "language": "en"})
+    assert key != transcript_key("digest", {"beam_size": 5, "language": "fr"})
+    assert key != transcript_key("other", {"beam_size": 5, "language": "en"})
+
+
+def test_transcript_cache_memory_eviction():
+    size = pickled_size(result_of(1000))
+    cache = TranscriptCache(max_memory_bytes=2 * size)
+
+    assert fill(cache, ["a", "b", "a", "c"]) == ["a", "b", "c"]
+
+    # "b" is the least recently used result.
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["memory_bytes"] == 2 * size
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+
+    assert fill(cache, ["a", "c", "b"]) == ["b"]
+    assert cache.stats()["memory_bytes"] == 2 * size
+
+
+def test_transcript_cache_result_over_budget():
+    cache = TranscriptCache(max_memory_bytes=100)
+
+    assert fill(cache, ["a", "a"]) == ["a", "a"]
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["memory_bytes"] == 0
+
+
+def test_transcript_cache_disk_tier(tmp_path):
+    size = pickled_size(result_of(1000))
+    cache = TranscriptCache(max_memory_bytes=size, cache_dir=str(tmp_path))
+
+    assert fill(cache, ["a", "b"]) == ["a", "b"]
+
+    # "a" was evicted from memory and is reloaded from disk, replacing "b".
+    assert fill(cache, ["a", "a"]) == []
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["memory_bytes"] == size
+    assert stats["hits"] == 2
+
+    # A new cache finds the results of the previous one.
+    cache = TranscriptCache(cache_dir=str(tmp_path))
+    assert fill(cache, ["a", "b"]) == []
+
+
+def test_transcript_cache_disk_quota(tmp_path):
+    size = pickled_size(result_of(1000))
+    cache = TranscriptCache(
+        max_memory_bytes=0, cache_dir=str(tmp_path), max_disk_bytes=2 * size
+    )
+
+    fill(cache, ["a", "b"])
+    # "a" is made the least recently used file.
+    os.utime(tmp_path / "a.pkl", (0, 0))
+    fill(cache, ["c"])
+
+    assert sorted(os.listdir(tmp_path)) == ["b.pkl", "c.pkl"]
+    assert fill(cache, ["a"]) == ["a"]
+
+
+def test_transcript_cache_coalesced():
+    cache = TranscriptCache()
+    calls = []
+
+    async def compute():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(
+            cache.get_or_compute("key", compute), cache.get_or_compute("key", compute)
+        )
+
+    assert asyncio.run(main()) == ["result", "result"]
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 1
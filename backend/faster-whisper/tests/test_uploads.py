@@ -0,0 +1,82 @@
+import asyncio
+import os
+import shutil
+
+from faster_whisper import decode_audio
+from render_cache import RenderCache
+from transcript_cache import TranscriptCache
+from uploads import SharedUploads
+
+
+def test_shared_upload_outlives_cancelled_request(jfk_path, tmp_path):
+    shared_uploads = SharedUploads(str(tmp_path / "shared"))
+    cache = TranscriptCache()
+
+    async def request(index):
+        # Like cached_transcribe: every request has its own temporary upload.
+        upload = str(tmp_path / ("upload-%d.flac" % index))
+        shutil.copyfile(jfk_path, upload)
+        try:
+            with shared_uploads.share(upload, "digest") as path:
+
+                async def compute():
+                    await asyncio.sleep(0.1)
+                    return await asyncio.to_thread(decode_audio, path)
+
+                return await cache.get_or_compute("key", compute)
+        finally:
+            os.unlink(upload)
+
+    async def main():
+        first = asyncio.ensure_future(request(0))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(request(1))
+        await asyncio.sleep(0.01)
+
+        # The upload of the request computing the result is removed.
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        assert not os.path.exists(tmp_path / "upload-0.flac")
+
+        return await second
+
+    audio = asyncio.run(main())
+
+    assert audio.shape == decode_audio(jfk_path).shape
+    assert os.listdir(shared_uploads.directory) == []
+
+
+def test_shared_upload_outlives_cancelled_render(jfk_path, tmp_path):
+    shared_uploads = SharedUploads(str(tmp_path / "shared"))
+    cache = RenderCache(str(tmp_path / "renders"))
+
+    async def request(index):
+        # Like render_karaoke: the render reads the input after waiting for a slot.
+        upload = str(tmp_path / ("upload-%d.flac" % index))
+        shutil.copyfile(jfk_path, upload)
+        try:
+            with shared_uploads.share(upload, "digest") as path:
+
+                async def render(output_path):
+                    await asyncio.sleep(0.1)
+                    shutil.copyfile(path, output_path)
+
+                return await cache.get_or_render("0" * 64, render)
+        finally:
+            os.unlink(upload)
+
+    async def main():
+        first = asyncio.ensure_future(request(0))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(request(1))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+
+        return await second
+
+    output_path = asyncio.run(main())
+
+    assert os.path.getsize(output_path) == os.path.getsize(jfk_path)
+    assert os.listdir(shared_uploads.directory) == []
@@ -0,0 +1,205 @@
+"""Content-addressed cache for transcription results.
+
+Results are keyed by a hash of the media bytes plus the transcription options, so the
+same video uploaded to `/transcribe-with-words` and then to `/create-advanced-word-karaoke`
+is only transcribed once. Concurrent requests for the same key share a single
+computation.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from singleflight import SingleFlight
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def file_digest(path: str) -> str:
+    """Returns the SHA-256 of a file, computed in a thread."""
+    return await asyncio.to_thread(_file_digest, path)
+
+
+def audio_digest(audio: np.ndarray) -> str:
+    """Returns the SHA-256 of a decoded waveform without copying it."""
+    return hashlib.sha256(memoryview(np.ascontiguousarray(audio))).hexdigest()
+
+
+def transcript_key(media_digest: str, options: dict) -> str:
+    """Combines the media hash and the transcription options into a cache key."""
+    encoded_options = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(
+        (media_digest + "\n" + encoded_options).encode("utf-8")
+    ).hexdigest()
+
+
+class TranscriptCache:
+    def __init__(
+        self,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        cache_dir: Optional[str] = None,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+    ):
+        """Creates the cache.
+
+        Args:
+          max_memory_bytes: Budget of the in-memory tier, measured on the pickled results.
+          cache_dir: Enables the on-disk tier in this directory.
+          max_disk_bytes: Budget of the on-disk tier.
+
+        Both tiers evict the least recently used results first.
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._inflight = SingleFlight()
+        self._loading = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable]):
+        """Returns the cached result for `key` or awaits `compute()` to produce it.
+
+        Callers asking for a key that is already being computed wait for the same
+        computation instead of starting a new one. Cancelling a caller only cancels the
+        computation if no other caller waits for it.
+        """
+        result = self._get_memory(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        if key in self._inflight:
+            self.coalesced += 1
+        return await self._inflight.run(key, lambda: self._compute(key, compute))
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable]):
+        result = await self._load(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = await compute()
+        await self._store(key, result)
+        return result
+
+    async def lookup(self, key: str):
+        """Returns the cached result for `key` without computing it, or None."""
+        result = self._get_memory(key)
+        if result is None:
+            result = await self._load(key)
+        if result is not None:
+            self.hits += 1
+        return result
+
+    def _get_memory(self, key: str):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        self._memory.move_to_end(key)
+        return entry[0]
+
+    async def _load(self, key: str):
+        if self.cache_dir is None:
+            return None
+        # Concurrent lookups of the same key read and unpickle the file once.
+        return await self._loading.run(key, lambda: self._load_disk(key))
+
+    async def _load_disk(self, key: str):
+        data = await asyncio.to_thread(self._read_disk, key)
+        if data is None:
+            return None
+
+        result = pickle.loads(data)
+        self._remember(key, result, len(data))
+        return result
+
+    async def _store(self, key: str, result):
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, result, len(data))
+
+        if self.cache_dir is not None:
+            await asyncio.to_thread(self._write_disk, key, data)
+
+    def _remember(self, key: str, result, size: int):
+        if size > self.max_memory_bytes:
+            return
+
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous[1]
+        self._memory[key] = (result, size)
+        self._memory_bytes += size
+
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+
+        # The modification time orders the on-disk LRU.
+        os.utime(path)
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, self._disk_path(key))
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,169 @@
+"""Moves uploaded media to disk or to the decoder in bounded chunks.
+
+`await file.read()` loads the whole upload in memory, which costs the size of the video
+per in-flight request. The helpers below never hold more than a few chunks at a time.
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import queue
+import shutil
+import tempfile
+
+from typing import AsyncIterable, Dict, Iterator, Optional
+
+import numpy as np
+
+from fastapi import UploadFile
+
+from faster_whisper import decode_audio
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def save_upload(
+    upload: UploadFile,
+    suffix: str = "",
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> str:
+    """Copies an upload to a new temporary file and returns its path."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        await upload.seek(0)
+        await asyncio.to_thread(shutil.copyfileobj, upload.file, tmp, chunk_size)
+    return tmp.name
+
+
+class SharedUploads:
+    """Links to the uploads, named by their content hash and shared by their requests.
+
+    A computation shared by the requests on the same content (see `SingleFlight`) must
+    not read the temporary upload of one of them, which is removed when that request
+    ends, even if the others still wait for the result. It reads the shared link, which
+    is removed when the last request using it ends.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        # The links are created next to the temporary uploads, on the same filesystem.
+        self.directory = directory or tempfile.mkdtemp(prefix="shared-uploads-")
+        os.makedirs(self.directory, exist_ok=True)
+        self._users: Dict[str, int] = {}
+
+    @contextlib.contextmanager
+    def share(self, path: str, digest: str) -> Iterator[str]:
+        """Yields the shared path of the upload `path`, whose SHA-256 is `digest`."""
+        shared_path = os.path.join(self.directory, digest + os.path.splitext(path)[1])
+        if shared_path not in self._users:
+            try:
+                os.link(path, shared_path)
+            except OSError:
+                # E.g. a filesystem without hard links.
+                shutil.copyfile(path, shared_path)
+            self._users[shared_path] = 0
+
+        self._users[shared_path] += 1
+        try:
+            yield shared_path
+        finally:
+            self._users[shared_path] -= 1
+            if not self._users[shared_path]:
+                del self._users[shared_path]
+                os.unlink(shared_path)
+
+
+class BodyStream(io.RawIOBase):
+    """Read-only file-like object fed with chunks from the event loop.
+
+    The decoder reads it from a worker thread while the request body is still being
+    received. The queue is bounded so a slow decoder applies backpressure to the upload
+    instead of buffering it. Every chunk is also written to `spool_path` so the media can
+    be decoded again if the container cannot be read sequentially (e.g. MP4 files with
+    the moov atom at the end).
+    """
+
+    def __init__(self, max_chunks: int = 16, suffix: str = ""):
+        self._chunks = queue.Queue(max_chunks)
+        self._pending = b""
+        self._eof = False
+        self._spool = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        self.spool_path = self._spool.name
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._eof:
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._pending = chunk
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    async def feed(self, chunks: AsyncIterable[bytes]):
+        """Pushes the chunks to the reader, then signals the end of the stream."""
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                self._spool.write(chunk)
+                await self._put(chunk)
+        finally:
+            self._spool.close()
+            await self._put(None)
+
+    async def _put(self, item):
+        try:
+            self._chunks.put_nowait(item)
+        except queue.Full:
+            await asyncio.to_thread(self._chunks.put, item)
+
+    def drain(self):
+        """Consumes the remaining chunks so the feeder is never blocked forever."""
+        while not self._eof:
+            self._eof = self._chunks.get() is None
+
+    def remove_spool(self):
+        if os.path.exists(self.spool_path):
+            os.unlink(self.spool_path)
+
+
+def _decode_body_stream(stream: BodyStream, sampling_rate: int) -> np.ndarray:
+    try:
+        audio = decode_audio(stream, sampling_rate=sampling_rate)
+    except Exception:
+        audio = None
+    finally:
+        stream.drain()
+
+    if audio is None or audio.size == 0:
+        # The container was not streamable, decode the complete spooled copy instead.
+        audio = decode_audio(stream.spool_path, sampling_rate=sampling_rate)
+
+    return audio
+
+
+async def decode_stream(
+    chunks: AsyncIterable[bytes],
+    sampling_rate: int = 16000,
+    suffix: str = "",
+) -> np.ndarray:
+    """Decodes the audio of a media stream while it is being received."""
+    stream = BodyStream(suffix=suffix)
+    try:
+        decoding = asyncio.create_task(
+            asyncio.to_thread(_decode_body_stream, stream, sampling_rate)
+        )
+        try:
+            await stream.feed(chunks)
+        except BaseException:
+            await asyncio.wait([decoding])
+            raise
+        return await decoding
+    finally:
+        stream.remove_spool()
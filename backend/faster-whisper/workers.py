@@ -0,0 +1,361 @@
+"""Execution layer for the blocking work done by the API.
+
+Transcription is CPU bound and must never run on the uvicorn event loop. The
+`TranscriptionPool` owns the Whisper models and runs jobs in a thread or process pool;
+request handlers only await the result, so `/health` and other uploads keep being served
+while a long video is transcribed.
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import tempfile
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+from batching import BatchScheduler, ScheduledPipeline
+from faster_whisper import decode_audio
+from faster_whisper.audio import cached_audio
+from jobs import mark_running
+from model_registry import ModelRegistry
+
+SAMPLING_RATE = 16000
+
+# Models owned by the current worker. In thread mode the registry is shared by all the
+# threads of the pool, in process mode every worker process has its own registry.
+_worker_registry = None
+_default_model = None
+
+# Set when the windows of concurrent transcriptions are batched together.
+_batch_scheduler = None
+
+# Set when the audio decoded from media paths is cached on disk.
+_audio_cache_dir = None
+_audio_cache_bytes = None
+
+
+def _init_worker(
+    default_model: str,
+    max_model_bytes: int,
+    model_kwargs: dict,
+    batching: Optional[dict] = None,
+    audio_cache_dir: Optional[str] = None,
+    audio_cache_bytes: Optional[int] = None,
+):
+    global _worker_registry, _default_model, _batch_scheduler
+    global _audio_cache_dir, _audio_cache_bytes
+    _worker_registry = ModelRegistry(max_model_bytes, **model_kwargs)
+    _default_model = default_model
+    _audio_cache_dir = audio_cache_dir
+    _audio_cache_bytes = audio_cache_bytes
+    if batching is not None:
+        _batch_scheduler = BatchScheduler(**batching)
+
+    # Only the default model is loaded upfront, the others on first use.
+    with _worker_registry.use(default_model):
+        pass
+
+
+def worker_model(model_name: Optional[str] = None):
+    """Context manager yielding a model of the calling worker, the default one if None."""
+    if _worker_registry is None:
+        raise RuntimeError("worker_model() must be called from a pool worker")
+    return _worker_registry.use(model_name or _default_model)
+
+
+def get_worker_registry() -> Optional[ModelRegistry]:
+    return _worker_registry
+
+
+def _transcribe(model, audio, options: dict):
+    # The hash of the media, when the caller computed it, names its cached audio.
+    media_digest = options.pop("media_digest", None)
+    time_range = (
+        options.get("start_time") is not None or options.get("end_time") is not None
+    )
+    if isinstance(audio, str) and _audio_cache_dir is not None and not time_range:
+        audio = decode_audio(
+            audio,
+            sampling_rate=SAMPLING_RATE,
+            cache_dir=_audio_cache_dir,
+            cache_key=media_digest,
+            max_cache_bytes=_audio_cache_bytes,
+        )
+    elif isinstance(audio, str) and _audio_cache_dir is not None and media_digest:
+        # A time range is sliced from the audio of the whole file if it is cached.
+        # Otherwise the model only decodes the range, and nothing is cached.
+        cached = cached_audio(_audio_cache_dir, media_digest, SAMPLING_RATE)
+        if cached is not None:
+            audio = cached
+
+    if _batch_scheduler is None:
+        return model.transcribe(audio, **options)
+
+    # A request contributes at most one batch of windows at a time, so the remaining
+    # room is filled by the windows of the other requests.
+    pipeline = ScheduledPipeline(model, _batch_scheduler)
+    options.setdefault("batch_size", _batch_scheduler.max_batch_size)
+    return pipeline.transcribe(audio, **options)
+
+
+def transcribe_file(audio, model_name: Optional[str] = None, **options):
+    """Transcribes in a worker and consumes the lazy segment generator there.
+
+    Segments and info are plain dataclasses so the result can be sent back from a worker
+    process.
+    """
+    with worker_model(model_name) as model:
+        segments, info = _transcribe(model, audio, options)
+        return list(segments), info
+
+
+def iter_transcription(audio, model_name: Optional[str] = None, **options):
+    """Streaming variant of `transcribe_file`: yields the info, then each segment."""
+    with worker_model(model_name) as model:
+        segments, info = _transcribe(model, audio, options)
+        yield info
+        yield from segments
+
+
+def load_media_audio(media_path: str, audio_path: str) -> np.ndarray:
+    """Returns the audio of a stored media file, decoding it only the first time.
+
+    The decoded waveform is saved to `audio_path` and memory-mapped by the next calls.
+    """
+    if os.path.exists(audio_path):
+        return np.load(audio_path, mmap_mode="r")
+
+    audio = decode_audio(media_path, sampling_rate=SAMPLING_RATE)
+    # Every job decoding the same media writes its own file, in thread or process mode.
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp.npy", dir=os.path.dirname(audio_path))
+    try:
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, audio)
+        os.replace(tmp_path, audio_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return audio
+
+
+def transcribe_media(media_path: str, audio_path: str, **options):
+    return transcribe_file(load_media_audio(media_path, audio_path), **options)
+
+
+def iter_media_transcription(media_path: str, audio_path: str, **options):
+    yield from iter_transcription(load_media_audio(media_path, audio_path), **options)
+
+
+def _produce(items, cancelled, fn, args, kwargs):
+    # Runs in the worker: forwards the items of the generator until it is exhausted or
+    # the consumer went away. None marks the end of the stream.
+    try:
+        for item in fn(*args, **kwargs):
+            if cancelled.is_set():
+                break
+            items.put(item)
+    finally:
+        items.put(None)
+
+
+class _LoopQueue:
+    # Queue filled by the worker threads and read on the event loop, so that waiting for
+    # the items does not hold a thread.
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def put(self, item):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class TranscriptionPool:
+    def __init__(
+        self,
+        default_model: str,
+        kind: str = "thread",
+        max_workers: int = 1,
+        max_model_bytes: int = 2 << 30,
+        max_batch_size: int = 0,
+        max_batch_wait: float = 0.05,
+        audio_cache_dir: Optional[str] = None,
+        audio_cache_bytes: Optional[int] = None,
+        **model_kwargs,
+    ):
+        """Creates the pool and loads its default model.
+
+        Args:
+          default_model: Model used when a request does not select one.
+          kind: "thread" shares the models between `max_workers` threads (CTranslate2
+            releases the GIL and `num_workers` lets the calls run in parallel), "process"
+            loads the models in every worker process.
+          max_workers: Number of jobs running at the same time. Additional jobs wait in
+            the queue.
+          max_model_bytes: Memory budget of the resident models of a worker, see
+            `ModelRegistry`.
+          max_batch_size: Enables batched inference, pooling up to this number of 30-second
+            windows from the concurrent jobs of a thread pool, see `BatchScheduler`.
+          max_batch_wait: Seconds a job waits for other jobs to fill a batch.
+          audio_cache_dir: Caches the audio decoded from media paths in this directory,
+            so transcribing the same media again skips decoding and the worker processes
+            share the memory-mapped waveform. The functions run by the pool accept a
+            `media_digest` option, the SHA-256 of the media, to skip hashing it again.
+          audio_cache_bytes: Size of `audio_cache_dir` above which the least recently
+            used waveforms are removed.
+          model_kwargs: Additional arguments passed to `WhisperModel`.
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(
+                "Invalid pool kind '%s', expected thread or process" % kind
+            )
+
+        self.kind = kind
+        self.max_workers = max_workers
+        self._slots = asyncio.Semaphore(max_workers)
+        self._queued = 0
+        self._busy = 0
+        self._completed = 0
+        self._failed = 0
+        self._manager = None
+
+        batching = None
+        if max_batch_size > 0:
+            batching = {"max_batch_size": max_batch_size, "max_wait": max_batch_wait}
+
+        if kind == "thread":
+            model_kwargs.setdefault("num_workers", max_workers)
+            _init_worker(
+                default_model,
+                max_model_bytes,
+                model_kwargs,
+                batching,
+                audio_cache_dir,
+                audio_cache_bytes,
+            )
+            self._executor = ThreadPoolExecutor(
+                max_workers, thread_name_prefix="whisper"
+            )
+        else:
+            self._executor = ProcessPoolExecutor(
+                max_workers,
+                initializer=_init_worker,
+                initargs=(
+                    default_model,
+                    max_model_bytes,
+                    model_kwargs,
+                    batching,
+                    audio_cache_dir,
+                    audio_cache_bytes,
+                ),
+            )
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs `fn(*args, **kwargs)` in a worker and waits for its result.
+
+        `fn` must be a module-level function when the pool uses processes. It can get the
+        worker models with `worker_model()`.
+        """
+        return await self._run(fn, args, kwargs)
+
+    async def _run(self, fn, args, kwargs, started: Optional[asyncio.Event] = None):
+        loop = asyncio.get_running_loop()
+
+        self._queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+
+        mark_running()
+        if started is not None:
+            started.set()
+
+        self._busy += 1
+        try:
+            result = await loop.run_in_executor(
+                self._executor, functools.partial(fn, *args, **kwargs)
+            )
+        except BaseException:
+            self._failed += 1
+            raise
+        else:
+            self._completed += 1
+            return result
+        finally:
+            self._busy -= 1
+            self._slots.release()
+
+    async def stream(self, fn, *args, **kwargs):
+        """Runs the generator function `fn` in a worker and yields its items as they come.
+
+        The worker slot is held until the generator is exhausted. If the consumer stops
+        early, the worker stops after the item it is producing.
+        """
+        started = asyncio.Event()
+        if self.kind == "thread":
+            items, cancelled = _LoopQueue(asyncio.get_running_loop()), threading.Event()
+            get_item = items.get
+        else:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            items, cancelled = self._manager.Queue(), self._manager.Event()
+
+            async def get_item():
+                # The items come from another process. A thread waits for them, but only
+                # once the job has a worker, so queued streams do not hold threads.
+                await started.wait()
+                return await asyncio.to_thread(items.get)
+
+        def end_stream(future):
+            # Unblocks the consumer if the job failed before reaching the worker.
+            started.set()
+            items.put(None)
+            if not future.cancelled():
+                future.exception()
+
+        producer = asyncio.ensure_future(
+            self._run(_produce, (items, cancelled, fn, args, kwargs), {}, started)
+        )
+        producer.add_done_callback(end_stream)
+        try:
+            while True:
+                item = await get_item()
+                if item is None:
+                    break
+                yield item
+            await producer
+        finally:
+            cancelled.set()
+
+    async def transcribe(self, audio, **options):
+        """Transcribes `audio` in a worker and returns the list of segments and the info."""
+        return await self.run(transcribe_file, audio, **options)
+
+    def stats(self) -> dict:
+        stats = {
+            "kind": self.kind,
+            "workers": self.max_workers,
+            "busy_workers": self._busy,
+            "queue_depth": self._queued,
+            "completed": self._completed,
+            "failed": self._failed,
+        }
+        if self.kind == "thread":
+            # Worker processes have their own registries, not visible from here.
+            stats["models"] = _worker_registry.stats()
+            if _batch_scheduler is not None:
+                stats["batching"] = _batch_scheduler.stats()
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        if self._manager is not None:
+            self._manager.shutdown()